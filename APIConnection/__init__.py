@@ -0,0 +1,29 @@
+import importlib
+
+# Connectors exported by the package, imported with their SDK on first access
+# so that `import APIConnection` stays cheap
+_CONNECTORS = {
+    "DV360": "APIConnection.dv360",
+    "FBConnection": "APIConnection.facebook_connection",
+    "GoogleAds": "APIConnection.google_ads_api",
+    "GoogleAnalyst": "APIConnection.google_analytics",
+    "GoogleCampaignManager": "APIConnection.google_campaign_manager",
+    "GoogleTrends": "APIConnection.google_trends",
+    "Linkedin": "APIConnection.linkedin.ln_main",
+    "TTDConnection": "APIConnection.tradedesk",
+    "TwitterConnection": "APIConnection.twitter",
+}
+
+__all__ = sorted(_CONNECTORS)
+
+
+def __getattr__(name):
+    if name in _CONNECTORS:
+        connector = getattr(importlib.import_module(_CONNECTORS[name]), name)
+        globals()[name] = connector
+        return connector
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,18 +1,122 @@
 import asyncio
+import inspect
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
 
 import pandas as pd
 from pandas import DataFrame
 
+from APIConnection.dtypes import compact_dtypes, concat_frames
+from APIConnection.exceptions import MissingArgumentException
+from APIConnection.fact_schema import concat_facts, to_facts
+from APIConnection.job_poller import JobPoller
+from APIConnection.journal import RunJournal
 from APIConnection.logger import logger
-from APIConnection.utils import heartbeat, timeit
+from APIConnection.metrics import ACCOUNT_SECONDS, ACCOUNTS_FAILED, ROWS_PARSED
+from APIConnection.report_cache import ReportCache
+from APIConnection.scheduler import AccountScheduler
+from APIConnection.settings import (
+    COMPACT_DTYPES,
+    INCREMENTAL_LOOKBACK_DAYS,
+    SHARD_CONCURRENCY,
+)
+from APIConnection.sinks import BaseSink
+from APIConnection.tracing import in_context, tracer
+from APIConnection.transform import TransformStage
+from APIConnection.utils import (
+    Monitor,
+    get_days_in_range,
+    group_consecutive_days,
+    split_date_range,
+    timeit,
+)
+from APIConnection.watermark import WatermarkStore
 
 
 class BaseConnection(ABC):
+    # Name of the provider, used to key cached and stored reports
+    provider: Optional[str] = None
+    # Column holding the 'YYYY-MM-DD' day of every report row, None if the
+    # reports can not be split by day
+    date_column: Optional[str] = None
+
+    # Fan-out settings, overridden per instance through the constructor
+    max_concurrency: Optional[int] = None
+    priority_key: Optional[Callable[[str], Any]] = None
+    thread_pool_size: Optional[int] = None
+    transform_processes: int = 0
+    report_cache: Optional[ReportCache] = None
+    watermarks: Optional[WatermarkStore] = None
+    lookback_days: int = INCREMENTAL_LOOKBACK_DAYS
+    shard_by: Optional[Union[str, int]] = None
+    shard_concurrency: int = SHARD_CONCURRENCY
+    compact_dtypes: bool = COMPACT_DTYPES
+    journal: Optional[RunJournal] = None
+    _executor: Optional[ThreadPoolExecutor] = None
+    _transform_stage: Optional[TransformStage] = None
+    _job_poller: Optional[JobPoller] = None
+
     @abstractmethod
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        priority_key: Optional[Callable[[str], Any]] = None,
+        thread_pool_size: Optional[int] = None,
+        transform_processes: int = 0,
+        report_cache: Optional[ReportCache] = None,
+        watermarks: Optional[WatermarkStore] = None,
+        lookback_days: int = INCREMENTAL_LOOKBACK_DAYS,
+        shard_by: Optional[Union[str, int]] = None,
+        shard_concurrency: int = SHARD_CONCURRENCY,
+        compact_dtypes: bool = COMPACT_DTYPES,
+        journal: Optional[RunJournal] = None,
+    ):
+        """
+        Args:
+            max_concurrency (int): maximum number of sub accounts fetched at
+                the same time, None means no limit
+            priority_key (callable): maps an account ID to a sortable value,
+                accounts with the lowest value are fetched first
+            thread_pool_size (int): number of threads used to run a blocking
+                `get_report_df_for_account`, defaults to `max_concurrency`
+            transform_processes (int): number of processes used to turn raw
+                payloads into frames, 0 parses in the calling thread
+            report_cache (ReportCache): per-day cache of the reports, only
+                used by connectors defining `date_column`
+            watermarks (WatermarkStore): last synced day of every account,
+                required by the incremental mode
+            lookback_days (int): number of days before the watermark fetched
+                again in incremental mode, to pick up late attributed data
+            shard_by (str or int): split the range of every account into
+                "week" or "month" chunks, or chunks of a number of days,
+                fetched concurrently. Only used by connectors defining
+                `date_column`
+            shard_concurrency (int): number of chunks of the same account
+                fetched at the same time
+            compact_dtypes (bool): convert the report of every account to
+                numeric, categorical and datetime64 columns, see
+                `APIConnection.dtypes.compact_dtypes`. Off unless
+                `settings.COMPACT_DTYPES` is on
+            journal (RunJournal): log of the accounts already saved, the
+                `save_*` methods skip them and log the ones they save, so an
+                interrupted run resumes where it stopped
+        """
+        self.max_concurrency = max_concurrency
+        self.priority_key = priority_key
+        self.thread_pool_size = thread_pool_size
+        self.transform_processes = transform_processes
+        self.report_cache = report_cache
+        self.watermarks = watermarks
+        self.lookback_days = lookback_days
+        self.shard_by = shard_by
+        self.shard_concurrency = shard_concurrency
+        self.compact_dtypes = compact_dtypes
+        self.journal = journal
+        self._executor = None
+        self._transform_stage = None
+        self._job_poller = None
 
     @abstractmethod
     def get_sub_accounts(self) -> List[Dict]:
@@ -29,39 +133,582 @@ class BaseConnection(ABC):
     ) -> DataFrame:
         pass
 
-    async def get_sub_accounts_report_df(
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Return the thread pool running blocking report calls, create it
+        on first use"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.thread_pool_size or self.max_concurrency,
+                thread_name_prefix=type(self).__name__,
+            )
+        return self._executor
+
+    def shutdown_executor(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        if self._transform_stage is not None:
+            self._transform_stage.shutdown(wait=wait)
+            self._transform_stage = None
+
+    @property
+    def transform_stage(self) -> TransformStage:
+        """Stage used by connectors to parse raw payloads into frames"""
+        if self._transform_stage is None:
+            self._transform_stage = TransformStage(self.transform_processes)
+        return self._transform_stage
+
+    @property
+    def job_poller(self) -> JobPoller:
+        """Poller shared by the report jobs of all the accounts, checks run on
+        the connection thread pool"""
+        if self._job_poller is None:
+            self._job_poller = JobPoller(
+                executor=self.get_executor(), name=self.provider
+            )
+        return self._job_poller
+
+    async def fetch_report_df_for_account(
+        self, account: str, start_date: str, end_date: str, dimensions: List[str]
+    ) -> DataFrame:
+        """Await `get_report_df_for_account` whether or not it is a coroutine
+
+        Connectors implementing it as a plain blocking method are run on the
+        connection thread pool so that several accounts progress in parallel
+        instead of blocking the event loop one after the other.
+        """
+        with tracer.span("fetch", start_date=start_date, end_date=end_date):
+            if inspect.iscoroutinefunction(self.get_report_df_for_account):
+                return await self.get_report_df_for_account(
+                    account, start_date, end_date, dimensions
+                )
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.get_executor(),
+                in_context(
+                    self.get_report_df_for_account,
+                    account,
+                    start_date,
+                    end_date,
+                    dimensions,
+                ),
+            )
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+    async def get_report_df_for_account_cached(
+        self, account: str, start_date: str, end_date: str, dimensions: List[str]
+    ) -> DataFrame:
+        """Fetch the report of an account, going to the API only for the days
+        missing from `report_cache`
+
+        Without a cache, or for connectors whose reports can not be split by
+        day, this is the same as `fetch_report_df_for_account`.
+        """
+        if self.report_cache is None or self.date_column is None:
+            return await self.fetch_report_df_for_account(
+                account, start_date, end_date, dimensions
+            )
+
+        loop = asyncio.get_running_loop()
+        provider = self.provider or type(self).__name__
+        dims_hash = ReportCache.dimensions_hash(dimensions)
+        days = get_days_in_range(start_date, end_date)
+
+        def load_cached_days():
+            return {
+                day: self.report_cache.get(provider, account, day, dims_hash)
+                for day in days
+            }
+
+        with tracer.span("cache_read", days=len(days)):
+            frames = await loop.run_in_executor(self.get_executor(), load_cached_days)
+        missing = [day for day in days if frames[day] is None]
+        if missing:
+            logger.debug(
+                f"{account}: {len(days) - len(missing)} days cached, "
+                f"{len(missing)} days to fetch"
+            )
+        for start, end in group_consecutive_days(missing):
+            df = await self.fetch_report_df_for_account(
+                account, start, end, list(dimensions) if dimensions else dimensions
+            )
+            if df is None or df.empty:
+                # An empty range may be a failure the provider did not
+                # report, so it is not cached
+                for day in get_days_in_range(start, end):
+                    frames[day] = pd.DataFrame()
+                continue
+            row_days = df[self.date_column].astype(str).str[:10]
+            fetched = {
+                day: df[row_days == day] for day in get_days_in_range(start, end)
+            }
+            frames.update(fetched)
+
+            def store_days():
+                for day, day_df in fetched.items():
+                    self.report_cache.put(provider, account, day, dims_hash, day_df)
+
+            with tracer.span("cache_write", days=len(fetched)):
+                await loop.run_in_executor(self.get_executor(), store_days)
+        with tracer.span("cache_write"):
+            await loop.run_in_executor(self.get_executor(), self.report_cache.flush)
+
+        dfs = [frames[day] for day in days if not frames[day].empty]
+        if not dfs:
+            return pd.DataFrame()
+        return pd.concat(dfs, ignore_index=True)
+
+    async def get_report_df_for_account_sharded(
+        self, account: str, start_date: str, end_date: str, dimensions: List[str]
+    ) -> DataFrame:
+        """Fetch the report of an account as concurrent date-range chunks
+
+        Smaller provider jobs finish faster. The chunks do not overlap and are
+        stitched back in date order. A chunk that fails fails the account.
+        """
+        df, _ = await self._get_report_df_for_account_sharded(
+            account, start_date, end_date, dimensions
+        )
+        return df
+
+    async def _get_report_df_for_account_sharded(
+        self, account: str, start_date: str, end_date: str, dimensions: List[str]
+    ) -> Tuple[DataFrame, bool]:
+        """`get_report_df_for_account_sharded`, with whether every chunk
+        returned rows
+
+        An empty chunk next to chunks with rows may be a range the provider
+        silently failed to report, so the account is not complete: it is
+        neither saved, journaled nor moved past its watermark, and the next
+        run fetches it again.
+        """
+        if self.shard_by is None or self.date_column is None:
+            chunks = [(start_date, end_date)]
+        else:
+            chunks = split_date_range(start_date, end_date, self.shard_by)
+        if len(chunks) == 1:
+            df = await self.get_report_df_for_account_cached(
+                account, start_date, end_date, dimensions
+            )
+            return df, True
+
+        logger.debug(f"{account}: fetch {len(chunks)} chunks by {self.shard_by}")
+        semaphore = asyncio.Semaphore(self.shard_concurrency)
+
+        async def fetch_chunk(chunk_start, chunk_end):
+            async with semaphore:
+                with tracer.span(
+                    "chunk", "chunk", start_date=chunk_start, end_date=chunk_end
+                ):
+                    return await self.get_report_df_for_account_cached(
+                        account,
+                        chunk_start,
+                        chunk_end,
+                        list(dimensions) if dimensions else dimensions,
+                    )
+
+        results = await asyncio.gather(
+            *[fetch_chunk(s, e) for s, e in chunks], return_exceptions=True
+        )
+        errors = [
+            (chunk, res)
+            for chunk, res in zip(chunks, results)
+            if isinstance(res, BaseException)
+        ]
+        for (chunk_start, chunk_end), error in errors:
+            logger.error(
+                f"{account}: chunk {chunk_start} - {chunk_end} failed. {error}"
+            )
+        if errors:
+            raise errors[0][1]
+
+        dfs = [df for df in results if df is not None and not df.empty]
+        if not dfs:
+            return pd.DataFrame(), True
+        if len(dfs) < len(chunks):
+            empty = [
+                f"{chunk_start} - {chunk_end}"
+                for (chunk_start, chunk_end), df in zip(chunks, results)
+                if df is None or df.empty
+            ]
+            logger.warning(
+                f"{account}: no rows for chunks {', '.join(empty)}, the account "
+                "will be fetched again"
+            )
+        return pd.concat(dfs, ignore_index=True), len(dfs) == len(chunks)
+
+    def get_incremental_date_ranges(
+        self, sub_accounts: List[str], start_date: str, end_date: str
+    ) -> Dict[str, Tuple[str, str]]:
+        """Return the range left to fetch for every account in incremental
+        mode
+
+        An account is fetched from `lookback_days` days before its watermark,
+        or from `start_date` if it has never been synced. Accounts already
+        synced up to `end_date` past the lookback window are left out.
+        """
+        if self.watermarks is None:
+            raise MissingArgumentException("Incremental mode requires watermarks")
+        provider = self.provider or type(self).__name__
+        ranges = {}
+        for account in sub_accounts:
+            account_start = start_date
+            watermark = self.watermarks.get(provider, account)
+            if watermark is not None:
+                resume = datetime.strptime(watermark, "%Y-%m-%d") + timedelta(
+                    days=1 - self.lookback_days
+                )
+                account_start = max(start_date, resume.strftime("%Y-%m-%d"))
+            if account_start > end_date:
+                logger.debug(f"{account} is up to date, watermark {watermark}")
+                continue
+            ranges[account] = (account_start, end_date)
+        return ranges
+
+    def pending_accounts(
+        self,
+        sub_accounts: List[str],
+        start_date: str,
+        end_date: str,
+        account_date_ranges: Optional[Dict[str, Tuple[str, str]]] = None,
+    ) -> List[str]:
+        """Return the accounts whose range is not done in the journal yet,
+        all of them without a journal"""
+        if self.journal is None:
+            return list(sub_accounts)
+        provider = self.provider or type(self).__name__
+        account_date_ranges = account_date_ranges or {}
+        pending = [
+            account
+            for account in sub_accounts
+            if not self.journal.is_done(
+                provider,
+                account,
+                *account_date_ranges.get(account, (start_date, end_date)),
+            )
+        ]
+        if len(pending) < len(sub_accounts):
+            logger.info(
+                f"{provider}: {len(sub_accounts) - len(pending)} of "
+                f"{len(sub_accounts)} accounts already done, skip them"
+            )
+        return pending
+
+    async def iter_sub_accounts_report(
         self,
         sub_accounts: List[str],
         start_date,
         end_date,
         dimensions,
         account_dimensions: Optional[Dict] = {},
-    ) -> DataFrame:
-        final_df = pd.DataFrame()
-        tasks = []
-        hbt = asyncio.create_task(heartbeat())
-        for account in sub_accounts:
+        account_date_ranges: Optional[Dict[str, Tuple[str, str]]] = None,
+        incremental: bool = False,
+    ) -> AsyncIterator[Tuple[str, DataFrame]]:
+        """Yield the report of every sub account as soon as it is fetched
+
+        Accounts are yielded in completion order, not in the order of
+        `sub_accounts`, so the first rows are available before the slowest
+        account has finished. At most `max_concurrency` accounts are fetched
+        at the same time, in `priority_key` order.
+
+        An account whose fetch raises is logged and yielded with an empty
+        frame, the other accounts carry on. Its watermark does not move, nor
+        does the watermark of an account with a date-range chunk missing,
+        see `_get_report_df_for_account_sharded`.
+
+        Args:
+            sub_accounts (list(str)): account IDs
+            start_date (str): string format of 'YYYY-MM-DD'
+            end_date (str): string format of 'YYYY-MM-DD'
+            dimensions (list(str)): fields list
+            account_dimensions (dict): per-account fields list overriding
+                `dimensions`
+            account_date_ranges (dict): per-account (start_date, end_date)
+                overriding the common range
+            incremental (bool): only fetch the days after the watermark of
+                every account, minus the lookback window. The watermark of
+                an account is moved to its end date once the caller is done
+                with its frame, i.e. asks for the next one
+
+        Yields:
+            (account, DataFrame) with normalized column names, and compact
+            dtypes unless `compact_dtypes` is off
+        """
+        async for account, df, _ in self._iter_sub_accounts_report(
+            sub_accounts,
+            start_date,
+            end_date,
+            dimensions,
+            account_dimensions,
+            account_date_ranges=account_date_ranges,
+            incremental=incremental,
+        ):
+            yield account, df
+
+    async def _iter_sub_accounts_report(
+        self,
+        sub_accounts: List[str],
+        start_date,
+        end_date,
+        dimensions,
+        account_dimensions: Optional[Dict] = {},
+        account_date_ranges: Optional[Dict[str, Tuple[str, str]]] = None,
+        incremental: bool = False,
+    ) -> AsyncIterator[Tuple[str, DataFrame, bool]]:
+        """`iter_sub_accounts_report` yielding (account, DataFrame, complete)
+
+        `complete` is False for the accounts that failed or miss a chunk of
+        their range; they must not be journaled as done.
+        """
+        scheduler = AccountScheduler(self.max_concurrency, self.priority_key)
+        if incremental:
+            if account_date_ranges is None:
+                account_date_ranges = self.get_incremental_date_ranges(
+                    sub_accounts, start_date, end_date
+                )
+            sub_accounts = [acc for acc in sub_accounts if acc in account_date_ranges]
+        account_date_ranges = account_date_ranges or {}
+
+        provider = self.provider or type(self).__name__
+
+        async def job(account):
             logger.debug(f"Process {account}")
             filtered_dimensions = (
                 account_dimensions[account]
                 if account in account_dimensions
                 else dimensions
             )
-            t = asyncio.create_task(
-                self.get_report_df_for_account(
-                    account, start_date, end_date, filtered_dimensions
-                )
+            account_start, account_end = account_date_ranges.get(
+                account, (start_date, end_date)
             )
-            tasks.append(t)
-        dfs = await asyncio.gather(*tasks)
-        for task in tasks:
-            task.cancel()
-        hbt.cancel()
-        for df in dfs:
+            with tracer.span("account", "account", parent=run, account=account):
+                with ACCOUNT_SECONDS.time(provider=provider, account=account):
+                    df, complete = await self._get_report_df_for_account_sharded(
+                        account, account_start, account_end, filtered_dimensions
+                    )
+                if self.compact_dtypes and df is not None and not df.empty:
+                    df = await self.transform_stage.run_async(
+                        compact_dtypes, df, self.date_column
+                    )
+                return df, complete
+
+        # Not the current span: the body of the generator is suspended at
+        # every yield and resumed by the caller
+        run = tracer.start(
+            "run",
+            "run",
+            provider=provider,
+            accounts=len(sub_accounts),
+            start_date=start_date,
+            end_date=end_date,
+        )
+        monitor = Monitor()
+        probe = asyncio.create_task(monitor.monitor_loop())
+        failed = []
+        try:
+            async for account, result, error in scheduler.run(list(sub_accounts), job):
+                df, complete = result if error is None else (None, False)
+                if error is not None:
+                    logger.error(f"Can not get data for account {account}. {error!r}")
+                    ACCOUNTS_FAILED.inc(provider=provider)
+                    failed.append(account)
+                if df is None:
+                    df = pd.DataFrame()
+                ROWS_PARSED.inc(len(df), provider=provider, account=account)
+                yield account, self.normalize_columns(df), complete
+                # The watermark only moves on data, an empty report may be a
+                # failure the provider did not report
+                if incremental and complete and not df.empty:
+                    self.watermarks.set(
+                        provider,
+                        account,
+                        account_date_ranges[account][1],
+                    )
+        finally:
+            if failed:
+                logger.error(
+                    f"{provider}: {len(failed)} of {len(sub_accounts)} accounts "
+                    f"failed: {', '.join(map(str, failed))}"
+                )
+            probe.cancel()
+            monitor.log_report()
+            tracer.finish(run)
+
+    async def get_sub_accounts_report_df(
+        self,
+        sub_accounts: List[str],
+        start_date,
+        end_date,
+        dimensions,
+        account_dimensions: Optional[Dict] = {},
+        incremental: bool = False,
+    ) -> DataFrame:
+        dfs = {}
+        async for account, df in self.iter_sub_accounts_report(
+            sub_accounts,
+            start_date,
+            end_date,
+            dimensions,
+            account_dimensions,
+            incremental=incremental,
+        ):
+            if not df.empty:
+                dfs[account] = df
+        if not dfs:
+            return pd.DataFrame()
+        # Keep the order of `sub_accounts` so the result does not depend on
+        # which account happened to finish first
+        return concat_frames([dfs[acc] for acc in sub_accounts if acc in dfs])
+
+    async def get_sub_accounts_facts(
+        self,
+        sub_accounts: List[str],
+        start_date,
+        end_date,
+        dimensions,
+        account_dimensions: Optional[Dict] = {},
+        incremental: bool = False,
+    ) -> DataFrame:
+        """Return the report of the sub accounts in the canonical fact schema
+        of `APIConnection.fact_schema`, ready to be stacked with the facts of
+        other providers
+
+        The report of every account is mapped as soon as it is fetched, so
+        only the facts are held in memory.
+        """
+        provider = self.provider or type(self).__name__
+        facts = []
+        async for account, df in self.iter_sub_accounts_report(
+            sub_accounts,
+            start_date,
+            end_date,
+            dimensions,
+            account_dimensions,
+            incremental=incremental,
+        ):
             if not df.empty:
-                final_df = pd.concat([final_df, df])
-        final_df.columns = [col.lower().replace(" ", "_") for col in final_df.columns]
-        return final_df
+                facts.append(to_facts(df, provider, account))
+        return concat_facts(facts)
+
+    async def save_sub_accounts_report_to_excel(
+        self,
+        sub_accounts: List[str],
+        start_date,
+        end_date,
+        dimensions,
+        path: str = "./",
+        account_dimensions: Optional[Dict] = {},
+        incremental: bool = False,
+    ) -> None:
+        """Save the report of every sub account to `{path}/{account}.xls`
+
+        Each file is written as soon as its account is fetched. In incremental
+        mode only the new days are fetched and the files are named
+        `{path}/{account}_{start_date}_{end_date}.xls` after the fetched range.
+        """
+        provider = self.provider or type(self).__name__
+        account_date_ranges = None
+        if incremental:
+            account_date_ranges = self.get_incremental_date_ranges(
+                sub_accounts, start_date, end_date
+            )
+        sub_accounts = self.pending_accounts(
+            sub_accounts, start_date, end_date, account_date_ranges
+        )
+        async for account, df, complete in self._iter_sub_accounts_report(
+            sub_accounts,
+            start_date,
+            end_date,
+            dimensions,
+            account_dimensions,
+            account_date_ranges=account_date_ranges,
+            incremental=incremental,
+        ):
+            if not complete:
+                # Only whole accounts are saved, the next run fetches the
+                # others again
+                continue
+            if df.empty:
+                logger.warning(f"No data for account {account}")
+                continue
+            file_name = f"{account}.xls"
+            if incremental:
+                file_name = "{}_{}_{}.xls".format(
+                    account, *account_date_ranges[account]
+                )
+            df.to_excel(f"{path}/{file_name}", index=False, merge_cells=True)
+            if self.journal is not None:
+                self.journal.record(
+                    provider,
+                    account,
+                    *(account_date_ranges or {}).get(account, (start_date, end_date)),
+                    output=f"{path}/{file_name}",
+                    rows=len(df),
+                )
+
+    async def save_sub_accounts_report(
+        self,
+        sub_accounts: List[str],
+        start_date,
+        end_date,
+        dimensions,
+        sink: BaseSink,
+        account_dimensions: Optional[Dict] = {},
+        incremental: bool = False,
+    ) -> None:
+        """Write the report of every sub account to `sink` as soon as it is
+        fetched, partitioned by provider, account and date"""
+        loop = asyncio.get_running_loop()
+        provider = self.provider or type(self).__name__
+        date_column = None
+        if self.date_column is not None:
+            date_column = self.date_column.lower().replace(" ", "_")
+        account_date_ranges = None
+        if incremental:
+            account_date_ranges = self.get_incremental_date_ranges(
+                sub_accounts, start_date, end_date
+            )
+        sub_accounts = self.pending_accounts(
+            sub_accounts, start_date, end_date, account_date_ranges
+        )
+        async for account, df, complete in self._iter_sub_accounts_report(
+            sub_accounts,
+            start_date,
+            end_date,
+            dimensions,
+            account_dimensions,
+            account_date_ranges=account_date_ranges,
+            incremental=incremental,
+        ):
+            if not complete:
+                # Only whole accounts are saved, the next run fetches the
+                # others again
+                continue
+            if df.empty:
+                logger.warning(f"No data for account {account}")
+                continue
+            with tracer.span("write", account=account, rows=len(df)):
+                await loop.run_in_executor(
+                    self.get_executor(), sink.write, df, provider, account, date_column
+                )
+            if self.journal is not None:
+                await loop.run_in_executor(
+                    self.get_executor(), sink.finish, provider, account
+                )
+                self.journal.record(
+                    provider,
+                    account,
+                    *(account_date_ranges or {}).get(account, (start_date, end_date)),
+                    output=sink.account_output(provider, account),
+                    rows=len(df),
+                )
+
+    @staticmethod
+    def normalize_columns(df: DataFrame) -> DataFrame:
+        df.columns = [col.lower().replace(" ", "_") for col in df.columns]
+        return df
 
     @staticmethod
     def save_df_to_csv(df: DataFrame, file_name: str, target_folder: str) -> None:
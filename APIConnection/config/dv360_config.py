@@ -64,3 +64,7 @@ REPORT_FILTER_GROUP = [
     # "FILTER_TIME_OF_DAY",
 ]
 REPORT_FILTER_TYPE = "FILTER_ADVERTISER"
+
+# Seconds to wait for a report query to complete. API errors while waiting
+# open the DV360 circuit breaker and fail before this deadline
+QUERY_COMPLETION_DEADLINE = 18000
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the runs sharing a cache file are not serialized
+    fcntl = None
+
+from APIConnection.logger import logger
+from APIConnection.settings import (
+    CREDENTIAL_CACHE_FILE,
+    CREDENTIAL_CACHE_KEY,
+    CREDENTIAL_REFRESH_MARGIN,
+)
+from APIConnection.utils import lazy_import
+
+# Only loaded when the disk cache is enabled
+fernet = lazy_import("cryptography.fernet")
+
+# Returns a token and its lifetime in seconds, None if it does not expire
+Fetch = Callable[[], Tuple[Any, Optional[float]]]
+
+
+class CachedToken(NamedTuple):
+    value: Any
+    # Epoch seconds, None if the token does not expire
+    expires_at: Optional[float] = None
+
+
+def credential_name(provider: str, *identity: str) -> str:
+    """Cache key of the credential of `identity`, e.g. a user name or a
+    client secret, which is hashed so that it never appears in the cache"""
+    digest = hashlib.sha256("\0".join(map(str, identity)).encode("utf-8"))
+    return f"{provider}:{digest.hexdigest()[:16]}"
+
+
+class CredentialManager:
+    """Cache of the access tokens of the connectors
+
+    Tokens are kept in memory and, with an encryption key, in a Fernet
+    encrypted file shared by the runs. Writes to the file are serialized by
+    a lock file and merged with the tokens saved by the other runs meanwhile,
+    keeping the token expiring last. A cached token is returned until it
+    expires; once it expires within `refresh_margin` seconds it is still
+    returned while a background thread fetches a new one. Fetches of the same
+    token are single-flight: threads asking for it while it is fetched wait
+    for that fetch instead of starting their own.
+
+    Usage:
+    ```
+    token = credentials.get(
+        credential_name("tradedesk", username), lambda: (login(), 86400)
+    )
+    ```
+
+    Args:
+        path (str): encrypted cache file
+        key (str): Fernet key of the file, e.g. from
+            `cryptography.fernet.Fernet.generate_key()`. Without a key tokens
+            are only cached in memory
+        refresh_margin (float): seconds before expiry at which tokens are
+            refreshed in the background
+    """
+
+    def __init__(
+        self,
+        path: str = CREDENTIAL_CACHE_FILE,
+        key: str = CREDENTIAL_CACHE_KEY,
+        refresh_margin: float = CREDENTIAL_REFRESH_MARGIN,
+    ):
+        self.path = path
+        self.key = key
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, CachedToken] = {}
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._refreshing: Set[str] = set()
+        self._loaded = False
+
+    def get(self, name: str, fetch: Fetch) -> Any:
+        """Return the cached token `name`, fetch it if missing or expired
+
+        Args:
+            name (str): cache key, see `credential_name`
+            fetch (callable): returns (token, lifetime in seconds or None)
+        """
+        token = self._cached(name)
+        now = time.time()
+        if token is not None and not self._expired(token, now):
+            if (
+                token.expires_at is not None
+                and token.expires_at - now <= self.refresh_margin
+            ):
+                self._refresh_in_background(name, fetch, token)
+            return token.value
+        return self._fetch(name, fetch, token).value
+
+    def peek(self, name: str) -> Any:
+        """Return the cached token `name`, even expired, None if missing"""
+        token = self._cached(name)
+        return None if token is None else token.value
+
+    def invalidate(self, name: str) -> None:
+        """Drop a token, e.g. one rejected by the API"""
+        with self._lock:
+            self._load()
+            self._tokens.pop(name, None)
+            self._save(removed=[name])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._loaded = True
+            self._save(clear=True)
+
+    @staticmethod
+    def _expired(token: CachedToken, now: float) -> bool:
+        return token.expires_at is not None and token.expires_at <= now
+
+    def _cached(self, name: str) -> Optional[CachedToken]:
+        with self._lock:
+            self._load()
+            return self._tokens.get(name)
+
+    def _fetch(
+        self, name: str, fetch: Fetch, seen: Optional[CachedToken]
+    ) -> CachedToken:
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(name, threading.Lock())
+        with fetch_lock:
+            token = self._cached(name)
+            if (
+                token is not None
+                and token is not seen
+                and not self._expired(token, time.time())
+            ):
+                # Fetched by another thread while this one was waiting
+                return token
+            logger.debug(f"Fetch credential {name}")
+            value, lifetime = fetch()
+            token = CachedToken(
+                value, None if lifetime is None else time.time() + lifetime
+            )
+            with self._lock:
+                self._tokens[name] = token
+                self._save()
+            return token
+
+    def _refresh_in_background(
+        self, name: str, fetch: Fetch, seen: CachedToken
+    ) -> None:
+        with self._lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+
+        def refresh():
+            try:
+                self._fetch(name, fetch, seen)
+            except Exception as e:
+                # The current token is still valid, the next call retries
+                logger.warning(f"Can not refresh credential {name}. {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(name)
+
+        threading.Thread(target=refresh, name=f"refresh-{name}", daemon=True).start()
+
+    def _load(self) -> None:
+        """Read the disk cache once, called under the lock"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.key:
+            return
+        for name, token in self._read().items():
+            self._tokens.setdefault(name, token)
+
+    def _read(self) -> Dict[str, CachedToken]:
+        """Unexpired tokens of the disk cache"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                data = fernet.Fernet(self.key).decrypt(f.read())
+        except fernet.InvalidToken:
+            logger.warning(f"Can not decrypt {self.path}, start an empty cache")
+            return {}
+        now = time.time()
+        tokens = {}
+        for name, (value, expires_at) in json.loads(data).items():
+            token = CachedToken(value, expires_at)
+            if not self._expired(token, now):
+                tokens[name] = token
+        return tokens
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize the read-merge-write of the runs sharing the file"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _newer(token: CachedToken, other: CachedToken) -> bool:
+        if token.expires_at is None or other.expires_at is None:
+            return other.expires_at is not None
+        return token.expires_at > other.expires_at
+
+    def _save(self, removed: Iterable[str] = (), clear: bool = False) -> None:
+        """Merge the tokens into the disk cache, called under the lock
+
+        Tokens saved by other runs since this one read the file are kept, and
+        adopted when they expire after the tokens in memory.
+
+        Args:
+            removed (list(str)): names dropped from the cache
+            clear (bool): drop every token of the file
+        """
+        if not self.key:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock():
+            merged = {} if clear else self._read()
+            for name in removed:
+                merged.pop(name, None)
+            for name, token in self._tokens.items():
+                if name not in merged or not self._newer(merged[name], token):
+                    merged[name] = token
+                else:
+                    self._tokens[name] = merged[name]
+            tokens = {}
+            for name, token in merged.items():
+                try:
+                    json.dumps(token.value)
+                except TypeError:
+                    logger.debug(f"Credential {name} is not serializable, not saved")
+                    continue
+                tokens[name] = list(token)
+            data = fernet.Fernet(self.key).encrypt(json.dumps(tokens).encode("utf-8"))
+            # Unique per writer, the lock file is only advisory
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(
+                os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb"
+            ) as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+
+credentials = CredentialManager()
+
+
+def oauth2_credentials(name: str, load: Callable[[], Any]):
+    """oauth2client credentials kept in the credential cache
+
+    `load` is only called when the cache has none, e.g. to read a credential
+    store or run the consent flow. Afterwards the cached credentials are
+    refreshed with their refresh token before they expire.
+
+    Args:
+        name (str): cache key, see `credential_name`
+        load (callable): returns valid oauth2client credentials
+
+    Returns:
+        oauth2client.client.OAuth2Credentials
+    """
+    import httplib2
+    from oauth2client import client
+
+    def lifetime(creds) -> Optional[float]:
+        if creds.token_expiry is None:
+            return None
+        return (creds.token_expiry - datetime.utcnow()).total_seconds()
+
+    def fetch():
+        cached = credentials.peek(name)
+        creds = client.OAuth2Credentials.from_json(cached) if cached else load()
+        remaining = lifetime(creds)
+        if (
+            creds.refresh_token
+            and remaining is not None
+            and remaining <= credentials.refresh_margin
+        ):
+            creds.refresh(httplib2.Http())
+            remaining = lifetime(creds)
+        return creds.to_json(), remaining
+
+    return client.OAuth2Credentials.from_json(credentials.get(name, fetch))
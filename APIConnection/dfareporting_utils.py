@@ -19,12 +19,13 @@
 import argparse
 import os
 
-from googleapiclient import discovery
 import httplib2
 from oauth2client import client
 from oauth2client import file as oauthFile
 from oauth2client import tools
 
+from .discovery_cache import discovery_cache
+
 
 API_NAME = "dfareporting"
 API_VERSION = "v3.4"
@@ -124,5 +125,5 @@ def setup(flags):
     # Authorize HTTP object with the prepared credentials.
     http = credentials.authorize(http=httplib2.Http())
 
-    # Construct and return a service object via the discovery service.
-    return discovery.build(API_NAME, API_VERSION, http=http)
+    # Construct and return a service object from the cached discovery document.
+    return discovery_cache.build(API_NAME, API_VERSION, http=http)
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from APIConnection.logger import logger
+from APIConnection.retry import send_request
+from APIConnection.settings import (
+    DISCOVERY_CACHE_DIR,
+    DISCOVERY_CACHE_TTL,
+    DISCOVERY_STATIC_DIR,
+)
+from APIConnection.utils import lazy_import
+
+# Only loaded when a service is built
+discovery = lazy_import("googleapiclient.discovery")
+library_cache = lazy_import("googleapiclient.discovery_cache")
+
+GOOGLE_DISCOVERY_URL = (
+    "https://www.googleapis.com/discovery/v1/apis/{api}/{apiVersion}/rest"
+)
+
+
+class DiscoveryCache:
+    """On-disk cache of the discovery documents of the Google APIs
+
+    `googleapiclient.discovery.build` fetches the discovery document of the
+    API before building the service, one round trip per service and
+    connection. Services built with `build` read the document from:
+
+    1. the cache, one JSON file per API, version and discovery URL
+    2. for the default discovery URL, a static copy, from `static_dir` or
+       the copies bundled with the client library
+    3. the network, only when neither has the document
+
+    Documents older than `ttl` seconds are still used, and revalidated in a
+    background thread with their ETag, so that building a service does not
+    wait for the network once the document was seen.
+
+    Usage:
+    ```
+    service = discovery_cache.build("dfareporting", "v3.4", http=http)
+    ```
+
+    Args:
+        cache_dir (str): directory of the cached documents
+        ttl (int): seconds after which a document is revalidated
+        static_dir (str): directory of documents shipped with the package,
+            named `{api}.{version}.json`
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DISCOVERY_CACHE_DIR,
+        ttl: int = DISCOVERY_CACHE_TTL,
+        static_dir: Optional[str] = DISCOVERY_STATIC_DIR,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._revalidating: Set[str] = set()
+
+    @staticmethod
+    def discovery_url(name: str, version: str, url: Optional[str] = None) -> str:
+        """Discovery URL of an API version, the templates of
+        `googleapiclient.discovery.build` are filled in"""
+        url = url or GOOGLE_DISCOVERY_URL
+        return url.replace("{api}", name).replace("{apiVersion}", version)
+
+    def path(self, name: str, version: str, url: str) -> str:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{name}.{version}.{digest}.json")
+
+    def document(
+        self, name: str, version: str, discovery_url: Optional[str] = None
+    ) -> str:
+        """Discovery document of an API version, as JSON text
+
+        Args:
+            name (str): API name, e.g. "doubleclickbidmanager"
+            version (str): API version, e.g. "v1.1"
+            discovery_url (str): URL of the document, may contain the
+                {api} and {apiVersion} templates. Defaults to the Google
+                discovery service
+
+        Returns:
+            str
+        """
+        url = self.discovery_url(name, version, discovery_url)
+        path = self.path(name, version, url)
+        entry = self._entry(path)
+        if entry is None and discovery_url is None:
+            entry = self._static(name, version, url)
+            if entry is not None:
+                self._store(path, entry)
+        if entry is None:
+            logger.debug(f"Fetch discovery document {url}")
+            entry = self._fetch(url)
+            self._store(path, entry)
+        elif time.time() - entry["fetched_at"] > self.ttl:
+            self._revalidate_in_background(path, entry)
+        return entry["document"]
+
+    def build(
+        self,
+        name: str,
+        version: str,
+        http=None,
+        discovery_url: Optional[str] = None,
+        **kwargs,
+    ):
+        """`googleapiclient.discovery.build` from the cached document
+
+        Args:
+            name (str): API name
+            version (str): API version
+            http (httplib2.Http): authorized HTTP object
+            discovery_url (str): URL of the document, see `document`
+            kwargs: other arguments of `build_from_document`
+
+        Returns:
+            googleapiclient.discovery.Resource
+        """
+        document = self.document(name, version, discovery_url)
+        return discovery.build_from_document(document, http=http, **kwargs)
+
+    def _entry(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None or not os.path.exists(path):
+            return entry
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except ValueError:
+            logger.warning(f"Corrupted discovery document {path}")
+            return None
+        with self._lock:
+            return self._entries.setdefault(path, entry)
+
+    def _static_dirs(self) -> List[str]:
+        directories = [self.static_dir] if self.static_dir else []
+        try:
+            directories.append(library_cache.DISCOVERY_DOC_DIR)
+        except (ImportError, AttributeError):
+            # The client library is missing or older than 2.0
+            pass
+        return directories
+
+    def _static(self, name: str, version: str, url: str) -> Optional[Dict]:
+        """Bundled copy of a document, dated by its file so that old copies
+        are revalidated"""
+        for directory in self._static_dirs():
+            path = os.path.join(directory, f"{name}.{version}.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    document = f.read()
+                return {
+                    "url": url,
+                    "etag": None,
+                    "fetched_at": os.path.getmtime(path),
+                    "document": document,
+                }
+        return None
+
+    def _fetch(self, url: str, entry: Optional[Dict] = None) -> Dict:
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        response = send_request(
+            "google", "discovery", "GET", url, headers=headers, timeout=60
+        )
+        if response.status_code == 304 and entry is not None:
+            return dict(entry, fetched_at=time.time())
+        response.raise_for_status()
+        # Only valid documents are cached
+        json.loads(response.text)
+        return {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "fetched_at": time.time(),
+            "document": response.text,
+        }
+
+    def _store(self, path: str, entry: Dict) -> None:
+        with self._lock:
+            self._entries[path] = entry
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+
+    def _revalidate_in_background(self, path: str, entry: Dict) -> None:
+        with self._lock:
+            if path in self._revalidating:
+                return
+            self._revalidating.add(path)
+
+        def revalidate():
+            try:
+                self._store(path, self._fetch(entry["url"], entry))
+            except Exception as e:
+                # The cached document is still used, the next build retries
+                logger.debug(f"Can not revalidate {entry['url']}. {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(path)
+
+        threading.Thread(
+            target=revalidate, name=f"discovery-{os.path.basename(path)}", daemon=True
+        ).start()
+
+    def wait(self, timeout: float = 60) -> bool:
+        """Wait for the background revalidations, e.g. before exiting
+
+        Returns:
+            bool: whether they all completed
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if not self._revalidating:
+                    return True
+            time.sleep(0.01)
+        return False
+
+
+discovery_cache = DiscoveryCache()
@@ -0,0 +1,187 @@
+import re
+import warnings
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+from pandas.api.types import (
+    is_bool_dtype,
+    is_float_dtype,
+    is_integer_dtype,
+    is_object_dtype,
+    is_string_dtype,
+)
+
+from APIConnection.settings import (
+    CATEGORY_KEYWORDS,
+    CATEGORY_MAX_RATIO,
+    DATE_KEYWORDS,
+)
+
+_CATEGORY_NAME = re.compile(
+    rf"(^|_)({'|'.join(map(re.escape, CATEGORY_KEYWORDS))})s?(_|$)"
+)
+_DATE_NAME = re.compile(rf"(^|_)({'|'.join(map(re.escape, DATE_KEYWORDS))})(_|$)")
+
+
+def _key(column) -> str:
+    """'Campaign ID', 'campaign.id' and 'campaign_id' all read campaign_id"""
+    return re.sub(r"[^a-z0-9]+", "_", str(column).lower()).strip("_")
+
+
+def _is_text(series: Series) -> bool:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return False
+    return is_object_dtype(series.dtype) or is_string_dtype(series.dtype)
+
+
+def _to_datetime(series: Series) -> Optional[Series]:
+    """Parse the column, None unless every value is a date"""
+    with warnings.catch_warnings():
+        # Format inference warnings on mixed formats
+        warnings.simplefilter("ignore")
+        try:
+            parsed = pd.to_datetime(series, errors="coerce")
+        except (TypeError, ValueError):
+            return None
+    if parsed.notna().sum() != series.notna().sum():
+        return None
+    return parsed
+
+
+def _to_numeric(series: Series) -> Optional[Series]:
+    """Parse the column, None unless every value is a number
+
+    Zero-padded strings, e.g. zip codes or IDs, are codes rather than numbers
+    and would lose their leading zeros, so their column is left as is.
+    """
+    if _is_text(series) and series.astype(str).str.match(r"[-+]?0\d").any():
+        return None
+    try:
+        parsed = pd.to_numeric(series, errors="coerce")
+    except (TypeError, ValueError):
+        # Lists or dicts, e.g. the actions of Facebook insights
+        return None
+    if parsed.notna().sum() != series.notna().sum():
+        return None
+    return parsed
+
+
+def _downcast(series: Series) -> Series:
+    """Narrowest dtype holding every value exactly"""
+    if is_bool_dtype(series.dtype):
+        return series
+    if is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast="integer")
+    if is_float_dtype(series.dtype):
+        if (
+            series.notna().all()
+            and (series == series.round()).all()
+            and series.abs().max() < 2**53
+        ):
+            return pd.to_numeric(series.astype(np.int64), downcast="integer")
+        narrow = series.astype(np.float32)
+        if (narrow.astype(np.float64).eq(series) | series.isna()).all():
+            return narrow
+    return series
+
+
+def _to_category(series: Series) -> Optional[Series]:
+    try:
+        return series.astype("category")
+    except TypeError:
+        # Unhashable cells
+        return None
+
+
+def compact_dtypes(df: DataFrame, date_column: Optional[str] = None) -> DataFrame:
+    """Turn the object columns of a report into compact dtypes
+
+    - date columns, `date_column` and the columns named after a
+      `settings.DATE_KEYWORDS`, are parsed once into datetime64
+    - account, campaign, name and ID columns, see
+      `settings.CATEGORY_KEYWORDS`, become categoricals
+    - metrics, stringified or not, get the narrowest numeric dtype holding
+      every value exactly
+    - the other string columns become categoricals when they repeat enough
+
+    A column is only converted when every value converts, so a metric with a
+    stray "N/A", a column of zero-padded codes or a date column holding a
+    summary row is left as is. The connectors only apply it when
+    `settings.COMPACT_DTYPES` is on.
+
+    Args:
+        df (DataFrame): report frame, left untouched
+        date_column (str): column holding the day of every row
+
+    Returns:
+        DataFrame
+    """
+    if df is None or df.empty:
+        return df
+    date_key = _key(date_column) if date_column else None
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series, DataFrame):
+            # Duplicated column names
+            continue
+        key = _key(column)
+        converted = None
+        if _is_text(series):
+            if key == date_key or _DATE_NAME.search(key):
+                converted = _to_datetime(series)
+            if converted is None and _CATEGORY_NAME.search(key):
+                converted = _to_category(series)
+            if converted is None:
+                numeric = _to_numeric(series)
+                if numeric is not None:
+                    converted = _downcast(numeric)
+            if converted is None:
+                try:
+                    repeats = series.nunique() <= CATEGORY_MAX_RATIO * len(series)
+                except TypeError:
+                    repeats = False
+                if repeats:
+                    converted = _to_category(series)
+        elif is_integer_dtype(series.dtype) or is_float_dtype(series.dtype):
+            converted = _downcast(series)
+        if converted is not None and converted is not series:
+            columns[column] = converted
+    if not columns:
+        return df
+    df = df.copy(deep=False)
+    for column, converted in columns.items():
+        df[column] = converted
+    return df
+
+
+def concat_frames(frames: Iterable[DataFrame], **kwargs) -> DataFrame:
+    """`pd.concat` keeping the compact dtypes of `compact_dtypes`
+
+    Concatenating categoricals with different categories falls back to
+    object. The categories of every column are unioned first so the result
+    stays categorical.
+    """
+    frames: List[DataFrame] = [df for df in frames if df is not None]
+    if len(frames) < 2:
+        return pd.concat(frames, **kwargs) if frames else pd.DataFrame()
+    categorical = {
+        column
+        for df in frames
+        for column, dtype in df.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    }
+    for column in categorical:
+        if not all(
+            column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype)
+            for df in frames
+        ):
+            continue
+        categories = pd.Index([])
+        for df in frames:
+            categories = categories.union(df[column].cat.categories, sort=False)
+        dtype = pd.CategoricalDtype(categories)
+        frames = [df.astype({column: dtype}) for df in frames]
+    return pd.concat(frames, **kwargs)
@@ -1,4 +1,5 @@
 import argparse
+import io
 import logging
 import os
 import socket
@@ -6,23 +7,26 @@ import sys
 import tempfile
 from contextlib import closing
 from datetime import datetime, timedelta
+from functools import partial
 from typing import Any, Dict, List
 
 import httplib2
 import pandas as pd
-from google.api_core import retry
-from google_auth_oauthlib.flow import Flow
-from googleapiclient import discovery
-from googleapiclient.discovery import build
 from oauth2client import client, tools
 from oauth2client.file import Storage
-from oauth2client.service_account import ServiceAccountCredentials
 from pandas import DataFrame
 from six.moves.urllib.request import urlopen
 
 from APIConnection.config import dv360_config
+from APIConnection.credentials import credential_name, oauth2_credentials
+from APIConnection.discovery_cache import discovery_cache
+from APIConnection.dtypes import compact_dtypes
+from APIConnection.job_poller import JobState, wait_for_job
 from APIConnection.logger import get_logger
-from APIConnection.settings import GG_OAUTH2_CRED
+from APIConnection.metrics import BYTES_DOWNLOADED
+from APIConnection.retry import Retry, get_breaker, transient_policy
+from APIConnection.settings import API_BASE_URLS, COMPACT_DTYPES, GG_OAUTH2_CRED
+from APIConnection.transform import TransformStage
 
 sys.path.insert(0, os.path.abspath(".."))
 
@@ -31,6 +35,69 @@ logger = get_logger(
 )
 
 
+# Transient API errors while polling a query, behind the DV360 breaker
+QUERY_RETRY = Retry(transient_policy(), breaker=get_breaker("dv360"))
+GOOGLE_API_URL = "https://www.googleapis.com"
+DISCOVERY_PATH = "/discovery/v1/apis/{api}/{apiVersion}/rest"
+
+
+def build_dbm_service(http):
+    """Build the DoubleClick Bid Manager service. Its discovery document is
+    fetched from API_BASE_URLS["dv360"] when that URL is overridden, and is
+    the one bundled with the client library otherwise, see
+    `APIConnection.discovery_cache`"""
+    base_url = API_BASE_URLS["dv360"]
+    return discovery_cache.build(
+        "doubleclickbidmanager",
+        "v1.1",
+        http=http,
+        discovery_url=None if base_url == GOOGLE_API_URL else base_url + DISCOVERY_PATH,
+    )
+
+
+def query_state(getquery_request) -> JobState:
+    """Queries metadata to check for completion."""
+    completion_response = QUERY_RETRY.call(getquery_request.execute)
+    return JobState(not completion_response["metadata"]["running"], completion_response)
+
+
+def check_query_completion(getquery_request):
+    """Runs the given Queries.getquery request until the query completes,
+    with an adaptive backoff, and returns the completed query. Will raise
+    JobPollTimeout if the query takes more than
+    QUERY_COMPLETION_DEADLINE seconds to complete."""
+    return wait_for_job(
+        partial(query_state, getquery_request),
+        name="dv360 query",
+        timeout=dv360_config.QUERY_COMPLETION_DEADLINE,
+    )
+
+
+def parse_report_csv(content: bytes) -> DataFrame:
+    """Parse a downloaded report into a frame with normalized columns and
+    compact dtypes
+
+    The report ends with a summary section whose rows have no valid date,
+    those rows are dropped.
+
+    Args:
+        content (bytes): raw CSV report
+
+    Returns:
+        DataFrame
+    """
+    report_df = pd.read_csv(io.BytesIO(content))
+    report_df = report_df[report_df.Date.str.match(r"\d{4}/\d{2}/\d{2}", na=False)]
+    report_df.columns = [c.lower().replace(" ", "_") for c in report_df.columns]
+    report_df = report_df.rename(columns={"date": "date_start"})
+    report_df["date_start"] = report_df["date_start"].str.replace("/", "-", regex=False)
+    report_df["date_stop"] = report_df["date_start"]
+    report_df["spend"] = report_df["budget_segment_budget"]
+    if COMPACT_DTYPES:
+        report_df = compact_dtypes(report_df, "date_start")
+    return report_df
+
+
 class DV360:
     _API_NAME = "displayvideo"
     _DEFAULT_API_VERSION = "v1"
@@ -52,6 +119,7 @@ class DV360:
         report_window=None,
         cached_credential=None,
         allow_consent=True,
+        transform_processes=0,
     ):
         if date_range:
             self.REPORT_DATE_RANGE = date_range
@@ -61,6 +129,7 @@ class DV360:
         self.REPORT_OUTPUT_DIR = output
         self.REPORT_FREQUENCY = frequency
         self.REPORT_WINDOW = report_window
+        self.transform_stage = TransformStage(transform_processes)
 
         self.cached_credential = cached_credential
         if not allow_consent and not self.cached_credential:
@@ -89,7 +158,26 @@ class DV360:
         return parser.parse_args(argv[1:])
 
     def authenticate_using_user_account(self):
-        """Steps through Service Account OAuth 2.0 flow to retrieve credentials."""
+        """Steps through Service Account OAuth 2.0 flow to retrieve credentials.
+
+        The credentials are kept in the shared credential cache, so the
+        credential store is only read once and the access token is refreshed
+        before it expires.
+        """
+        credentials = oauth2_credentials(
+            credential_name(
+                "dv360", self.cached_credential or "", self.CREDENTIALS_FILE
+            ),
+            self.load_credentials,
+        )
+
+        # Use the credentials to authorize an httplib2.Http instance.
+        http = credentials.authorize(httplib2.Http())
+
+        return http
+
+    def load_credentials(self):
+        """Read the cached credential, or go through the authorization process"""
         flow = client.flow_from_clientsecrets(
             self.CREDENTIALS_FILE, scope=self._API_SCOPES
         )
@@ -113,14 +201,12 @@ class DV360:
             credentials = tools.run_flow(
                 flow, storage, tools.argparser.parse_known_args()[0]
             )
-
-        # Use the credentials to authorize an httplib2.Http instance.
-        http = credentials.authorize(httplib2.Http())
-
-        return http
+        return credentials
 
     def get_oauth2_authorize_url(self):
         """Steps through Service Account OAuth 2.0 flow to retrieve credentials."""
+        from google_auth_oauthlib.flow import Flow
+
         flow = Flow.from_client_secrets_file(
             self.CREDENTIALS_FILE,
             scopes=self._API_SCOPES,
@@ -142,6 +228,8 @@ class DV360:
 
     def authenticate_using_service_account(self, impersonation_email=""):
         """Authorizes an httplib2.Http instance using service account credentials."""
+        from oauth2client.service_account import ServiceAccountCredentials
+
         # Load the service account credentials from the specified JSON keyfile.
         credentials = ServiceAccountCredentials.from_json_keyfile_name(
             dv360_config.SERVICE_ACCOUNT_CREDS, scopes=self._API_SCOPES
@@ -197,12 +285,13 @@ class DV360:
 
         socket.setdefaulttimeout(180)
 
-        # Initialize client for Display & Video 360 API
-        dv360_service = discovery.build(
-            self._API_NAME, version, discoveryServiceUrl=discovery_url, http=self.http
+        # Initialize client for Display & Video 360 API, from the cached
+        # discovery document
+        dv360_service = discovery_cache.build(
+            self._API_NAME, version, http=self.http, discovery_url=discovery_url
         )
 
-        dbm_service = discovery.build("doubleclickbidmanager", "v1.1", http=self.http)
+        dbm_service = build_dbm_service(self.http)
 
         return dbm_service, dv360_service
 
@@ -262,22 +351,8 @@ class DV360:
             )
             query_id = operation["queryId"]
             if query_id:
-
-                @retry.Retry(
-                    predicate=retry.if_exception_type(Exception),
-                    initial=5,
-                    maximum=60,
-                    deadline=18000,
-                )
-                def check_get_query_completion(getquery_request):
-                    """Queries metadata to check for completion."""
-                    completion_response = getquery_request.execute()
-                    if completion_response["metadata"]["running"]:
-                        raise Exception("The operation has not completed.")
-                    return completion_response
-
                 query_request = self.dbm_service.queries().getquery(queryId=query_id)
-                query = check_get_query_completion(query_request)
+                query = check_query_completion(query_request)
                 try:
                     if self.is_in_report_window(
                         query["metadata"]["latestReportRunTimeMs"], self.REPORT_WINDOW
@@ -285,19 +360,10 @@ class DV360:
                         report_url = query["metadata"][
                             "googleCloudStoragePathForLatestReport"
                         ]
-                        report_df = pd.read_csv(report_url)
-                        report_df = report_df[
-                            report_df.Date.str.match(r"\d{4}/\d{2}/\d{2}", na=False)
-                        ]
-                        report_df.columns = [
-                            c.lower().replace(" ", "_") for c in report_df.columns
-                        ]
-                        report_df = report_df.rename(columns={"date": "date_start"})
-                        report_df["date_start"] = report_df["date_start"].apply(
-                            lambda d: d.replace("/", "-")
-                        )
-                        report_df["date_stop"] = report_df["date_start"]
-                        report_df["spend"] = report_df["budget_segment_budget"]
+                        with closing(urlopen(report_url)) as url:
+                            content = url.read()
+                        BYTES_DOWNLOADED.inc(len(content), provider="dv360")
+                        report_df = self.transform_stage.run(parse_report_csv, content)
                         return report_df
                     else:
                         logger.error(
@@ -311,27 +377,14 @@ class DV360:
         except Exception as e:
             raise e
 
-    def get_full_report(self, query_id):
+    def get_full_report(self, query_id, sink=None):
+        """Download the latest report of a query to a timestamped csv file in
+        REPORT_OUTPUT_DIR, or write its rows to `sink` (BaseSink), e.g. the
+        local fact store"""
         if query_id:
-            # Runs the given Queries.getquery request, retrying with an exponential
-            # backoff. Returns completed operation. Will raise an exception if the
-            # operation takes more than five hours to complete.
-            @retry.Retry(
-                predicate=retry.if_exception_type(Exception),
-                initial=5,
-                maximum=60,
-                deadline=18000,
-            )
-            def check_get_query_completion(getquery_request):
-                """Queries metadata to check for completion."""
-                completion_response = getquery_request.execute()
-                if completion_response["metadata"]["running"]:
-                    raise Exception("The operation has not completed.")
-                return completion_response
-
             # Call the API, getting the latest status for the passed queryId.
             getquery_request = self.dbm_service.queries().getquery(queryId=query_id)
-            query = check_get_query_completion(getquery_request)
+            query = check_query_completion(getquery_request)
             try:
                 now = datetime.now()  # current date and time
                 date_time = now.strftime("%Y_%m_%d-%H%M%S")
@@ -348,9 +401,15 @@ class DV360:
                     report_url = query["metadata"][
                         "googleCloudStoragePathForLatestReport"
                     ]
-                    with open(report_output_file, "wb") as output:
-                        with closing(urlopen(report_url)) as url:
-                            output.write(url.read())
+                    with closing(urlopen(report_url)) as url:
+                        content = url.read()
+                    BYTES_DOWNLOADED.inc(len(content), provider="dv360")
+                    if sink is not None:
+                        report_df = self.transform_stage.run(parse_report_csv, content)
+                        sink.write(report_df, "dv360", str(query_id), "date_start")
+                    else:
+                        with open(report_output_file, "wb") as output:
+                            output.write(content)
                     logger.info("Download complete.")
                 else:
                     logger.error(
@@ -382,7 +441,7 @@ class DV360:
         Returns:
           User information as a dict.
         """
-        user_info_service = build(serviceName="oauth2", version="v2", http=self.http)
+        user_info_service = discovery_cache.build("oauth2", "v2", http=self.http)
         user_info = None
         try:
             user_info = user_info_service.userinfo().get().execute()
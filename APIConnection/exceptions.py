@@ -33,4 +33,28 @@ class TwitterTimeout(Exception):
 
 
 class MissingArgumentException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class JobPollTimeout(Exception):
+    """
+    A report job did not complete before the timeout of the poller
+    """
+
+    pass
+
+
+class CircuitOpenError(Exception):
+    """
+    The circuit breaker of a provider is open, the call was not sent
+    """
+
+    pass
+
+
+class ReplayMissError(Exception):
+    """
+    A replayed run sent a request that is not in the recording
+    """
+
+    pass
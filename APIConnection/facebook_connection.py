@@ -1,39 +1,94 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import errno
+import functools
 import logging
 import os
-import time
 from typing import Dict, List
 
 import pandas as pd
-from facebook import GraphAPI
 from facebook_business.adobjects.adaccount import AdAccount
 from facebook_business.adobjects.adreportrun import AdReportRun
 from facebook_business.adobjects.user import User
 from facebook_business.api import FacebookAdsApi
+from facebook_business.exceptions import FacebookRequestError
 from pandas import DataFrame
 
 from APIConnection.base_connection import BaseConnection
-from APIConnection.exceptions import FBTimeOut
+from APIConnection.exceptions import FBException, FBTimeOut, JobPollTimeout
+from APIConnection.job_poller import JobState
 from APIConnection.logger import logger
-from APIConnection.settings import AD_INSIGHT_FIELD
+from APIConnection.metrics import BYTES_DOWNLOADED, REQUEST_SECONDS, REQUESTS
+from APIConnection.rate_limiter import rate_limiter
+from APIConnection.settings import AD_INSIGHT_FIELD, API_BASE_URLS
+from APIConnection.tracing import in_context, tracer
+from APIConnection.utils import run_sync
 
-logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
-
-TIMEOUT = 20
+# Seconds to wait for an insights report job
+TIMEOUT = 400
 FB_API_URL = "https://developers.facebook.com"
 EXCLUDE_FB_ACC_INSIGHT_FIELDS = ["total_postbacks"]
 
 
+def async_job_state(job: AdReportRun) -> JobState:
+    """Poll an insights report job, its result is the result cursor"""
+    job = job.api_get()
+    status = job[AdReportRun.Field.async_status]
+    if status == "Job Completed":
+        return JobState(True, job.get_result())
+    if status in ("Job Failed", "Job Skipped"):
+        raise FBException(f"Report job {job.get_id()} {status}")
+    progress = job[AdReportRun.Field.async_percent_completion]
+    logger.debug(
+        f"{job[AdReportRun.Field.account_id]} {status} {progress}% "
+        "Wait for report complete"
+    )
+    return JobState(False, progress=progress / 100 if progress is not None else None)
+
+
+def throttle_api_calls(api: FacebookAdsApi) -> FacebookAdsApi:
+    """Route every Graph API call of `api` through the rate limiter and
+    adapt its rate to the usage headers of the responses"""
+    call = api.call
+
+    @functools.wraps(call)
+    def throttled_call(method, path, *args, **kwargs):
+        endpoint = "insights" if "insights" in str(path) else "graph"
+        provider = FBConnection.provider
+        rate_limiter.acquire(provider, endpoint)
+        try:
+            with tracer.span(endpoint, "http", provider=provider, method=method):
+                with REQUEST_SECONDS.time(provider=provider, endpoint=endpoint):
+                    response = call(method, path, *args, **kwargs)
+        except FacebookRequestError as e:
+            REQUESTS.inc(provider=provider, endpoint=endpoint, status=e.http_status())
+            rate_limiter.update(provider, endpoint, e.http_status(), e.http_headers())
+            raise
+        REQUESTS.inc(provider=provider, endpoint=endpoint, status=response.status())
+        body = (response.body() or "").encode("utf-8")
+        BYTES_DOWNLOADED.inc(len(body), provider=provider)
+        rate_limiter.update(provider, endpoint, response.status(), response.headers())
+        return response
+
+    api.call = throttled_call
+    return api
+
+
 class FBConnection(BaseConnection):
     """Wrapper class for fetching/parsing FB endpoints"""
 
-    def __init__(self, access_token=None):
+    provider = "facebook"
+    date_column = "date_start"
+
+    def __init__(self, access_token=None, **kwargs):
+        super().__init__(**kwargs)
         self.access_token = access_token
-        FacebookAdsApi.init(access_token=access_token)
-        self.user = User(fbid="me")
-        self.accounts = list(self.user.get_ad_accounts(fields=["id", "name"]))
+        with tracer.span("auth", provider=self.provider):
+            api = FacebookAdsApi.init(access_token=access_token)
+            api._session.GRAPH = API_BASE_URLS[self.provider]
+            throttle_api_calls(api)
+            self.user = User(fbid="me")
+            self.accounts = list(self.user.get_ad_accounts(fields=["id", "name"]))
 
     def get_sub_accounts(self) -> List[Dict]:
         """
@@ -70,6 +125,9 @@ class FBConnection(BaseConnection):
 
         Returns:
             (:obj: `list`)
+
+        Raises:
+            FBTimeOut: the report job did not complete in time
         """
         params = {
             "time_range": {"since": start_date, "until": end_date},
@@ -78,27 +136,48 @@ class FBConnection(BaseConnection):
             "time_increment": 1,
             "breakdowns": [],
         }
+        # The Graph API calls block on the rate limiter and the network, they
+        # run on the connection thread pool to keep the event loop free for
+        # the other accounts
+        loop = asyncio.get_running_loop()
         try:
             account = AdAccount(account)
             if dimensions is None:
                 dimensions = FBConnection.get_ads_insights_variable_list()
             if "account_id" not in dimensions:
                 dimensions.append("account_id")
-            async_job = account.get_insights(
-                fields=dimensions, params=params, is_async=True
-            )
+            with tracer.span("create"):
+                async_job = await loop.run_in_executor(
+                    self.get_executor(),
+                    in_context(
+                        account.get_insights,
+                        fields=dimensions,
+                        params=params,
+                        is_async=True,
+                    ),
+                )
             result_cursor = await self.wait_for_async_job(async_job)
-            data = [item for item in result_cursor]
-            return pd.DataFrame(data)
+            with tracer.span("download"):
+                # Iterating the cursor fetches the next pages
+                data = await loop.run_in_executor(
+                    self.get_executor(), in_context(list, result_cursor)
+                )
+            with tracer.span("parse", rows=len(data)):
+                return pd.DataFrame(data)
         except FBTimeOut:
+            # Raised to the fan-out, which marks the account failed
             logging.error(f"TIMEOUT: Can not get data for account {account}")
-            return pd.DataFrame()
-        except Exception as e:
-            logging.error(f"ERROR: Can not get data for account {account}. Detail {e}")
-            return pd.DataFrame()
+            raise
 
     def save_insight_ads_accounts_to_excel(
-        self, start_date, end_date, path="./", fields=None, sub_account_ids=None
+        self,
+        start_date,
+        end_date,
+        path="./",
+        fields=None,
+        sub_account_ids=None,
+        incremental=False,
+        sink=None,
     ):
         """Save insight ads data to excel files
 
@@ -108,21 +187,69 @@ class FBConnection(BaseConnection):
             path (str): path or directory
             fields (list(str)): fields list
             sub_account_ids:
+            incremental (bool): only fetch the days after the last sync
+            sink (BaseSink): columnar output replacing the excel files
         Returns:
             None
         """
+        run_sync(
+            self.save_insight_ads_accounts_to_excel_async(
+                start_date,
+                end_date,
+                path,
+                fields,
+                sub_account_ids,
+                incremental,
+                sink,
+            )
+        )
 
+    async def save_insight_ads_accounts_to_excel_async(
+        self,
+        start_date,
+        end_date,
+        path="./",
+        fields=None,
+        sub_account_ids=None,
+        incremental=False,
+        sink=None,
+    ):
+        """`save_insight_ads_accounts_to_excel` for async code, awaited on
+        the running event loop"""
+        loop = asyncio.get_running_loop()
+        sub_accounts = await loop.run_in_executor(
+            self.get_executor(), self.get_sub_accounts
+        )
+        sub_accounts = [s["id"] for s in sub_accounts]
         if sub_account_ids is None:
-            sub_account_ids = [s["id"] for s in self.get_sub_accounts()]
+            sub_account_ids = sub_accounts
+        else:
+            sub_account_ids = [id for id in sub_account_ids if id in sub_accounts]
 
         if not os.path.exists(path):
             raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
 
-        for id in sub_account_ids:
-            if id in self.get_sub_accounts():
-                self.save_insight_ads_data_for_account_to_excel(
-                    id, start_date, end_date, f"{path}/{id}.xls", fields
+        if fields is None:
+            fields = FBConnection.get_ads_insights_variable_list()
+        if sink is not None:
+            with sink:
+                await self.save_sub_accounts_report(
+                    sub_account_ids,
+                    start_date,
+                    end_date,
+                    fields,
+                    sink,
+                    incremental=incremental,
                 )
+            return
+        await self.save_sub_accounts_report_to_excel(
+            sub_account_ids,
+            start_date,
+            end_date,
+            fields,
+            path,
+            incremental=incremental,
+        )
 
     async def save_insight_ads_data_for_account_to_excel(
         self, ad_account_id, start_date, end_date, file_path, fields=None
@@ -148,24 +275,21 @@ class FBConnection(BaseConnection):
         if df_insight:
             df_insight.to_excel(file_path, index=False, merge_cells=True)
 
-    @staticmethod
-    async def wait_for_async_job(job):
-        for loop in range(TIMEOUT):
-            logger.debug("wait start")
-            ts = time.time()
-            if loop == TIMEOUT - 1:
-                raise FBTimeOut
-            job = job.api_get()
-            status = job[AdReportRun.Field.async_status]
-            name = job[AdReportRun.Field.account_id]
-            if status == "Job Completed":
-                return job.get_result()
-            te = time.time() - ts
-            logger.debug(f"wait take {te} seconds")
-            logger.debug(f"{name} {status} {loop} Wait for report complete")
-            await asyncio.sleep(20)
+    async def wait_for_async_job(self, job):
+        """Wait for an insights report job along with the jobs of the other
+        accounts and return its result cursor"""
+        try:
+            return await self.job_poller.wait(
+                functools.partial(async_job_state, job),
+                name=f"insights {job.get_id()}",
+                timeout=TIMEOUT,
+            )
+        except JobPollTimeout:
+            raise FBTimeOut
 
     def extract_connection_info(self):
+        from facebook import GraphAPI
+
         graph = GraphAPI(self.access_token)
         user_info = graph.get_object("me", fields="id,name,email")
         data = {
@@ -0,0 +1,224 @@
+"""
+Canonical fact schema shared by the reports of every provider
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+from APIConnection.dtypes import concat_frames
+
+FACT_COLUMNS = [
+    "provider",
+    "account",
+    "campaign",
+    "date",
+    "impressions",
+    "clicks",
+    "spend",
+    "conversions",
+]
+_DIMENSIONS = ("account", "campaign")
+_COUNTS = ("impressions", "clicks")
+_AMOUNTS = ("spend", "conversions")
+
+MICROS = 1e-6
+
+# A source column, or a (source column, factor) pair for unit conversions
+Source = Union[str, Tuple[str, float]]
+
+# Source columns of every fact column, per provider. Names are matched the
+# way BaseConnection.normalize_columns writes them, lowercase with spaces
+# replaced by underscores, and the first source present in a report wins
+FACT_MAPPINGS: Dict[str, Dict[str, Sequence[Source]]] = {
+    "tradedesk": {
+        "account": ["advertiser_id", "partner_id"],
+        "campaign": ["campaign", "campaign_id"],
+        "date": ["date"],
+        "impressions": ["impressions"],
+        "clicks": ["clicks"],
+        "spend": ["advertiser_cost_(usd)", "partner_cost_(usd)"],
+        "conversions": ["total_click_+_view_conversions"],
+    },
+    "facebook": {
+        "account": ["account_id", "account_name"],
+        "campaign": ["campaign_name", "campaign_id"],
+        "date": ["date_start"],
+        "impressions": ["impressions"],
+        "clicks": ["clicks"],
+        "spend": ["spend"],
+        "conversions": ["conversions"],
+    },
+    "twitter": {
+        # The reports only name the account, its ID is passed to to_facts
+        "account": [],
+        "campaign": ["campaign_name", "campaign_id"],
+        "date": ["date_start"],
+        "impressions": ["impressions"],
+        "clicks": ["clicks"],
+        # billed_charge_local_micro
+        "spend": [("spend", MICROS)],
+        "conversions": [],
+    },
+    "linkedin": {
+        "account": ["account_id"],
+        "campaign": ["campaign_id"],
+        "date": ["start_date"],
+        "impressions": ["impressions"],
+        "clicks": ["clicks"],
+        "spend": ["costinlocalcurrency", "costinusd"],
+        "conversions": ["externalwebsiteconversions"],
+    },
+    "dv360": {
+        "account": ["advertiser_id", "advertiser"],
+        "campaign": ["insertion_order", "campaign"],
+        "date": ["date_start"],
+        "impressions": ["impressions"],
+        "clicks": ["clicks"],
+        # The budget copied to `spend` by parse_report_csv is a fallback
+        "spend": [
+            "revenue_(adv_currency)",
+            "total_media_cost_(advertiser_currency)",
+            "spend",
+        ],
+        "conversions": ["total_conversions"],
+    },
+    "google_ads": {
+        "account": ["customer.id", "customer.descriptive_name"],
+        "campaign": ["campaign.name", "campaign.id"],
+        "date": ["segments.date"],
+        "impressions": ["metrics.impressions"],
+        "clicks": ["metrics.clicks"],
+        "spend": [("metrics.cost_micros", MICROS)],
+        "conversions": ["metrics.conversions"],
+    },
+}
+
+
+def _normalize(name) -> str:
+    return str(name).lower().replace(" ", "_")
+
+
+def _pick(
+    df: DataFrame, columns: Dict[str, str], sources: Sequence[Source]
+) -> Tuple[Optional[Series], float]:
+    """First source column present in `df` and its factor"""
+    for source in sources:
+        name, factor = (source, 1.0) if isinstance(source, str) else source
+        column = columns.get(_normalize(name))
+        if column is not None:
+            return df[column], factor
+    return None, 1.0
+
+
+def _numbers(series: Optional[Series], factor: float, length: int) -> Series:
+    if series is None:
+        return pd.Series(np.nan, index=range(length), dtype="float64")
+    try:
+        values = pd.to_numeric(series, errors="coerce")
+    except TypeError:
+        # Lists or dicts, e.g. the actions of Facebook insights
+        return pd.Series(np.nan, index=range(length), dtype="float64")
+    values = values.astype("float64").reset_index(drop=True)
+    return values * factor if factor != 1.0 else values
+
+
+def _dates(series: Optional[Series], length: int) -> Series:
+    if series is None:
+        return pd.Series(pd.NaT, index=range(length), dtype="datetime64[ns]")
+    dates = pd.to_datetime(series.reset_index(drop=True), errors="coerce")
+    if dates.dt.tz is not None:
+        # Keep the day of the report, not the day in UTC
+        dates = dates.dt.tz_localize(None)
+    return dates.dt.normalize().astype("datetime64[ns]")
+
+
+def _labels(series: Optional[Series], default: Optional[str], length: int) -> Series:
+    if series is None:
+        return pd.Series(default, index=range(length), dtype="category")
+    labels = series.reset_index(drop=True).astype("category")
+    categories = labels.cat.categories.astype(str)
+    if categories.is_unique:
+        return labels.cat.rename_categories(categories)
+    # e.g. 1 and "1" in the same column
+    text = labels.astype(object).where(labels.isna(), labels.astype(str))
+    return text.astype("category")
+
+
+def to_facts(
+    df: DataFrame,
+    provider: str,
+    account: Optional[str] = None,
+    mapping: Optional[Dict[str, Sequence[Source]]] = None,
+) -> DataFrame:
+    """Turn the report of a connector into the canonical fact schema
+
+    Every fact column is a rename and, for micro amounts, a multiplication
+    of a whole report column, no per-row code runs. The result has the
+    columns of `FACT_COLUMNS` with the same dtypes whatever the provider:
+    categoricals for provider, account and campaign, datetime64 days,
+    nullable integer impressions and clicks, float spend and conversions.
+    Facts without a source column in the report are left empty.
+
+    Args:
+        df (DataFrame): report of a connector, raw or normalized column names
+        provider (str): key of `FACT_MAPPINGS`, e.g. BaseConnection.provider
+        account (str): account of the report, used when the report has no
+            account column
+        mapping (dict): sources of every fact column, overriding the mapping
+            of the provider
+
+    Returns:
+        DataFrame
+    """
+    if mapping is None:
+        if provider not in FACT_MAPPINGS:
+            raise ValueError(
+                f"No fact mapping for {provider}, "
+                f"expected one of {', '.join(FACT_MAPPINGS)}"
+            )
+        mapping = FACT_MAPPINGS[provider]
+    columns = {}
+    for column in df.columns:
+        columns.setdefault(_normalize(column), column)
+    length = len(df)
+
+    facts = {"provider": pd.Series([provider] * length, dtype="category")}
+    for fact in _DIMENSIONS:
+        series, _ = _pick(df, columns, mapping.get(fact, ()))
+        facts[fact] = _labels(series, account if fact == "account" else None, length)
+    facts["date"] = _dates(_pick(df, columns, mapping.get("date", ()))[0], length)
+    for fact in _COUNTS:
+        values = _numbers(*_pick(df, columns, mapping.get(fact, ())), length)
+        facts[fact] = values.round().astype("Int64")
+    for fact in _AMOUNTS:
+        facts[fact] = _numbers(*_pick(df, columns, mapping.get(fact, ())), length)
+    return pd.DataFrame(facts, columns=FACT_COLUMNS)
+
+
+def concat_facts(frames: Iterable[DataFrame]) -> DataFrame:
+    """Stack fact frames of any providers into one table
+
+    The frames share their dtypes, so this is a single concatenation with
+    the categories of the label columns unioned.
+    """
+    frames: List[DataFrame] = [df for df in frames if df is not None and len(df)]
+    if not frames:
+        return pd.DataFrame(
+            {column: pd.Series(dtype=dtype) for column, dtype in _empty_dtypes()}
+        )
+    return concat_frames(frames, ignore_index=True)
+
+
+def _empty_dtypes():
+    for column in FACT_COLUMNS:
+        if column in ("provider",) + _DIMENSIONS:
+            yield column, "category"
+        elif column == "date":
+            yield column, "datetime64[ns]"
+        elif column in _COUNTS:
+            yield column, "Int64"
+        else:
+            yield column, "float64"
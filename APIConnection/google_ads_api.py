@@ -1,18 +1,17 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
 from typing import Dict, List
 
 import pandas as pd
 from google.ads.googleads.client import GoogleAdsClient
 
-from APIConnection.settings import GOOGLE_ADS_YAML, GOOGLE_ADS_FIELDS
+from APIConnection.dtypes import compact_dtypes, concat_frames
+from APIConnection.settings import COMPACT_DTYPES, GOOGLE_ADS_YAML, GOOGLE_ADS_FIELDS
 
 QUERY_TABLE = "campaign"
 FILTER_FIELD = "segments.date"
 
-# logging.basicConfig(filename="google_ads.log", level=logging.DEBUG)
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
-
 
 class GoogleAds:
     """Wrapper class for fetching/parsing Googleads endpoints"""
@@ -176,8 +175,15 @@ class GoogleAds:
                 )
         return list_child_acc
 
-    def save_ads_data_to_excel(self, start_date, end_date, dir="./"):
-        """pull and save data to csv"""
+    def save_ads_data_to_excel(
+        self, start_date, end_date, dir="./", sink=None, journal=None
+    ):
+        """pull and save data to csv, or to `sink` customer by customer
+
+        With a `journal` (RunJournal) the customers already saved by an
+        interrupted run are skipped, and every customer is appended to the csv
+        as soon as it is pulled instead of at the end of the run.
+        """
 
         def _build_query(
                 SELECT=list,
@@ -201,7 +207,7 @@ class GoogleAds:
                 query += " ASC"
             return query
 
-        df_main = pd.DataFrame()
+        dfs = []
         list_child_acc = self.all_child_acc(self.googleads_client)
 
         query = _build_query(
@@ -212,28 +218,69 @@ class GoogleAds:
             END_DATE=end_date,
             ORDER=FILTER_FIELD,
         )
+        filename = f"{dir}/{self.main_manager_account}_{start_date}-{end_date}.csv"
+
+        def is_done(customer_id):
+            return journal is not None and journal.is_done(
+                "google_ads", customer_id, start_date, end_date
+            )
+
+        def save(customer_id, df):
+            if sink is not None:
+                sink.write(df, "google_ads", customer_id, FILTER_FIELD)
+                output = sink.account_output("google_ads", customer_id)
+                if journal is not None:
+                    sink.finish("google_ads", customer_id)
+            elif journal is not None:
+                df.to_csv(
+                    filename,
+                    mode="a",
+                    header=not os.path.exists(filename),
+                    index=False,
+                )
+                output = filename
+            else:
+                dfs.append(df)
+            if journal is not None:
+                journal.record(
+                    "google_ads",
+                    customer_id,
+                    start_date,
+                    end_date,
+                    output=output,
+                    rows=len(df),
+                )
+
         for acc in list_child_acc:
+            if is_done(str(acc[0])):
+                continue
             try:
-                df = self.get_customer_data(str(acc[0]), query)
-                df_main = df_main.append(df)
+                save(str(acc[0]), self.get_customer_data(str(acc[0]), query))
             except Exception as e:
                 logging.error(f"Can not download data from {acc}. Detail {e}")
 
         for customer in self.get_all_customer_ids():
+            if is_done(str(customer)):
+                continue
             try:
                 yaml_file = self._change_customer_id_yaml(self.yaml_file, customer)
                 self.googleads_client = GoogleAdsClient.load_from_storage(
                     yaml_file, version="v8"
                 )
-                df = self.get_customer_data(str(customer), query)
-                df_main = df_main.append(df)
+                save(str(customer), self.get_customer_data(str(customer), query))
             except Exception as e:
                 logging.error(f"Can not download data from {customer}. Detail {e}")
-        filename = f"{dir}/{self.main_manager_account}_{start_date}-{end_date}.csv"
+        if sink is not None:
+            sink.close()
+            return
+        if journal is not None:
+            return
+        df_main = concat_frames(dfs)
         df_main.to_csv(filename, index=False)
 
     def get_customer_data(self, customer_id, query):
-        """get customer data given cutomer id and query"""
+        """get customer data given cutomer id and query, values are returned
+        as strings by the API and converted to compact dtypes"""
         ga_service = self.googleads_client.get_service("GoogleAdsService")
         # Issues a search request using streaming.
         search_request = self.googleads_client.get_type("SearchGoogleAdsStreamRequest")
@@ -257,6 +304,8 @@ class GoogleAds:
                 all_data.append(single_row)
 
         df = pd.DataFrame(all_data)
+        if COMPACT_DTYPES:
+            df = compact_dtypes(df, FILTER_FIELD)
         return df
 
     def extract_connection_info(self) -> Dict:
@@ -1,14 +1,16 @@
-import logging
+import os
 from pprint import pprint
 from typing import List, Dict, Any, Optional
 
 import httplib2
 import pandas as pd
-from googleapiclient.discovery import build
 from oauth2client import client
 from oauth2client import file
 from oauth2client import tools
 
+from APIConnection.credentials import credential_name, oauth2_credentials
+from APIConnection.discovery_cache import discovery_cache
+
 # from apiclient.discovery import build
 
 SCOPES = [
@@ -21,14 +23,10 @@ CLIENT_SECRETS_PATH = '/home/quydx/Desktop/APIConnection/client_secret.json'
 # VIEW_ID = '107519727'
 
 
-# logging.basicConfig(filename="google_analyst.log", level=logging.DEBUG)
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
-
-
 class GoogleAnalyst:
     """Wrapper class for fetching/parsing GoogleAnalyst endpoints"""
 
-    def __init__(self, connection_id: Optional[str]):
+    def __init__(self, connection_id: Optional[str] = None):
         self.client = client.flow_from_clientsecrets(
             CLIENT_SECRETS_PATH, scope=SCOPES,
             message=tools.message_if_missing(CLIENT_SECRETS_PATH)
@@ -36,15 +34,11 @@ class GoogleAnalyst:
         self.cached_credential_path = (
             f"{connection_id}_analyticsreporting.dat" if connection_id else "analyticsreporting.dat"
         )
+        self._service = None
 
     def get_summaries(self):
-        storage = file.Storage(self.cached_credential_path)
-        credentials = storage.get()
-        if credentials is None or credentials.invalid:
-            credentials = tools.run_flow(self._flow, storage)
-        print("test")
-        http = credentials.authorize(http=httplib2.Http())
-        analytics = build('analytics', 'v3', http=http)
+        http = self._credentials().authorize(http=httplib2.Http())
+        analytics = discovery_cache.build('analytics', 'v3', http=http)
         return analytics.management().accountSummaries().list().execute()
 
     @property
@@ -54,9 +48,15 @@ class GoogleAnalyst:
             message=tools.message_if_missing(CLIENT_SECRETS_PATH)
         )
 
-    @property
-    def _analytics(self):
-        # Prepare credentials, and authorize HTTP object with them.
+    def _credentials(self):
+        # Credentials come from the shared credential cache, which refreshes
+        # them before they expire, and are only read from the storage once
+        return oauth2_credentials(
+            credential_name("google_analytics", os.path.abspath(self.cached_credential_path)),
+            self._load_credentials,
+        )
+
+    def _load_credentials(self):
         # If the credentials don't exist or are invalid run through the native client
         # flow. The Storage object will ensure that if successful the good
         # credentials will get written back to a file.
@@ -64,10 +64,16 @@ class GoogleAnalyst:
         credentials = storage.get()
         if credentials is None or credentials.invalid:
             credentials = tools.run_flow(self._flow, storage)
-        http = credentials.authorize(http=httplib2.Http())
-        # Build the service object.
-        analytics = build('analyticsreporting', 'v4', http=http)
-        return analytics
+        return credentials
+
+    @property
+    def _analytics(self):
+        # Build the service object once, the authorized HTTP object refreshes
+        # the access token itself
+        if self._service is None:
+            http = self._credentials().authorize(http=httplib2.Http())
+            self._service = discovery_cache.build('analyticsreporting', 'v4', http=http)
+        return self._service
 
     def get_report(self, view_id, start_date, end_date):
         # Use the Analytics Service Object to query the Analytics Reporting API V4.
@@ -107,8 +113,12 @@ class GoogleAnalyst:
 
         return df
 
-    def save_data_to_csv(self, view_id, start_date, end_date, dir="./"):
+    def save_data_to_csv(self, view_id, start_date, end_date, dir="./", sink=None):
         df_main = self.get_report(view_id, start_date, end_date)
+        if sink is not None:
+            with sink:
+                sink.write(df_main, "google_analytics", view_id)
+            return
         filename = f"{dir}/{view_id}_{start_date}-{end_date}.csv"
         df_main.to_csv(filename, index=False)
 
@@ -1,8 +1,10 @@
+import asyncio
 import io
 import os
 import argparse
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from csv import reader, writer
 from pprint import pprint
 import httplib2
@@ -10,7 +12,6 @@ import logging
 from datetime import date, timedelta
 
 from googleapiclient import http
-from googleapiclient import discovery
 
 from oauth2client import client
 from oauth2client import file as oauthFile
@@ -19,9 +20,11 @@ from oauth2client import tools
 
 from .settings import GOOGLE_COMPAIGN_MANAGER_REPORT, GOOGLE_CLIENT_SECRET
 from . import dfareporting_utils
+from .discovery_cache import discovery_cache
+from .exceptions import JobPollTimeout
+from .job_poller import JobPoller, JobState, wait_for_job
+from .metrics import BYTES_DOWNLOADED
 
-# logging.basicConfig(filename="google_campaign_manager.log", level=logging.DEBUG)
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
 
 SUCCESS = True
 FAIL = False
@@ -70,8 +73,8 @@ class GoogleCampaignManager:
         # Use the credentials to authorize an httplib2.Http instance.
         http = credentials.authorize(httplib2.Http())
 
-        # Construct a service object via the discovery service.
-        service = discovery.build("dfareporting", "v3.4", http=http)
+        # Construct a service object from the cached discovery document.
+        service = discovery_cache.build("dfareporting", "v3.4", http=http)
         return service
 
     def get_profile_id(self):
@@ -111,23 +114,72 @@ class GoogleCampaignManager:
         response = request.execute()
 
     def get_all_report_files(self, start_date, end_date):
-        """loop through all reports declared in config file and download them"""
-        for report_config in GOOGLE_COMPAIGN_MANAGER_REPORT:
-            profile_id, report_id = (
-                report_config["profile_id"],
-                report_config["report_id"],
-            )
+        """Run all reports declared in config file, poll them together and
+        download each of them as soon as it is available"""
+        asyncio.run(self._get_all_report_files(start_date, end_date))
+
+    async def _get_all_report_files(self, start_date, end_date):
+        # The service object is not thread safe, a single thread runs the
+        # polls and the downloads one at a time
+        executor = ThreadPoolExecutor(max_workers=1)
+        poller = JobPoller(executor=executor, name="gcm")
+        loop = asyncio.get_running_loop()
+        pending = {}
+        try:
+            for report_config in GOOGLE_COMPAIGN_MANAGER_REPORT:
+                profile_id, report_id = (
+                    report_config["profile_id"],
+                    report_config["report_id"],
+                )
 
-            # update date range for the report
-            if self.update_date_range_for_report(
-                profile_id, report_id, start_date, end_date
-            ):
-                # pull data with updated report
-                self.get_report_content(
-                    profile_id, report_id, f"{profile_id}_{report_id}.csv"
+                # update date range for the report
+                updated = await loop.run_in_executor(
+                    executor,
+                    self.update_date_range_for_report,
+                    profile_id,
+                    report_id,
+                    start_date,
+                    end_date,
                 )
-            else:
-                logging.error(f"Can not set date range for report {report_id}")
+                if not updated:
+                    logging.error(f"Can not set date range for report {report_id}")
+                    continue
+                # run the updated report and poll its file with the others
+                file_id = await loop.run_in_executor(
+                    executor, self.run_report, profile_id, report_id
+                )
+                future = poller.submit(
+                    partial(self.report_file_state, report_id, file_id),
+                    name=f"report {report_id}",
+                )
+                pending[future] = (profile_id, report_id, file_id)
+
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    profile_id, report_id, file_id = pending.pop(future)
+                    if future.exception() is not None:
+                        logging.error(
+                            f"Can not get report {report_id}. Detail {future.exception()}"
+                        )
+                        continue
+                    await loop.run_in_executor(
+                        executor,
+                        self.download_report_file,
+                        report_id,
+                        file_id,
+                        f"{profile_id}_{report_id}.csv",
+                    )
+        except client.AccessTokenRefreshError:
+            print(
+                "The credentials have been revoked or expired, please re-run the application to re-authorize"
+            )
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def update_date_range_for_report(self, profile_id, report_id, start_date, end_date):
         """Update report id with new date range"""
@@ -154,58 +206,57 @@ class GoogleCampaignManager:
             filename(str): the name of file download to
         """
         try:
-            # construct a get request for the specified report
-            request = self.service.reports().run(
-                profileId=profile_id, reportId=report_id
-            )
-            result = request.execute()
-            file_id = result["id"]
-            report_file = (
-                self.service.files().get(reportId=report_id, fileId=file_id).execute()
-            )
-            out_file = io.FileIO(filename, mode="wb")
-            # check status of report file
-            request = (
-                self.service.reports()
-                .files()
-                .list(profileId=profile_id, reportId=report_id)
-            )
-            response = request.execute()
-
-            while response["items"][0]["status"] != "REPORT_AVAILABLE":
-                time.sleep(30)  # delay for 30 seconds before checking again
-                request = (
-                    self.service.reports()
-                    .files()
-                    .list(profileId=profile_id, reportId=report_id)
-                )
-                response = request.execute()
-
-            request = self.service.files().get_media(
-                reportId=report_id, fileId=file_id
-            )  # construct request to download file
-
-            # Create a media downloader instance.
-            # Optional: adjust the chunk size used when downloading the file.
-            downloader = http.MediaIoBaseDownload(
-                out_file, request, chunksize=CHUNK_SIZE
-            )
-
-            # Execute the get request and download the file.
-            download_finished = False
-            while download_finished is False:
-                _, download_finished = downloader.next_chunk()
-
-            print(
-                "File %s downloaded to %s"
-                % (report_file["id"], os.path.realpath(out_file.name))
+            file_id = self.run_report(profile_id, report_id)
+            # check status of report file until it is available
+            wait_for_job(
+                partial(self.report_file_state, report_id, file_id),
+                name=f"report {report_id}",
             )
+            self.download_report_file(report_id, file_id, filename)
 
+        except JobPollTimeout as e:
+            logging.error(e)
         except client.AccessTokenRefreshError:
             print(
                 "The credentials have been revoked or expired, please re-run the application to re-authorize"
             )
 
+    def run_report(self, profile_id, report_id):
+        """Run a report and return the ID of the file being generated"""
+        # construct a get request for the specified report
+        request = self.service.reports().run(profileId=profile_id, reportId=report_id)
+        result = request.execute()
+        return result["id"]
+
+    def report_file_state(self, report_id, file_id) -> JobState:
+        """Check the status of a report file"""
+        report_file = (
+            self.service.files().get(reportId=report_id, fileId=file_id).execute()
+        )
+        status = report_file["status"]
+        if status in ("FAILED", "CANCELLED"):
+            raise Exception(f"Report file {file_id} of report {report_id} {status}")
+        return JobState(status == "REPORT_AVAILABLE", report_file)
+
+    def download_report_file(self, report_id, file_id, filename):
+        """Download an available report file"""
+        out_file = io.FileIO(filename, mode="wb")
+        request = self.service.files().get_media(
+            reportId=report_id, fileId=file_id
+        )  # construct request to download file
+
+        # Create a media downloader instance.
+        # Optional: adjust the chunk size used when downloading the file.
+        downloader = http.MediaIoBaseDownload(out_file, request, chunksize=CHUNK_SIZE)
+
+        # Execute the get request and download the file.
+        download_finished = False
+        while download_finished is False:
+            _, download_finished = downloader.next_chunk()
+
+        BYTES_DOWNLOADED.inc(os.path.getsize(out_file.name), provider="gcm")
+        print("File %s downloaded to %s" % (file_id, os.path.realpath(out_file.name)))
+
     def find_report(self, profile_id, by_name):
         """Find report by name"""
 
@@ -1,57 +1,60 @@
 import datetime
-from time import sleep
 from datetime import date, timedelta
 from functools import partial
 import logging
+from typing import Optional
 
 import pandas as pd                        
 from pytrends.request import TrendReq
 from pytrends.exceptions import ResponseError
 
+from .rate_limiter import rate_limiter
+from .retry import Retry, RetryPolicy, get_breaker
 from .utils import get_last_date_of_month, convert_dates_to_timeframe
 
-# logging.basicConfig(filename="google_trends.log", level=logging.DEBUG)
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+PROVIDER = "google_trends"
+# Google answers too many requests with errors for about a minute
+FETCH_RETRY = Retry(
+    RetryPolicy(exceptions=(ResponseError,), initial=60, maximum=180, multiplier=1.5),
+    breaker=get_breaker(PROVIDER),
+)
 
 
 class GoogleTrends:
     """Wrapper class for fetching/parsing Google Trends endpoints"""
+
+    @staticmethod
+    def _build_payload(build_payload, timeframe: str):
+        """Call build_payload through the rate limiter, which slows down on
+        the 429 responses of Google"""
+        rate_limiter.acquire(PROVIDER)
+        try:
+            build_payload(timeframe=timeframe)
+        except ResponseError as err:
+            rate_limiter.update_from_response(PROVIDER, "default", err.response)
+            raise
+        rate_limiter.update(PROVIDER, "default", 200, None)
+
+    @staticmethod
+    def _set_wait_time(wait_time: Optional[float]):
+        if wait_time:
+            rate_limiter.bucket(PROVIDER).set_rate(1 / wait_time)
     
     def _fetch_data(self, pytrends, build_payload, timeframe: str) -> pd.DataFrame:
         """Attempts to fecth data and retries in case of a ResponseError."""
-        attempts, fetched = 0, False
-        while not fetched:
-            try:
-                build_payload(timeframe=timeframe)
-            except ResponseError as err:
-                print(err)
-                print(f'Trying again in {60 + 5 * attempts} seconds.')
-                sleep(60 + 5 * attempts)
-                attempts += 1
-                if attempts > 3:
-                    print('Failed after 3 attemps, abort fetching.')
-                    break
-            else:
-                fetched = True
+        try:
+            FETCH_RETRY.call(self._build_payload, build_payload, timeframe)
+        except ResponseError as err:
+            logging.warning(f'{err}. Failed after retrying, abort fetching.')
         return pytrends.interest_over_time()
 
 
     def _fetch_data_region(self, pytrends, build_payload,resolution:str, timeframe: str) -> pd.DataFrame:
         """Attempts to fecth data and retries in case of a ResponseError."""
-        attempts, fetched = 0, False
-        while not fetched:
-            try:
-                build_payload(timeframe=timeframe)
-            except ResponseError as err:
-                logging.warning(err)
-                logging.info(f'Trying again in {60 + 5 * attempts} seconds.')
-                sleep(60 + 5 * attempts)
-                attempts += 1
-                if attempts > 3:
-                    logging.warning('Failed after 3 attemps, abort fetching.')
-                    break
-            else:
-                fetched = True
+        try:
+            FETCH_RETRY.call(self._build_payload, build_payload, timeframe)
+        except ResponseError as err:
+            logging.warning(f'{err}. Failed after retrying, abort fetching.')
         return pytrends.interest_by_region(resolution)
 
     def save_daily_data_date_range_to_csv(self, 
@@ -60,7 +63,7 @@ class GoogleTrends:
                     end_date: str,
                     geo: str = 'US',
                     verbose: bool = True,
-                    wait_time: float = 5.0,
+                    wait_time: Optional[float] = None,
                     filename:str = './google_trends.csv'):
         """Save the daily data to csv"""
         
@@ -81,7 +84,7 @@ class GoogleTrends:
                     stop_mon: int,
                     geo: str = 'US',
                     verbose: bool = True,
-                    wait_time: float = 5.0) -> pd.DataFrame:
+                    wait_time: Optional[float] = None) -> pd.DataFrame:
         """Given a word, fetches daily search volume data from Google Trends and
         returns results in a pandas DataFrame.
         Details: Due to the way Google Trends scales and returns data, special
@@ -101,6 +104,8 @@ class GoogleTrends:
             geo (str): geolocation
             verbose (bool): If True, then prints the word and current time frame
                 we are fecthing the data for.
+            wait_time (float): initial seconds between two requests, adapted
+                afterwards by the rate limiter
         Returns:
             complete (pd.DataFrame): Contains 4 columns.
                 The column named after the word argument contains the daily search
@@ -125,6 +130,9 @@ class GoogleTrends:
         build_payload = partial(pytrends.build_payload,
                                 kw_list=[word], cat=0, geo=geo, gprop='')
 
+        # Requests are paced by the rate limiter, don't go too fast or Google
+        # will send 429s
+        self._set_wait_time(wait_time)
         # Obtain monthly data for all months in years [start_year, stop_year]
         monthly = self._fetch_data(pytrends, build_payload,
                             convert_dates_to_timeframe(start_date, stop_date))
@@ -140,7 +148,6 @@ class GoogleTrends:
                 print(f'{word}:{timeframe}')
             results[current] = self._fetch_data(pytrends, build_payload, timeframe)
             current = last_date_of_month + timedelta(days=1)
-            sleep(wait_time)  # don't go too fast or Google will send 429s
 
         daily = pd.concat(results.values()).drop(columns=['isPartial'])
         complete = daily.join(monthly, lsuffix='_unscaled', rsuffix='_monthly')
@@ -160,7 +167,7 @@ class GoogleTrends:
                  stop_mon: int,
                  geo: str = 'US',
                  resolution: str='CITY',
-                 wait_time: float = 5.0) -> pd.DataFrame:
+                 wait_time: Optional[float] = None) -> pd.DataFrame:
 
         # Set up start and stop dates
         start_date = date(start_year, start_mon, 1) 
@@ -172,8 +179,8 @@ class GoogleTrends:
         build_payload = partial(pytrends.build_payload,
                                 kw_list=[word], cat=0, geo=geo, gprop='')
 
+        self._set_wait_time(wait_time)
         # Obtain monthly data for all months in years [start_year, stop_year]
         IBR = self._fetch_data_region(pytrends, build_payload,resolution,
                             convert_dates_to_timeframe(start_date, stop_date))
-        sleep(wait_time)  # don't go too fast or Google will send 429s
         return IBR
\ No newline at end of file
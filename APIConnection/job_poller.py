@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+from concurrent.futures import Executor
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from APIConnection.exceptions import JobPollTimeout
+from APIConnection.logger import logger
+from APIConnection.metrics import JOB_POLLS, JOB_SECONDS
+from APIConnection.settings import (
+    POLL_BACKOFF,
+    POLL_MAX_INTERVAL,
+    POLL_MIN_INTERVAL,
+)
+from APIConnection.tracing import tracer
+from APIConnection.utils import run_sync
+
+
+class JobState(NamedTuple):
+    """Status of a report job returned by the check functions
+
+    Attributes:
+        done (bool): whether the job completed
+        result (Any): value resolving the job once it is done
+        progress (float): completion between 0 and 1, if the API reports it
+    """
+
+    done: bool
+    result: Any = None
+    progress: Optional[float] = None
+
+
+class _Job:
+    def __init__(
+        self,
+        check: Callable,
+        name: str,
+        future: asyncio.Future,
+        started: float,
+        deadline: Optional[float],
+        interval: float,
+    ):
+        self.check = check
+        self.name = name
+        self.future = future
+        self.started = started
+        self.deadline = deadline
+        self.interval = interval
+
+
+class JobPoller:
+    """Poll many outstanding report jobs from a single loop
+
+    Every job is registered with a check function returning its `JobState`
+    and resolves its own future, so a finished job can be downloaded while
+    the others keep polling. Jobs are first checked right away, then the
+    interval grows by `backoff` between `min_interval` and `max_interval`.
+    When the API reports the progress of a job, the next poll is scheduled
+    halfway to its estimated completion instead.
+
+    Blocking check functions run on `executor`, coroutine functions are
+    awaited.
+
+    Args:
+        min_interval (float): shortest delay between two polls of a job
+        max_interval (float): longest delay between two polls of a job
+        backoff (float): growth factor of the interval without progress hint
+        timeout (float): default seconds before a job fails with
+            `JobPollTimeout`, None for no timeout
+        executor (Executor): executor of the blocking checks, None for the
+            default executor of the event loop
+        name (str): provider of the jobs in the metrics
+    """
+
+    def __init__(
+        self,
+        min_interval: float = POLL_MIN_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        backoff: float = POLL_BACKOFF,
+        timeout: Optional[float] = None,
+        executor: Optional[Executor] = None,
+        name: Optional[str] = None,
+    ):
+        self.name = name or "default"
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.executor = executor
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._queue: List[Tuple[float, int, _Job]] = []
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._polls = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs not resolved yet"""
+        return len(self._queue) + self._in_flight
+
+    def submit(
+        self,
+        check: Callable[[], JobState],
+        name: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> asyncio.Future:
+        """Start polling a job
+
+        Args:
+            check (callable): returns the `JobState` of the job, exceptions
+                fail the job
+            name (str): name of the job in the logs
+            timeout (float): overrides the default timeout of the poller
+
+        Returns:
+            asyncio.Future: resolved with the result of the job
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The poller is reused by successive `asyncio.run`
+            self._loop = loop
+            self._task = None
+            self._queue = []
+            self._in_flight = 0
+            self._polls = set()
+            self._wakeup = asyncio.Event()
+        timeout = self.timeout if timeout is None else timeout
+        now = loop.time()
+        job = _Job(
+            check,
+            name or getattr(check, "__name__", "job"),
+            loop.create_future(),
+            now,
+            now + timeout if timeout is not None else None,
+            self.min_interval,
+        )
+        self._schedule(job, now)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        return job.future
+
+    async def wait(
+        self,
+        check: Callable[[], JobState],
+        name: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Poll a job until it completes and return its result"""
+        with tracer.span("poll", job=name):
+            return await self.submit(check, name, timeout)
+
+    def _schedule(self, job: _Job, at: float) -> None:
+        heapq.heappush(self._queue, (at, next(self._counter), job))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._queue or self._in_flight:
+            now = loop.time()
+            while self._queue and self._queue[0][0] <= now:
+                _, _, job = heapq.heappop(self._queue)
+                self._in_flight += 1
+                task = loop.create_task(self._poll(job))
+                # Keep a reference until the poll is done
+                self._polls.add(task)
+                task.add_done_callback(self._polls.discard)
+            self._wakeup.clear()
+            delay = self._queue[0][0] - now if self._queue else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, job: _Job) -> JobState:
+        if inspect.iscoroutinefunction(job.check):
+            return await job.check()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, job.check)
+
+    async def _poll(self, job: _Job) -> None:
+        try:
+            if job.future.done():
+                # Cancelled by the caller
+                return
+            JOB_POLLS.inc(provider=self.name)
+            try:
+                state = await self._check(job)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            if job.future.done():
+                return
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if state.done:
+                logger.debug(f"Job {job.name} done after {now - job.started:.1f}s")
+                JOB_SECONDS.observe(now - job.started, provider=self.name)
+                job.future.set_result(state.result)
+                return
+            if job.deadline is not None and now >= job.deadline:
+                job.future.set_exception(
+                    JobPollTimeout(
+                        f"Job {job.name} not done after {now - job.started:.0f}s"
+                    )
+                )
+                return
+            job.interval = self._next_interval(job, state.progress, now)
+            next_poll = now + job.interval
+            if job.deadline is not None:
+                next_poll = min(next_poll, job.deadline)
+            self._schedule(job, next_poll)
+        finally:
+            self._in_flight -= 1
+            self._wakeup.set()
+
+    def _next_interval(self, job: _Job, progress: Optional[float], now: float) -> float:
+        if progress is not None and 0 < progress < 1:
+            elapsed = now - job.started
+            interval = elapsed * (1 - progress) / progress / 2
+        else:
+            interval = job.interval * self.backoff
+        return min(self.max_interval, max(self.min_interval, interval))
+
+
+def wait_for_job(check: Callable[[], JobState], name: Optional[str] = None, **kwargs):
+    """Poll a single job from synchronous code and return its result, also
+    from a running event loop, see `run_sync`. Async code awaits
+    `JobPoller.wait` instead
+
+    Args:
+        check (callable): returns the `JobState` of the job
+        name (str): name of the job in the logs
+        kwargs: arguments of `JobPoller`
+    """
+    return run_sync(JobPoller(**kwargs).wait(check, name))
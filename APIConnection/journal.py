@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from APIConnection.logger import logger
+
+Unit = Tuple[str, str, str, str]
+
+
+class RunJournal:
+    """Append-only log of the units of work completed by an extraction run
+
+    A unit is the report of one account over one date range of a provider.
+    It is logged once its output is written, as one JSON line flushed to
+    disk, so a run that dies keeps the units it completed. Running again
+    with the same journal skips them and only fetches what is left; the
+    date range is part of the unit, so a run over other dates starts from
+    scratch. Delete the file to redo a run.
+
+    A unit interrupted between its write and its journal entry is fetched
+    and written again; the partitioned sinks replace its earlier output.
+
+    Args:
+        path (str): path of the JSONL file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._units: Dict[Unit, Dict] = {}
+        # The last line of a journal cut short is closed before appending
+        self._newline = False
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for number, line in enumerate(f, 1):
+                    self._newline = not line.endswith("\n")
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Line cut short by the interruption
+                        logger.warning(f"{path}:{number}: skip invalid entry")
+                        continue
+                    self._units[self._key(**entry)] = entry
+            logger.info(f"Resume from {path}, {len(self._units)} units done")
+
+    @staticmethod
+    def _key(provider, account, start_date, end_date, **kwargs) -> Unit:
+        return str(provider), str(account), str(start_date), str(end_date)
+
+    def is_done(
+        self, provider: str, account: str, start_date: str, end_date: str
+    ) -> bool:
+        with self._lock:
+            return self._key(provider, account, start_date, end_date) in self._units
+
+    def get(
+        self, provider: str, account: str, start_date: str, end_date: str
+    ) -> Optional[Dict]:
+        """Journal entry of a completed unit, with its `output` location"""
+        with self._lock:
+            return self._units.get(self._key(provider, account, start_date, end_date))
+
+    def record(
+        self,
+        provider: str,
+        account: str,
+        start_date: str,
+        end_date: str,
+        output: Optional[str] = None,
+        rows: Optional[int] = None,
+    ) -> None:
+        """Log a completed unit
+
+        Args:
+            provider (str): provider name
+            account (str): account ID
+            start_date (str): first day of the unit
+            end_date (str): last day of the unit
+            output (str): file or directory the rows were written to
+            rows (int): number of rows written
+        """
+        entry = {
+            "provider": str(provider),
+            "account": str(account),
+            "start_date": str(start_date),
+            "end_date": str(end_date),
+            "output": output,
+            "rows": rows,
+            "done_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        line = json.dumps(entry)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                if self._newline:
+                    f.write("\n")
+                    self._newline = False
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._units[self._key(**entry)] = entry
@@ -1,19 +1,18 @@
 #!/usr/bin/python3
-import time
-
-import requests
 import pandas
 import sys
 import json
 from datetime import datetime, timedelta
 import datetime
 import re
-import os
 
-sys.path.insert(0, os.path.abspath("../.."))
+from requests import RequestException
 
 from APIConnection.config import linkedin_config
+from APIConnection.exceptions import CircuitOpenError
 from APIConnection.logger import get_logger
+from APIConnection.retry import send_request
+from APIConnection.settings import API_BASE_URLS
 
 logger = get_logger(
     "linkedin", file_name=linkedin_config.LOG_FILE, log_level=linkedin_config.LOG_LEVEL
@@ -40,11 +39,11 @@ def metrics_validation(metrics):
 
 def get_LinkedIn_campaigns_list(access_token, account, camapign_type_json):
     try:
-        url = "https://api.linkedin.com/v2/adCampaignsV2?q=search&search.account.values[0]=urn:li:sponsoredAccount:" + str(account)
+        url = API_BASE_URLS["linkedin"] + "/v2/adCampaignsV2?q=search&search.account.values[0]=urn:li:sponsoredAccount:" + str(account)
 
         headers = {"Authorization": "Bearer " + access_token}
         # make the http call
-        r = requests.get(url=url, headers=headers)
+        r = send_request("linkedin", "adCampaigns", "GET", url, headers=headers)
         # defining the dataframe
         campaign_data_df = pandas.DataFrame(columns=["campaign_name", "campaign_id", "campaign_account",
                                                      "daily_budget", "unit_cost", "objective_type", "campaign_status",
@@ -128,6 +127,13 @@ def get_LinkedIn_campaigns_list(access_token, account, camapign_type_json):
 
 
 def get_LinkedIn_campaign(account, access_token, campaigns_ids, s_date, e_date, qry_type):
+    """Analytics of the campaigns of an account
+
+    Returns:
+        (DataFrame, bool): the analytics, and whether every campaign was
+        fetched; the campaigns whose call failed are skipped. (None, False)
+        on failure
+    """
     try:
         # calling date validation funtion for start_date format check
         startDate = date_validation(s_date)
@@ -150,6 +156,7 @@ def get_LinkedIn_campaign(account, access_token, campaigns_ids, s_date, e_date,
             fields_str_set.append(fields_str)
         base_columns = ['account_id', 'account_name', 'campaign_id', 'start_date', 'end_date', 'week', 'month']
         campaign_analytics_data = pandas.DataFrame(columns=base_columns.extend(metrics))
+        complete = True
         for cmp_id in campaigns_ids:
             campaigns_response_list = []
             for f_str in fields_str_set:
@@ -159,35 +166,39 @@ def get_LinkedIn_campaign(account, access_token, campaigns_ids, s_date, e_date,
                 dateRange_end = "dateRange.end.day=" + str(endDate.day) + "&dateRange.end.month=" + str(
                     endDate.month) + "&dateRange.end.year=" + str(endDate.year)
 
-                url = "https://api.linkedin.com/v2/adAnalyticsV2?q=analytics&pivot=CAMPAIGN&" + dateRange_start + "&" + dateRange_end + "&timeGranularity=ALL&campaigns[0]=urn:li:sponsoredCampaign:" + str(
+                url = API_BASE_URLS["linkedin"] + "/v2/adAnalyticsV2?q=analytics&pivot=CAMPAIGN&" + dateRange_start + "&" + dateRange_end + "&timeGranularity=ALL&campaigns[0]=urn:li:sponsoredCampaign:" + str(
                     cmp_id) + "&fields=" + str(f_str)
                 # print(f"Querying data for with url: {url}")
                 # defining header for authentication
                 headers = {"Authorization": "Bearer " + access_token}
-                # make the http call
-                r = requests.get(url=url, headers=headers)
+                # make the http call, paced by the rate limiter
+                try:
+                    r = send_request("linkedin", "adAnalytics", "GET", url, headers=headers)
+                except (RequestException, CircuitOpenError) as e:
+                    # Failed after the retries, only this campaign is skipped
+                    logger.error(f"*get_LinkedIn_campaign : campaign {cmp_id} skipped : {e!r}")
+                    complete = False
+                    campaigns_response_list = []
+                    break
 
                 if r.status_code != 200:
-                    print(r.json())
                     logger.error(f"*get_LinkedIn_campaign : something went wrong : {r.text}")
+                    complete = False
                 else:
                     response_dict = json.loads(r.text)
-                    print(f"Campaign id = {cmp_id}")
-                    print(f"Response = {response_dict}")
+                    logger.debug(f"Campaign id = {cmp_id}, {len(r.content)} bytes")
                     if "elements" in response_dict:
                         campaigns = response_dict["elements"]
                         if campaigns:
                             campaigns_response_list.append(campaigns)
                     else:
                         logger.error("\nkey *elements* nmissing in JSON data from LinkedIn")
-                time.sleep(2.4)
             flag = False
             cmp_res_data = []
             for cmp_data_set in campaigns_response_list:
                 for i, cmp_data in enumerate(cmp_data_set):
                     if not isinstance(cmp_data, dict):
-                        print(type(cmp_data))
-                        print(cmp_data)
+                        logger.debug(f"Unexpected {type(cmp_data)} campaign data: {cmp_data}")
                     if not flag:
                         cmp_res_data.append(cmp_data)
                     else:
@@ -216,6 +227,7 @@ def get_LinkedIn_campaign(account, access_token, campaigns_ids, s_date, e_date,
                             tmp_dict[metric] = ""
                     campaign_analytics_data = campaign_analytics_data.append(tmp_dict, ignore_index=True)
 
-        return campaign_analytics_data
+        return campaign_analytics_data, complete
     except:
         logger.exception("\n*get_linked_campaigns_analytics Failed :", sys.exc_info())
+        return None, False
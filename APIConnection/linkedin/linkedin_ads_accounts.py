@@ -1,19 +1,21 @@
 #!/usr/bin/python3
 # command to run the code: python3 ./linkedin_ads_account.py
-import requests
 import json
 import pandas
 import sys
 
+from APIConnection.retry import send_request
+from APIConnection.settings import API_BASE_URLS
+
 
 def get_linkedin_ads_account(access_token):
     try:
         account_ids = []
-        url = "https://api.linkedin.com/v2/adAccountsV2?q=search&search.type.values[0]=BUSINESS&search.status.values[0]=ACTIVE"
+        url = API_BASE_URLS["linkedin"] + "/v2/adAccountsV2?q=search&search.type.values[0]=BUSINESS&search.status.values[0]=ACTIVE"
 
         headers = {"Authorization": "Bearer " + access_token}
         # make the http call
-        r = requests.get(url=url, headers=headers)
+        r = send_request("linkedin", "adAccounts", "GET", url, headers=headers)
 
         if r.status_code != 200:
             print("\n ### something went wrong ### ", r)
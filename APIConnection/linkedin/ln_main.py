@@ -6,13 +6,14 @@ import datetime
 import os.path
 import pandas as pd
 
-from .get_ln_campaign_data import *
-from .linkedin_ads_accounts import *
-
-sys.path.insert(0, os.path.abspath("../.."))
-
 from APIConnection.config import linkedin_config
+from APIConnection.dtypes import compact_dtypes
 from APIConnection.logger import get_logger
+from APIConnection.settings import COMPACT_DTYPES
+from APIConnection.sinks import get_sink
+
+from .get_ln_campaign_data import *
+from .linkedin_ads_accounts import *
 
 logger = get_logger(
     "linkedin", file_name=linkedin_config.LOG_FILE, log_level=linkedin_config.LOG_LEVEL
@@ -25,13 +26,58 @@ def isFile(fileName):
 
 
 class Linkedin(object):
-    def __init__(self, client_name, cred, output, s_date, e_date, query_type):
+    def __init__(self, client_name, cred, output, s_date, e_date, query_type, output_format="tsv", journal=None):
         self.client_name = client_name
         self.cred = cred
         self.output = output
         self.s_date = s_date
         self.e_date = e_date
         self.query_type = query_type
+        # "tsv" keeps the single tab separated report, otherwise a sink format
+        self.output_format = output_format
+        # RunJournal of the accounts already extracted, skipped on a resumed run
+        self.journal = journal
+
+    def extract_account(self, account, access_token, camapign_type_json, sink, report_output_file):
+        """Extract and save the campaign analytics of an account
+
+        The rows fetched are saved even when campaigns were skipped, but only
+        complete accounts are journaled, so a resumed run fetches the others
+        again and the sink replaces their rows.
+
+        Returns:
+            bool: whether every campaign of the account was extracted
+        """
+        account_id = account['account_id']
+        ln_campaign_df = get_LinkedIn_campaigns_list(access_token, account_id, camapign_type_json)
+        if ln_campaign_df is None:
+            return False
+        if ln_campaign_df.empty:
+            logger.error(f"!!Dataframe (campaigns_df) of account with id {account_id} is empty !!!")
+            return False
+
+        # get campaign analytics data
+        campaign_ids = ln_campaign_df["campaign_id"]
+        ln_campaign_analytics, complete = get_LinkedIn_campaign(account, access_token, campaign_ids, self.s_date,
+                                                                self.e_date, self.query_type)
+        if ln_campaign_analytics is None:
+            return False
+        if sink is not None:
+            if COMPACT_DTYPES:
+                ln_campaign_analytics = compact_dtypes(ln_campaign_analytics, "start_date")
+            sink.write(ln_campaign_analytics, "linkedin", account_id, "start_date")
+            output = sink.account_output("linkedin", account_id)
+        else:
+            # Stack the DataFrames on top of each other
+            with open(report_output_file, 'a') as f:
+                ln_campaign_analytics.to_csv(f, sep='\t', header=f.tell() == 0, index=False)
+            output = report_output_file
+        if self.journal is not None and complete:
+            if sink is not None:
+                sink.finish("linkedin", account_id)
+            self.journal.record("linkedin", account_id, self.s_date, self.e_date, output=output,
+                                rows=len(ln_campaign_analytics))
+        return complete
 
     def ln_main(self):
         try:
@@ -58,27 +104,38 @@ class Linkedin(object):
             report_filename = date_time + ".csv"
             report_output_file = os.path.join(self.output, report_filename)
             os.system(f"mkdir -p {self.output}")
+            sink = None if self.output_format == "tsv" else get_sink(self.output_format, self.output)
 
             # call the LinkedIn API query function (i.e get_linkedin_campaign_data)
             # i = 0
-            for account in accounts:
-                # i += 1
-                # if i == 3:
-                #     break
-                print(f"ACCOUNT = {account}")
-                ln_campaign_df = get_LinkedIn_campaigns_list(access_token, account['account_id'], camapign_type_json)
-
-                if not ln_campaign_df.empty:
-                    # get campaign analytics data
-                    campaign_ids = ln_campaign_df["campaign_id"]
-                    ln_campaign_analytics = get_LinkedIn_campaign(account, access_token, campaign_ids, self.s_date, self.e_date, self.query_type)
-                    # Stack the DataFrames on top of each other
-                    with open(report_output_file, 'a') as f:
-                        ln_campaign_analytics.to_csv(f, sep='\t', header=f.tell() == 0, index=False)
-                    # print("\nLinkedIn campaigns analytics :\n", ln_campaign_analytics)
-                else:
-                    logger.error(f"!!Dataframe (campaigns_df) of account with id {account['account_id']} is empty !!!")
-
+            if self.journal is not None:
+                done = [account for account in accounts
+                        if self.journal.is_done("linkedin", account['account_id'], self.s_date, self.e_date)]
+                if done:
+                    logger.info(f"{len(done)} of {len(accounts)} accounts already done, skip them")
+                accounts = [account for account in accounts if account not in done]
+            failed = []
+            try:
+                for account in accounts:
+                    # i += 1
+                    # if i == 3:
+                    #     break
+                    logger.debug(f"ACCOUNT = {account}")
+                    try:
+                        complete = self.extract_account(account, access_token, camapign_type_json, sink,
+                                                        report_output_file)
+                    except Exception as e:
+                        # One account does not stop the others
+                        logger.error(f"Can not get data for account {account['account_id']}. {e!r}")
+                        complete = False
+                    if not complete:
+                        failed.append(account['account_id'])
+            finally:
+                if sink is not None:
+                    sink.close()
+            if failed:
+                logger.error(f"LN_MAIN : {len(failed)} of {len(accounts)} accounts failed or are incomplete: "
+                             f"{', '.join(map(str, failed))}")
             logger.info("LN_MAIN : LinkedIn data extraction Process Finished \n")
         except:
             logger.error("LN_MAIN : LinkedIn data extraction processing Failed !!!!:", sys.exc_info())
@@ -1,8 +1,20 @@
+import atexit
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+
+from APIConnection.settings import LOG_DEBUG_BURST, LOG_DEBUG_RATE, LOG_QUEUED
 
 FORMAT = "[%(asctime)s] [%(module)s:%(funcName)s:%(lineno)d] %(levelname)s: %(message)s"
 
+# Listeners writing the records of the queued loggers, by logger name
+_listeners: Dict[str, QueueListener] = {}
+
 
 def get_stream_handler():
     """Return a stdout stream handler
@@ -35,7 +47,113 @@ def get_file_handler(file_name):
     return handler
 
 
-def get_logger(logger_name, file_name=None, log_level=None):
+class RateLimitFilter(logging.Filter):
+    """Drop the records of a call site logged faster than `rate` per second
+
+    Every call site, i.e. file and line, has its own token bucket of `burst`
+    records refilled at `rate` records per second. Only records at or below
+    `level` are limited. The first record let through after some were
+    dropped tells how many were.
+
+    Args:
+        rate (float): records per second and call site
+        burst (int): records logged in a row before the limit applies
+        level (int): highest level limited, DEBUG by default
+    """
+
+    def __init__(
+        self,
+        rate: float = LOG_DEBUG_RATE,
+        burst: int = LOG_DEBUG_BURST,
+        level: int = logging.DEBUG,
+    ):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.level = level
+        # call site -> [tokens, last refill, dropped records]
+        self._sites: Dict[Tuple[str, int], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.setdefault(
+                (record.pathname, record.lineno), [self.burst, now, 0]
+            )
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                return False
+            site[0] -= 1
+            dropped, site[2] = site[2], 0
+        if dropped:
+            record.msg = f"{record.msg} [{dropped} similar records dropped]"
+        return True
+
+
+def get_queue_handler(logger_name, handlers):
+    """Return a handler putting the records on a queue, written to
+    `handlers` by a background thread
+
+    The caller only pays for the formatting of the message, the stream and
+    file I/O happens on the listener thread. The listeners are stopped, and
+    their queues flushed, at exit or by `stop_queue_listeners`.
+
+    Args:
+        logger_name (string): name of the logger owning the listener
+        handlers (list(logging.Handler)): handlers writing the records
+
+    Return:
+        logging.handlers.QueueHandler: handler to add to the logger
+    """
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[logger_name] = listener
+    return QueueHandler(records)
+
+
+def stop_queue_listeners(*logger_names):
+    """Write the queued records and stop the listener threads of
+    `logger_names`, or of all the queued loggers"""
+    for name in logger_names or list(_listeners):
+        if name in _listeners:
+            _listeners.pop(name).stop()
+
+
+atexit.register(stop_queue_listeners)
+
+
+def _write_directly_after_fork():
+    """Swap the queued handlers of a forked child for their handlers
+
+    The listener threads do not survive a fork, so the records queued in a
+    child, e.g. a process pool worker, would never be written. The child
+    writes them from the calling thread instead.
+    """
+    listeners = dict(_listeners)
+    _listeners.clear()
+    for name, listener in listeners.items():
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            if not isinstance(handler, QueueHandler):
+                continue
+            logger.removeHandler(handler)
+            for target in listener.handlers:
+                for record_filter in handler.filters:
+                    target.addFilter(record_filter)
+                logger.addHandler(target)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_write_directly_after_fork)
+
+
+def get_logger(logger_name, file_name=None, log_level=None, queued=LOG_QUEUED):
     """Return an opinionated basic logger named `name` that logs to stdout
 
     If you leave the log level argument as None and the logger was not
@@ -60,6 +178,8 @@ def get_logger(logger_name, file_name=None, log_level=None):
         file_name (string): if present, will write logs to file as well
         log_level (string): level of logging for this logger. string so you
                             don't have to import logging in the application
+        queued (bool): write the records from a background thread and rate
+                       limit the debug records of every call site
 
     Return:
         logging.Logger: pre-formatted logger object
@@ -91,10 +211,17 @@ def get_logger(logger_name, file_name=None, log_level=None):
     logger.propagate = logger.level == logging.NOTSET
 
     if logger.level != logging.NOTSET and not logger.handlers:
-        logger.addHandler(get_stream_handler())
-
+        handlers = [get_stream_handler()]
         if file_name:
-            logger.addHandler(get_file_handler(file_name))
+            handlers.append(get_file_handler(file_name))
+
+        if queued:
+            handler = get_queue_handler(logger_name, handlers)
+            handler.addFilter(RateLimitFilter())
+            logger.addHandler(handler)
+        else:
+            for handler in handlers:
+                logger.addHandler(handler)
     # Else if at least one log handler exists that means it has been
     # instantiated with the same name before. Do not keep creating handlers
     # or your logs will be very messy.
@@ -102,6 +229,8 @@ def get_logger(logger_name, file_name=None, log_level=None):
         # Delete handlers in case level was set back to NOTSET
         # after being set to something else
         del logger.handlers[:]
+        if logger_name in _listeners:
+            _listeners.pop(logger_name).stop()
 
     return logger
 
@@ -0,0 +1,234 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from APIConnection.settings import METRICS_LATENCY_BUCKETS
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = [
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in items
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    """Monotonic counter, one value per label set"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def samples(self) -> List[Tuple[str, LabelKey, Optional[Tuple[str, str]], float]]:
+        with self._lock:
+            return [
+                (self.name, key, None, value) for key, value in self._values.items()
+            ]
+
+    def to_dict(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {"labels": dict(key), "value": value}
+                for key, value in self._values.items()
+            ]
+
+
+class Histogram:
+    """Distribution of observations in cumulative buckets, one per label set
+
+    Args:
+        name (str): metric name
+        help (str): description
+        buckets (list(float)): upper bounds of the buckets
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str = "",
+        buckets: Sequence[float] = METRICS_LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        # label set -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(_label_key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def samples(self) -> List[Tuple[str, LabelKey, Optional[Tuple[str, str]], float]]:
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], counts[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else repr(float(bound))
+                    samples.append((f"{self.name}_bucket", key, ("le", le), cumulative))
+                samples.append((f"{self.name}_sum", key, None, counts[-1]))
+                samples.append((f"{self.name}_count", key, None, cumulative))
+        return samples
+
+    def to_dict(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "labels": dict(key),
+                    "buckets": dict(
+                        zip([str(b) for b in self.buckets] + ["+Inf"], counts[:-1])
+                    ),
+                    "sum": counts[-1],
+                    "count": sum(counts[:-1]),
+                }
+                for key, counts in self._values.items()
+            ]
+
+
+class MetricsRegistry:
+    """Named counters and histograms of a run, exported as Prometheus text
+    or JSON"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.type}")
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        buckets: Sequence[float] = METRICS_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def reset(self) -> None:
+        """Clear the values of the metrics, the metric objects stay
+        registered so that the module-level ones keep being exported"""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.clear()
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample_name, key, extra, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(key, extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return {
+            name: {"type": metric.type, "help": metric.help, "values": metric.to_dict()}
+            for name, metric in sorted(self._metrics.items())
+        }
+
+    def dump(self, path: str) -> None:
+        """Write the metrics to `path`, as JSON if it ends with .json and as
+        Prometheus text otherwise"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            if path.endswith(".json"):
+                json.dump(self.to_dict(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram(
+    "apiconnection_request_seconds", "Latency of the API requests"
+)
+REQUESTS = metrics.counter("apiconnection_requests_total", "API requests by status")
+BYTES_DOWNLOADED = metrics.counter(
+    "apiconnection_downloaded_bytes_total", "Bytes of the API responses and reports"
+)
+ROWS_PARSED = metrics.counter(
+    "apiconnection_rows_parsed_total", "Report rows parsed into frames"
+)
+RETRIES = metrics.counter("apiconnection_retries_total", "Retried failures")
+THROTTLES = metrics.counter(
+    "apiconnection_throttles_total", "Throttling signals received from the APIs"
+)
+JOB_POLLS = metrics.counter("apiconnection_job_polls_total", "Report job polls")
+JOB_SECONDS = metrics.histogram(
+    "apiconnection_job_seconds", "Time from the submission to the end of report jobs"
+)
+ACCOUNTS_FAILED = metrics.counter(
+    "apiconnection_accounts_failed_total", "Accounts whose report could not be fetched"
+)
+ACCOUNT_SECONDS = metrics.histogram(
+    "apiconnection_account_seconds", "Time to fetch the report of an account"
+)
+LOOP_LAG = metrics.histogram(
+    "apiconnection_loop_lag_seconds", "Delay of the event loop lag probes"
+)
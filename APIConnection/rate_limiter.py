@@ -0,0 +1,286 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Mapping, Optional, Tuple
+
+from APIConnection.logger import logger
+from APIConnection.metrics import THROTTLES
+from APIConnection.settings import RATE_LIMIT_DEFAULT, RATE_LIMITS
+
+# Usage percentages reported by Facebook above which the rate is decreased,
+# and below which it is increased
+FB_USAGE_HIGH = 90
+FB_USAGE_LOW = 75
+FB_USAGE_KEYS = ("call_count", "total_cputime", "total_time")
+
+
+class TokenBucket:
+    """Token bucket whose refill rate adapts to the feedback of the API
+
+    The rate follows an additive-increase/multiplicative-decrease scheme:
+    every successful call raises it by `increase` requests per second up to
+    `max_rate`, and every throttling signal multiplies it by `decrease` down
+    to `min_rate`. Usage headers can also set the rate directly, and a
+    `Retry-After` pauses the bucket.
+
+    Args:
+        rate (float): initial number of requests per second
+        max_rate (float): upper bound of the rate
+        min_rate (float): lower bound of the rate
+        capacity (float): maximum burst size, defaults to one second of
+            `max_rate`
+        increase (float): rate added on every success
+        decrease (float): factor applied to the rate on throttling
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        max_rate: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        capacity: Optional[float] = None,
+        increase: Optional[float] = None,
+        decrease: float = 0.5,
+    ):
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate or rate / 10
+        self.rate = rate
+        self.capacity = capacity or max(1.0, self.max_rate)
+        self.increase = increase or self.max_rate / 20
+        self.decrease = decrease
+        # Start with a single token so that a burst is only allowed once the
+        # API proved it accepts it
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        start = max(self._last, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._last = max(now, self._last)
+
+    def _reserve(self, tokens: float) -> float:
+        """Take `tokens` from the bucket and return the seconds to wait for
+        them. Reservations may overdraw the bucket, so concurrent callers
+        queue up instead of all waking at the same time"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait + max(self._paused_until - now, 0.0), 0.0)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until `tokens` are available, return the seconds waited"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Wait without blocking the event loop until `tokens` are available"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def on_success(self) -> None:
+        self.set_rate(self.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        self.set_rate(self.rate * self.decrease)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Registry of the token buckets, one per provider and endpoint
+
+    The initial and maximum rates of the providers are configured in
+    `settings.RATE_LIMITS`; endpoints of a same provider get independent
+    buckets with the provider's configuration.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict]] = None):
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.default_limit = RATE_LIMIT_DEFAULT
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, provider: str, endpoint: str = "default") -> TokenBucket:
+        key = (provider, endpoint)
+        with self._lock:
+            if key not in self._buckets:
+                config = self.limits.get(provider, self.default_limit)
+                self._buckets[key] = TokenBucket(**config)
+            return self._buckets[key]
+
+    def reset(self) -> None:
+        """Drop the buckets, e.g. after a change of `limits`"""
+        with self._lock:
+            self._buckets = {}
+
+    @contextmanager
+    def unthrottled(self, rate: float = 1e6):
+        """Lift the limits of all providers within the block, e.g. to run
+        against a local stand-in or a replayed recording"""
+        limits, default_limit = self.limits, self.default_limit
+        self.default_limit = {"rate": rate, "max_rate": rate}
+        self.limits = {provider: self.default_limit for provider in limits}
+        self.reset()
+        try:
+            yield
+        finally:
+            self.limits, self.default_limit = limits, default_limit
+            self.reset()
+
+    def acquire(self, provider: str, endpoint: str = "default") -> float:
+        return self.bucket(provider, endpoint).acquire()
+
+    async def acquire_async(self, provider: str, endpoint: str = "default") -> float:
+        return await self.bucket(provider, endpoint).acquire_async()
+
+    def update(
+        self,
+        provider: str,
+        endpoint: str,
+        status_code: Optional[int],
+        headers: Optional[Mapping[str, str]],
+    ) -> None:
+        """Adapt the bucket of an endpoint to the response of a call
+
+        Args:
+            provider (str): provider name, e.g. "facebook"
+            endpoint (str): endpoint name
+            status_code (int): HTTP status of the response
+            headers (dict): headers of the response
+        """
+        bucket = self.bucket(provider, endpoint)
+        rate_before = bucket.rate
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+
+        if status_code == 429:
+            THROTTLES.inc(provider=provider, endpoint=endpoint, reason="429")
+            bucket.on_throttle()
+            retry_after = parse_retry_after(headers.get("retry-after"))
+            if retry_after:
+                bucket.pause(retry_after)
+            logger.warning(
+                f"{provider}/{endpoint} throttled, rate down to {bucket.rate:.2f}/s"
+                + (f", retry after {retry_after}s" if retry_after else "")
+            )
+            return
+
+        if provider == "facebook" and self._update_from_fb_usage(bucket, headers):
+            if bucket.rate < rate_before:
+                THROTTLES.inc(provider=provider, endpoint=endpoint, reason="usage")
+            return
+        if "x-rate-limit-remaining" in headers:
+            self._update_from_remaining(bucket, headers)
+            if bucket.rate < rate_before:
+                THROTTLES.inc(provider=provider, endpoint=endpoint, reason="remaining")
+            return
+        if status_code is not None and status_code < 400:
+            bucket.on_success()
+
+    def update_from_response(self, provider: str, endpoint: str, response) -> None:
+        """`update` from a `requests.Response`"""
+        self.update(provider, endpoint, response.status_code, response.headers)
+
+    @staticmethod
+    def _update_from_fb_usage(bucket: TokenBucket, headers: Dict[str, str]) -> bool:
+        """Adapt to the X-Business-Use-Case-Usage, X-Ad-Account-Usage and
+        X-App-Usage headers, return False when there are none"""
+        usage, regain_minutes = fb_usage(headers)
+        if usage is None:
+            return False
+        if regain_minutes:
+            bucket.pause(regain_minutes * 60)
+            bucket.on_throttle()
+            logger.warning(f"Facebook usage limit reached, pause {regain_minutes}min")
+        elif usage >= FB_USAGE_HIGH:
+            bucket.on_throttle()
+        elif usage < FB_USAGE_LOW:
+            bucket.on_success()
+        return True
+
+    @staticmethod
+    def _update_from_remaining(bucket: TokenBucket, headers: Dict[str, str]) -> None:
+        """Spread the remaining calls of the window until its reset"""
+        try:
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset = float(headers.get("x-rate-limit-reset", 0))
+        except ValueError:
+            return
+        window = max(reset - time.time(), 1.0) if reset else None
+        if remaining <= 0:
+            bucket.pause(window or 60.0)
+            bucket.on_throttle()
+            return
+        if window is not None:
+            bucket.set_rate(remaining / window)
+        else:
+            bucket.on_success()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds of a Retry-After header, only the delay-seconds form is used"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def fb_usage(headers: Dict[str, str]) -> Tuple[Optional[float], float]:
+    """Highest usage percentage of the Facebook usage headers and the minutes
+    before the access is regained when it is blocked
+
+    Args:
+        headers (dict): response headers with lowercase names
+
+    Returns:
+        (usage, minutes), usage is None when there is no usage header
+    """
+    usages = []
+    regain_minutes = 0.0
+    business = headers.get("x-business-use-case-usage")
+    if business:
+        try:
+            for entries in json.loads(business).values():
+                for entry in entries:
+                    usages += [entry.get(key, 0) for key in FB_USAGE_KEYS]
+                    regain_minutes = max(
+                        regain_minutes, entry.get("estimated_time_to_regain_access", 0)
+                    )
+        except (ValueError, AttributeError):
+            logger.debug(f"Invalid X-Business-Use-Case-Usage header {business}")
+    for name in ("x-ad-account-usage", "x-app-usage"):
+        if headers.get(name):
+            try:
+                usages += [
+                    value
+                    for key, value in json.loads(headers[name]).items()
+                    if key in FB_USAGE_KEYS or key.endswith("_pct")
+                ]
+            except (ValueError, AttributeError):
+                logger.debug(f"Invalid {name} header {headers[name]}")
+    if not usages:
+        return None, regain_minutes
+    return max(usages), regain_minutes
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,424 @@
+import base64
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+import urllib.request
+import urllib.response
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from email.message import Message
+from typing import Any, Callable, Deque, Dict, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from APIConnection.exceptions import ReplayMissError
+from APIConnection.logger import logger
+from APIConnection.rate_limiter import rate_limiter
+from APIConnection.settings import RECORDER_SECRET_FIELDS, RECORDER_SECRET_HEADERS
+
+SCRUBBED = "<scrubbed>"
+_FIELDS = "|".join(re.escape(field) for field in RECORDER_SECRET_FIELDS)
+# field=value in a query string, a form body or a URL inside a body
+_SECRET_PARAM = re.compile(rf"(?i)(?<![\w-])({_FIELDS})=[^&\"'\s]*")
+# "field": "value" in a JSON body
+_SECRET_JSON = re.compile(rf'(?i)"({_FIELDS})"(\s*:\s*)"(?:[^"\\]|\\.)*"')
+# Headers describing the raw payload, the recordings keep the decoded body
+_PAYLOAD_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+# (native response, status, reason, headers, body)
+Sent = Tuple[Any, int, str, Dict[str, str], bytes]
+
+
+def scrub_text(text: str) -> str:
+    """Replace the values of the secret fields in a URL or a body"""
+    text = _SECRET_PARAM.sub(rf"\1={SCRUBBED}", text)
+    return _SECRET_JSON.sub(rf'"\1"\2"{SCRUBBED}"', text)
+
+
+def scrub_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    return {
+        name: SCRUBBED if name.lower() in RECORDER_SECRET_HEADERS else str(value)
+        for name, value in headers.items()
+    }
+
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    """Identity of a request in a recording: its method, its URL with sorted
+    query parameters and the hash of its body, secrets scrubbed"""
+    parts = urlsplit(scrub_text(url))
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    digest = hashlib.sha1(_scrub_body(body)).hexdigest() if body else ""
+    return (
+        f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{query} {digest}"
+    )
+
+
+def _scrub_body(body: bytes) -> bytes:
+    try:
+        return scrub_text(body.decode("utf-8")).encode("utf-8")
+    except UnicodeDecodeError:
+        return body
+
+
+def _encode_body(body: bytes) -> Dict[str, Any]:
+    try:
+        return {"body": scrub_text(body.decode("utf-8"))}
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(body).decode("ascii"), "base64": True}
+
+
+def _decode_body(data: Dict[str, Any]) -> bytes:
+    if data.get("base64"):
+        return base64.b64decode(data["body"])
+    return data["body"].encode("utf-8")
+
+
+def _as_bytes(body: Any) -> bytes:
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    # Streamed uploads are not recorded
+    return b""
+
+
+def _open_cassette(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+_active: Optional["_Transport"] = None
+_originals: Dict[str, Callable] = {}
+_install_lock = threading.Lock()
+
+
+class _Transport(ABC):
+    """Intercept the HTTP requests of `requests`, httplib2 and urllib
+
+    Connectors calling `requests` directly, and the Facebook and Twitter
+    SDKs through their `requests.Session`, go through `Session.send`;
+    googleapiclient goes through `httplib2.Http.request` and the DV360
+    report downloads through urllib. Only one transport is installed at a
+    time.
+    """
+
+    @abstractmethod
+    def handle(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        body: bytes,
+        send: Callable[[], Sent],
+        build: Callable[[int, str, Dict[str, str], bytes, float], Any],
+    ) -> Any:
+        """Answer a request
+
+        Args:
+            method (str): HTTP method
+            url (str): full URL
+            headers (dict): request headers
+            body (bytes): request body
+            send (callable): sends the request for real
+            build (callable): builds the native response of the library from
+                (status, reason, headers, body, elapsed seconds)
+        """
+        pass
+
+    def install(self) -> None:
+        global _active
+        with _install_lock:
+            if _active is not None:
+                raise RuntimeError("An HTTP transport is already installed")
+            _active = self
+            _patch()
+
+    def uninstall(self) -> None:
+        global _active
+        with _install_lock:
+            if _active is self:
+                _unpatch()
+                _active = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+
+class Recorder(_Transport):
+    """Record the HTTP exchanges of a run to a cassette file
+
+    The cassette holds one JSON exchange per line, gzipped when `path` ends
+    with .gz. The secret headers and fields of `settings.RECORDER_SECRET_*`
+    are scrubbed from the requests and the responses.
+
+    Usage:
+    ```
+    with Recorder("day.jsonl.gz"):
+        connection.get_sub_accounts_report_df(...)
+    ```
+
+    Args:
+        path (str): cassette file, overwritten
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._start = None
+        self._lock = threading.Lock()
+
+    def install(self) -> None:
+        self._file = _open_cassette(self.path, "w")
+        self._start = time.perf_counter()
+        super().install()
+
+    def uninstall(self) -> None:
+        super().uninstall()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"Recorded {self.count} HTTP exchanges to {self.path}")
+
+    def handle(self, method, url, headers, body, send, build):
+        start = time.perf_counter()
+        native, status, reason, response_headers, content = send()
+        elapsed = time.perf_counter() - start
+        exchange = {
+            "key": request_key(method, url, body),
+            "offset": start - self._start,
+            "elapsed": elapsed,
+            "request": {
+                "method": method.upper(),
+                "url": scrub_text(url),
+                "headers": scrub_headers(headers),
+                **_encode_body(body),
+            },
+            "response": {
+                "status": status,
+                "reason": reason,
+                "headers": scrub_headers(
+                    {
+                        name: value
+                        for name, value in response_headers.items()
+                        if name.lower() not in _PAYLOAD_HEADERS
+                    }
+                ),
+                **_encode_body(content),
+            },
+        }
+        line = json.dumps(exchange)
+        with self._lock:
+            self._file.write(line + "\n")
+            self.count += 1
+        return native
+
+
+class Replayer(_Transport):
+    """Answer the HTTP requests of a run from a cassette file
+
+    Requests are matched on their method, URL and body, secrets scrubbed.
+    Identical requests, e.g. the polls of a report job, get the recorded
+    responses in order, and the last one once they are exhausted. A request
+    that is not in the cassette raises `ReplayMissError`, nothing reaches
+    the network.
+
+    Args:
+        path (str): cassette written by `Recorder`
+        latency_scale (float): 0 answers right away, 1 waits the recorded
+            latency of every exchange, 0.5 half of it
+        unthrottled (bool): lift the rate limits of the providers during
+            the replay, so that a replay at full speed measures the code
+    """
+
+    def __init__(self, path: str, latency_scale: float = 0.0, unthrottled: bool = True):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.unthrottled = unthrottled
+        self.replayed = 0
+        self._exchanges: Dict[str, Deque[Dict]] = defaultdict(deque)
+        with _open_cassette(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    exchange = json.loads(line)
+                    self._exchanges[exchange["key"]].append(exchange)
+        self._lock = threading.Lock()
+        self._stack = ExitStack()
+
+    def install(self) -> None:
+        super().install()
+        if self.unthrottled:
+            self._stack.enter_context(rate_limiter.unthrottled())
+
+    def uninstall(self) -> None:
+        super().uninstall()
+        self._stack.close()
+
+    def handle(self, method, url, headers, body, send, build):
+        key = request_key(method, url, body)
+        with self._lock:
+            queue = self._exchanges.get(key)
+            if not queue:
+                raise ReplayMissError(
+                    f"No recorded response for {method.upper()} {scrub_text(url)}"
+                )
+            exchange = queue.popleft() if len(queue) > 1 else queue[0]
+            self.replayed += 1
+        if self.latency_scale:
+            time.sleep(exchange["elapsed"] * self.latency_scale)
+        response = exchange["response"]
+        return build(
+            response["status"],
+            response["reason"],
+            response["headers"],
+            _decode_body(response),
+            exchange["elapsed"],
+        )
+
+
+def _requests_send(session, request, **kwargs):
+    def send():
+        response = _originals["requests"](session, request, **kwargs)
+        return (
+            response,
+            response.status_code,
+            response.reason,
+            dict(response.headers),
+            response.content,
+        )
+
+    def build(status, reason, headers, content, elapsed):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(seconds=elapsed)
+        return response
+
+    return _active.handle(
+        request.method,
+        request.url,
+        request.headers,
+        _as_bytes(request.body),
+        send,
+        build,
+    )
+
+
+def _httplib2_request(
+    http, uri, method="GET", body=None, headers=None, *args, **kwargs
+):
+    import httplib2
+
+    def send():
+        response, content = _originals["httplib2"](
+            http, uri, method, body, headers, *args, **kwargs
+        )
+        # httplib2 keeps the status and some raw headers as entries
+        response_headers = {
+            name: value
+            for name, value in response.items()
+            if name != "status" and not name.startswith("-")
+        }
+        return (
+            (response, content),
+            response.status,
+            response.reason,
+            response_headers,
+            content,
+        )
+
+    def build(status, reason, response_headers, content, elapsed):
+        response = httplib2.Response(dict(response_headers, status=str(status)))
+        response.reason = reason
+        return response, content
+
+    return _active.handle(method, uri, headers or {}, _as_bytes(body), send, build)
+
+
+def _urllib_open(opener, fullurl, data=None, *args, **kwargs):
+    request = (
+        fullurl
+        if isinstance(fullurl, urllib.request.Request)
+        else urllib.request.Request(fullurl, data)
+    )
+    if request.type not in ("http", "https"):
+        return _originals["urllib"](opener, fullurl, data, *args, **kwargs)
+
+    def response_object(content, headers, status, reason):
+        message = Message()
+        for name, value in headers.items():
+            message[name] = value
+        response = urllib.response.addinfourl(
+            io.BytesIO(content), message, request.full_url, status
+        )
+        response.reason = reason
+        return response
+
+    def send():
+        response = _originals["urllib"](opener, fullurl, data, *args, **kwargs)
+        with response:
+            content = response.read()
+            headers = dict(response.headers.items())
+        return (
+            response_object(content, headers, response.status, response.reason),
+            response.status,
+            response.reason,
+            headers,
+            content,
+        )
+
+    def build(status, reason, headers, content, elapsed):
+        return response_object(content, headers, status, reason)
+
+    return _active.handle(
+        request.get_method(),
+        request.full_url,
+        dict(request.header_items()),
+        _as_bytes(data if data is not None else request.data),
+        send,
+        build,
+    )
+
+
+def _patch() -> None:
+    _originals["requests"] = requests.Session.send
+    requests.Session.send = _requests_send
+    _originals["urllib"] = urllib.request.OpenerDirector.open
+    urllib.request.OpenerDirector.open = _urllib_open
+    try:
+        import httplib2
+    except ImportError:
+        return
+    _originals["httplib2"] = httplib2.Http.request
+    httplib2.Http.request = _httplib2_request
+
+
+def _unpatch() -> None:
+    requests.Session.send = _originals.pop("requests")
+    urllib.request.OpenerDirector.open = _originals.pop("urllib")
+    if "httplib2" in _originals:
+        import httplib2
+
+        httplib2.Http.request = _originals.pop("httplib2")
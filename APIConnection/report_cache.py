@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+from pandas import DataFrame
+
+from APIConnection.logger import logger
+from APIConnection.settings import (
+    REPORT_CACHE_MAX_BYTES,
+    REPORT_CACHE_SETTLE_DAYS,
+    REPORT_CACHE_TTL,
+)
+
+
+class ReportCache:
+    """On-disk cache of per-day report frames stored as Parquet files
+
+    Entries are keyed by (provider, account, day, dimension-set hash). Days
+    older than `settle_days` are final and never expire; more recent days are
+    still being updated by the providers (late conversions, spend
+    adjustments) and expire `ttl` seconds after they were written. When the
+    cache grows over `max_bytes` the least recently used entries are evicted.
+
+    Args:
+        cache_dir (str): directory holding the Parquet files and the index
+        ttl (int): lifetime in seconds of the entries of recent days
+        settle_days (int): number of days before today considered recent
+        max_bytes (int): size cap of the cache
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl: int = REPORT_CACHE_TTL,
+        settle_days: int = REPORT_CACHE_SETTLE_DAYS,
+        max_bytes: int = REPORT_CACHE_MAX_BYTES,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.settle_days = settle_days
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._dirty = False
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.cache_dir, self.INDEX_FILE)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            logger.warning(f"Corrupted report cache index {self.index_path}")
+            return {}
+
+    def flush(self) -> None:
+        """Persist the index, including the access times of the lookups"""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+
+    @staticmethod
+    def dimensions_hash(dimensions: Optional[List[str]]) -> str:
+        payload = json.dumps(sorted(dimensions) if dimensions else None)
+        return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _key(provider: str, account: str, day: str, dims_hash: str) -> str:
+        return f"{provider}/{account}/{dims_hash}/{day}"
+
+    def _is_expired(self, entry: Dict) -> bool:
+        day = datetime.strptime(entry["day"], "%Y-%m-%d").date()
+        if (date.today() - day).days >= self.settle_days:
+            return False
+        return time.time() - entry["created"] > self.ttl
+
+    def _remove(self, key: str) -> None:
+        entry = self._index.pop(key)
+        self._dirty = True
+        try:
+            os.remove(entry["path"])
+        except FileNotFoundError:
+            pass
+
+    def get(
+        self, provider: str, account: str, day: str, dims_hash: str
+    ) -> Optional[DataFrame]:
+        """Return the cached frame of a day or None on a cache miss"""
+        key = self._key(provider, account, day, dims_hash)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry) or not os.path.exists(entry["path"]):
+                self._remove(key)
+                return None
+            entry["accessed"] = time.time()
+            self._dirty = True
+            path = entry["path"]
+        return pd.read_parquet(path)
+
+    def put(
+        self, provider: str, account: str, day: str, dims_hash: str, df: DataFrame
+    ) -> None:
+        key = self._key(provider, account, day, dims_hash)
+        path = os.path.join(
+            self.cache_dir, provider, str(account), dims_hash, f"{day}.parquet"
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            df.to_parquet(path, index=False)
+        except (ValueError, TypeError, ImportError) as e:
+            # e.g. object columns mixing types that Parquet can not store
+            logger.debug(f"Can not cache {key}. Detail {e}")
+            return
+        now = time.time()
+        with self._lock:
+            self._index[key] = {
+                "path": path,
+                "day": day,
+                "size": os.path.getsize(path),
+                "created": now,
+                "accessed": now,
+            }
+            self._dirty = True
+            self._evict()
+
+    def _evict(self) -> None:
+        total = sum(entry["size"] for entry in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(
+            self._index.items(), key=lambda item: item[1]["accessed"]
+        ):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            self._remove(key)
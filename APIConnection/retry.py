@@ -0,0 +1,357 @@
+import asyncio
+import functools
+import inspect
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Type
+
+import requests
+
+from APIConnection.exceptions import CircuitOpenError
+from APIConnection.logger import logger
+from APIConnection.metrics import BYTES_DOWNLOADED, REQUEST_SECONDS, REQUESTS, RETRIES
+from APIConnection.rate_limiter import rate_limiter
+from APIConnection.sessions import sessions
+from APIConnection.settings import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    RETRY_INITIAL,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAXIMUM,
+    RETRY_STATUS_CODES,
+)
+from APIConnection.tracing import tracer
+
+
+def http_status(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by the errors of the API clients, if any"""
+    response = getattr(exc, "response", None)
+    if response is not None and hasattr(response, "status_code"):
+        return response.status_code
+    # googleapiclient.errors.HttpError
+    resp = getattr(exc, "resp", None)
+    if resp is not None and hasattr(resp, "status"):
+        return int(resp.status)
+    # facebook_business.exceptions.FacebookRequestError
+    if callable(getattr(exc, "http_status", None)):
+        return exc.http_status()
+    # twitter_ads.error.Error
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for the errors worth retrying: throttling, 5xx responses,
+    connection errors and timeouts"""
+    status = http_status(exc)
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    return isinstance(exc, (OSError, TimeoutError, asyncio.TimeoutError))
+
+
+class RetryPolicy:
+    """How to retry one class of errors
+
+    Delays grow exponentially from `initial` to `maximum` seconds and are
+    jittered between half and all of their bound, so that concurrent callers
+    failing together do not retry together.
+
+    Args:
+        exceptions (tuple): exception types handled by the policy
+        predicate (callable): further filters the handled exceptions
+        max_attempts (int): maximum number of attempts, None for no limit
+        initial (float): upper bound of the first delay in seconds
+        maximum (float): upper bound of every delay in seconds
+        multiplier (float): growth factor of the delays
+        deadline (float): seconds after the first attempt after which the
+            error is raised, None for no deadline
+        trips_breaker (bool): whether the handled errors count as failures
+            of the circuit breaker. False for expected conditions such as
+            "report not ready"
+    """
+
+    def __init__(
+        self,
+        exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+        predicate: Optional[Callable[[BaseException], bool]] = None,
+        max_attempts: Optional[int] = RETRY_MAX_ATTEMPTS,
+        initial: float = RETRY_INITIAL,
+        maximum: float = RETRY_MAXIMUM,
+        multiplier: float = 2.0,
+        deadline: Optional[float] = None,
+        trips_breaker: bool = True,
+    ):
+        self.exceptions = exceptions
+        self.predicate = predicate
+        self.max_attempts = max_attempts
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.deadline = deadline
+        self.trips_breaker = trips_breaker
+
+    def handles(self, exc: BaseException) -> bool:
+        if not isinstance(exc, self.exceptions):
+            return False
+        return self.predicate is None or self.predicate(exc)
+
+    def delay(self, attempt: int) -> float:
+        """Jittered delay before the retry following the `attempt`-th failure"""
+        ceiling = min(self.maximum, self.initial * self.multiplier ** (attempt - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def can_retry(self, attempt: int, elapsed: float, delay: float) -> bool:
+        if self.max_attempts is not None and attempt >= self.max_attempts:
+            return False
+        return self.deadline is None or elapsed + delay <= self.deadline
+
+
+def transient_policy(**kwargs) -> RetryPolicy:
+    """Policy of the transient network and server errors"""
+    return RetryPolicy(predicate=is_transient, **kwargs)
+
+
+class CircuitBreaker:
+    """Fail fast once a provider keeps failing
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    every call raises `CircuitOpenError` without reaching the API. After
+    `reset_timeout` seconds a single trial call is let through: the circuit
+    closes if it succeeds and opens again if it fails.
+
+    Args:
+        name (str): provider name
+        failure_threshold (int): consecutive failures opening the circuit
+        reset_timeout (float): seconds before a trial call
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return
+            raise CircuitOpenError(
+                f"Circuit of {self.name} is open after {self.failures} failures"
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit of {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                logger.error(
+                    f"Circuit of {self.name} opened after {self.failures} failures"
+                )
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Circuit breaker shared by all the calls to a provider"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+class Retry:
+    """Call a function, retrying its errors according to per-error-class
+    policies, behind an optional circuit breaker
+
+    Errors not handled by any policy are raised right away. Each policy
+    counts its own attempts, the first matching policy is used.
+
+    Usage:
+    ```
+    retry = Retry(transient_policy(), breaker=get_breaker("tradedesk"))
+    retry.call(requests.get, url)
+
+    @retry
+    async def fetch():
+        ...
+    ```
+
+    Args:
+        policies (RetryPolicy): policies, by order of precedence
+        breaker (CircuitBreaker): breaker of the provider
+        name (str): provider in the metrics, defaults to the breaker name
+    """
+
+    def __init__(
+        self,
+        *policies: RetryPolicy,
+        breaker: Optional[CircuitBreaker] = None,
+        name: Optional[str] = None,
+    ):
+        self.policies = policies or (transient_policy(),)
+        self.breaker = breaker
+        self.name = name or (breaker.name if breaker is not None else "default")
+
+    def _next_delay(
+        self, exc: BaseException, attempts: Dict[int, int], start: float
+    ) -> Optional[float]:
+        """Seconds to wait before the next attempt, None to give up"""
+        for index, policy in enumerate(self.policies):
+            if not policy.handles(exc):
+                continue
+            if self.breaker is not None:
+                if policy.trips_breaker:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+            attempts[index] = attempts.get(index, 0) + 1
+            delay = policy.delay(attempts[index])
+            if not policy.can_retry(attempts[index], time.monotonic() - start, delay):
+                return None
+            logger.debug(
+                f"Attempt {attempts[index]} failed with {exc!r}, retry in {delay:.1f}s"
+            )
+            RETRIES.inc(provider=self.name, error=type(exc).__name__)
+            return delay
+        # Errors without policy, e.g. a bad request, show that the API is up
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return None
+
+    def call(self, func: Callable, *args, **kwargs):
+        attempts: Dict[int, int] = {}
+        start = time.monotonic()
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempts, start)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def call_async(self, func: Callable, *args, **kwargs):
+        attempts: Dict[int, int] = {}
+        start = time.monotonic()
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(e, attempts, start)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def __call__(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.call_async(func, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+
+def send_request(
+    provider: str,
+    endpoint: str,
+    method: str,
+    url: str,
+    retry: Optional[Retry] = None,
+    **kwargs,
+) -> requests.Response:
+    """Send an HTTP request paced by the rate limiter of the endpoint,
+    retrying the throttled and transient failures
+
+    The request goes through the pooled session of the provider, see
+    `APIConnection.sessions`, and gets its default timeout.
+
+    Responses with a non-retryable error status, e.g. 400 or 404, are
+    returned as is, the caller decides how to handle them. Once the retries
+    are used up, the throttled and 5xx responses raise `requests.HTTPError`
+    and the network errors their `requests.RequestException`.
+
+    Raises:
+        requests.RequestException: the request still failed after the retries
+        CircuitOpenError: the breaker of the provider is open
+
+    Args:
+        provider (str): provider name, e.g. "linkedin"
+        endpoint (str): endpoint name of the rate limiter
+        method (str): HTTP method
+        url (str): URL
+        retry (Retry): retry policies, defaults to the transient errors behind
+            the breaker of the provider
+        kwargs: arguments of `requests.request`
+
+    Returns:
+        requests.Response
+    """
+    if retry is None:
+        retry = Retry(transient_policy(), breaker=get_breaker(provider))
+
+    def send():
+        rate_limiter.acquire(provider, endpoint)
+        with tracer.span(endpoint, "http", provider=provider, method=method):
+            with REQUEST_SECONDS.time(provider=provider, endpoint=endpoint):
+                response = sessions.request(provider, method, url, **kwargs)
+        REQUESTS.inc(provider=provider, endpoint=endpoint, status=response.status_code)
+        BYTES_DOWNLOADED.inc(len(response.content), provider=provider)
+        rate_limiter.update_from_response(provider, endpoint, response)
+        if response.status_code in RETRY_STATUS_CODES:
+            response.raise_for_status()
+        return response
+
+    return retry.call(send)
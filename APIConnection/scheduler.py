@@ -0,0 +1,84 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from APIConnection.logger import logger
+
+
+class AccountScheduler:
+    """Bounded, priority-aware dispatcher for per-account jobs
+
+    At most `max_concurrency` jobs are in flight at any time. Pending accounts
+    wait in a priority queue and the next one is dispatched as soon as a slot
+    frees up. Results are yielded in completion order.
+
+    A failing job only fails its account: the other jobs keep running and the
+    failure is yielded with the account.
+
+    Args:
+        max_concurrency (int): maximum number of jobs in flight. None or 0
+            means no limit
+        priority_key (callable): maps an account to a sortable value; the
+            accounts with the lowest value are dispatched first. e.g.
+            `lambda acc: -spend[acc]` for largest spend first
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        priority_key: Optional[Callable[[str], Any]] = None,
+    ):
+        if max_concurrency is not None and max_concurrency < 0:
+            raise ValueError("max_concurrency must be a positive integer")
+        self.max_concurrency = max_concurrency
+        self.priority_key = priority_key
+
+    def _priority(self, account: str, index: int) -> Tuple:
+        if self.priority_key is None:
+            return (index,)
+        return (self.priority_key(account), index)
+
+    async def run(
+        self, accounts: List[str], job: Callable[[str], Awaitable[Any]]
+    ) -> AsyncIterator[Tuple[str, Any, Optional[Exception]]]:
+        """Run `job(account)` for every account and yield
+        (account, result, error)
+
+        `error` is the exception raised by the job of the account, with a
+        None result, and None when the job succeeded.
+        """
+        if not accounts:
+            return
+
+        queue = asyncio.PriorityQueue()
+        for index, account in enumerate(accounts):
+            queue.put_nowait((self._priority(account, index), account))
+
+        results = asyncio.Queue()
+
+        async def worker():
+            while True:
+                try:
+                    _, account = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await job(account)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await results.put((account, None, e))
+                else:
+                    await results.put((account, result, None))
+
+        num_workers = len(accounts)
+        if self.max_concurrency:
+            num_workers = min(self.max_concurrency, num_workers)
+        logger.debug(f"Dispatch {len(accounts)} accounts over {num_workers} slots")
+        workers = [asyncio.create_task(worker()) for _ in range(num_workers)]
+        try:
+            for _ in range(len(accounts)):
+                yield await results.get()
+        finally:
+            # Only running when the caller stops iterating early
+            for w in workers:
+                w.cancel()
@@ -0,0 +1,63 @@
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from APIConnection.settings import HTTP_POOL_DEFAULT, HTTP_POOLS, HTTP_TIMEOUT
+
+
+class SessionPool:
+    """Registry of the HTTP sessions, one `requests.Session` per provider
+
+    The sessions keep their connections alive, so consecutive requests to a
+    provider reuse the TCP and TLS connections instead of a handshake per
+    request. Connection pool sizes are configured per provider in
+    `settings.HTTP_POOLS`: `pool_connections` hosts are pooled, with up to
+    `pool_maxsize` connections each, which should cover the threads fetching
+    the accounts concurrently. Requests without a timeout get
+    `settings.HTTP_TIMEOUT`.
+
+    Retries are left to `APIConnection.retry`, the adapters do not retry.
+    """
+
+    def __init__(self, pools: Optional[Dict[str, Dict]] = None):
+        self.pools = HTTP_POOLS if pools is None else pools
+        self.default_pool = HTTP_POOL_DEFAULT
+        self.timeout = HTTP_TIMEOUT
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, provider: str) -> requests.Session:
+        with self._lock:
+            if provider not in self._sessions:
+                self._sessions[provider] = self._create(provider)
+            return self._sessions[provider]
+
+    def _create(self, provider: str) -> requests.Session:
+        config = {**self.default_pool, **self.pools.get(provider, {})}
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=0, **config)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(
+            {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        )
+        return session
+
+    def request(
+        self, provider: str, method: str, url: str, **kwargs
+    ) -> requests.Response:
+        """`requests.request` through the session of the provider"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session(provider).request(method, url, **kwargs)
+
+    def close(self) -> None:
+        """Close the connections, e.g. after a change of `pools`"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+sessions = SessionPool()
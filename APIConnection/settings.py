@@ -8,6 +8,8 @@ FB_ACCESS_TOKEN = ""
 # use either simple auth or access token. Please provide the access token here; otherwise
 # you need to run the program with simple auth
 TTD_AUTH_TOKEN = ""
+# Lifetime of the tokens minted by TTDConnection.login
+TTD_TOKEN_MINUTES = 1440
 # GG_OAUTH2_CRED = os.getenv("GG_OAUTH2_CRED", "/app-deploy/oauth2_gg.json")
 GG_OAUTH2_CRED = f"{dir_path}/../oauth2_gg.json"
 AD_INSIGHT_FIELD = f"{dir_path}/config/Facebook_fields_ads_insights.csv"
@@ -45,3 +47,160 @@ TWITTER_ACCESS_TOKEN = ""
 TWITTER_ACCESS_TOKEN_SECRET = ""
 
 GOOGLE_ANALYST_CRED = "path_to_the_credential_file"
+
+# Per-day report cache. Leave the directory empty to disable the cache
+REPORT_CACHE_DIR = ""
+# Days within REPORT_CACHE_SETTLE_DAYS of today may still change and are
+# re-fetched once they are older than REPORT_CACHE_TTL seconds
+REPORT_CACHE_TTL = 6 * 3600
+REPORT_CACHE_SETTLE_DAYS = 3
+REPORT_CACHE_MAX_BYTES = 2 * 1024**3
+
+# Incremental sync: file storing the last synced day of every account, and
+# number of days before it fetched again to pick up late attributed data
+INCREMENTAL_STATE_FILE = "./state/watermarks.json"
+INCREMENTAL_LOOKBACK_DAYS = 3
+
+# Date-range sharding: number of chunks of the same account fetched at the
+# same time
+SHARD_CONCURRENCY = 4
+
+# Columnar output sinks: compression codec and number of part files kept
+# open for appending at the same time
+SINK_COMPRESSION = "zstd"
+SINK_MAX_OPEN_FILES = 64
+
+# Adaptive rate limiter: initial and maximum requests per second of every
+# provider endpoint. The rate moves between them following the usage
+# headers and the 429 responses of the APIs
+RATE_LIMITS = {
+    "facebook": {"rate": 5.0, "max_rate": 50.0},
+    "twitter": {"rate": 1.0, "max_rate": 20.0},
+    "linkedin": {"rate": 1 / 2.4, "max_rate": 5.0},
+    "tradedesk": {"rate": 2.0, "max_rate": 20.0},
+    "google_trends": {"rate": 0.2, "max_rate": 1.0},
+}
+RATE_LIMIT_DEFAULT = {"rate": 1.0, "max_rate": 10.0}
+
+# Pooled HTTP sessions, see APIConnection.sessions: hosts pooled and
+# keep-alive connections kept per host for every provider, and the default
+# (connect, read) timeouts in seconds of the requests
+HTTP_POOLS = {
+    "linkedin": {"pool_maxsize": 20},
+    "tradedesk": {"pool_maxsize": 20},
+}
+HTTP_POOL_DEFAULT = {"pool_connections": 4, "pool_maxsize": 10}
+HTTP_TIMEOUT = (10, 300)
+
+# Retries: attempts and bounds in seconds of the exponential backoff of the
+# transient errors, i.e. connection errors and the statuses below
+RETRY_MAX_ATTEMPTS = 5
+RETRY_INITIAL = 1.0
+RETRY_MAXIMUM = 60.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Circuit breaker: consecutive failures after which the calls to a provider
+# fail fast, and seconds before a trial call is let through
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 300
+
+# Report job polling: bounds in seconds of the delay between two polls of a
+# job, and growth of the delay when the API gives no progress hint
+POLL_MIN_INTERVAL = 5
+POLL_MAX_INTERVAL = 60
+POLL_BACKOFF = 1.5
+
+# Metrics: upper bounds in seconds of the latency histogram buckets
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Event loop monitor: seconds between two lag probes, seconds a callback may
+# block the loop before its stack is sampled, and number of blocking call
+# sites reported at the end of a run
+MONITOR_INTERVAL = 0.1
+MONITOR_BLOCK_THRESHOLD = 0.1
+MONITOR_TOP_SITES = 10
+
+# Tracing: maximum number of spans kept for the trace of a run
+TRACE_MAX_SPANS = 200000
+
+# Logging: write the records from a background thread, and debug records
+# logged per second by a same line beyond a burst of LOG_DEBUG_BURST
+LOG_QUEUED = True
+LOG_DEBUG_RATE = 5
+LOG_DEBUG_BURST = 20
+
+# Base URLs of the provider APIs, each can be pointed elsewhere, e.g. at a
+# local stand-in, with the APICONNECTION_<PROVIDER>_URL environment variable
+API_BASE_URLS = {
+    provider: os.getenv(f"APICONNECTION_{provider.upper()}_URL", url)
+    for provider, url in {
+        "tradedesk": "https://api.thetradedesk.com",
+        "linkedin": "https://api.linkedin.com",
+        "facebook": "https://graph.facebook.com",
+        "twitter": "https://ads-api.twitter.com",
+        "twitter_auth": "https://api.twitter.com",
+        "dv360": "https://www.googleapis.com",
+    }.items()
+}
+
+# Record/replay transport: headers, and query, form or JSON fields, whose
+# values are replaced in the recordings
+RECORDER_SECRET_HEADERS = (
+    "authorization",
+    "proxy-authorization",
+    "cookie",
+    "set-cookie",
+    "ttd-auth",
+    "x-api-key",
+    "x-goog-api-key",
+)
+RECORDER_SECRET_FIELDS = (
+    "password",
+    "token",
+    "access_token",
+    "refresh_token",
+    "id_token",
+    "client_secret",
+    "appsecret_proof",
+    "assertion",
+    "api_key",
+)
+
+# Normalization of the report frames, see APIConnection.dtypes. String
+# columns whose name contains one of the keywords become categoricals, other
+# string columns when they have at most CATEGORY_MAX_RATIO distinct values
+# per row. Off by default: the compact dtypes are narrower than the ones of
+# pandas, e.g. int8 sums overflow
+COMPACT_DTYPES = False
+CATEGORY_KEYWORDS = (
+    "account",
+    "advertiser",
+    "partner",
+    "campaign",
+    "adset",
+    "group",
+    "insertion_order",
+    "line_item",
+    "creative",
+    "name",
+    "id",
+)
+CATEGORY_MAX_RATIO = 0.5
+DATE_KEYWORDS = ("date", "day")
+
+# Credential cache: tokens are kept in memory and, when
+# APICONNECTION_CREDENTIAL_KEY holds a Fernet key, encrypted on disk so that
+# later runs reuse them. A token expiring within CREDENTIAL_REFRESH_MARGIN
+# seconds is refreshed in the background
+CREDENTIAL_CACHE_FILE = os.getenv(
+    "APICONNECTION_CREDENTIAL_CACHE", "./state/credentials.bin"
+)
+CREDENTIAL_CACHE_KEY = os.getenv("APICONNECTION_CREDENTIAL_KEY", "")
+CREDENTIAL_REFRESH_MARGIN = 300
+
+# Discovery documents of the Google APIs, see APIConnection.discovery_cache.
+# Services are built from the cached documents, or from the copies bundled in
+# DISCOVERY_STATIC_DIR or with the client library. Documents older than
+# DISCOVERY_CACHE_TTL seconds are revalidated in the background
+DISCOVERY_CACHE_DIR = os.getenv("APICONNECTION_DISCOVERY_CACHE", "./state/discovery")
+DISCOVERY_CACHE_TTL = 7 * 24 * 3600
+DISCOVERY_STATIC_DIR = os.path.join(os.path.dirname(__file__), "discovery")
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple
+
+from APIConnection.logger import logger
+from APIConnection.settings import SINK_COMPRESSION, SINK_MAX_OPEN_FILES
+from APIConnection.utils import lazy_import
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# Only loaded when a frame is written, so that listing the sinks is cheap
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+
+
+class BaseSink(ABC):
+    """Destination of the report frames
+
+    Args:
+        root (str): root directory of the output
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @abstractmethod
+    def write(
+        self,
+        df: DataFrame,
+        provider: str,
+        account: str,
+        date_column: Optional[str] = None,
+    ) -> None:
+        """Append the rows of an account
+
+        Args:
+            df (DataFrame): report rows
+            provider (str): provider name, e.g. "facebook"
+            account (str): account ID
+            date_column (str): column holding the day of every row
+        """
+        pass
+
+    @abstractmethod
+    def account_output(self, provider: str, account: str) -> str:
+        """Where the rows of an account are written"""
+        pass
+
+    def finish(self, provider: str, account: str) -> None:
+        """Make the rows written for an account durable, e.g. before the
+        account is marked done in a run journal"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PartitionedSink(BaseSink):
+    """Base class of the file sinks, partitioned on disk as
+    `{root}/provider=../account=../report_date=../part-*`
+
+    The `report_date` level is only used when the frames have a date column.
+    A partition written by an earlier run is replaced: its part files are
+    removed on the first write of this run, so an account fetched again,
+    e.g. by a resumed run, is not duplicated.
+
+    Args:
+        root (str): root directory of the output
+    """
+
+    extension = ""
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        # Part files of this run, so that runs never overwrite each other
+        self.run_id = (
+            f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-"
+            f"{uuid.uuid4().hex[:8]}"
+        )
+        # Partitions written by this run
+        self._written = set()
+
+    def _partitions(
+        self, df: DataFrame, provider: str, account: str, date_column: Optional[str]
+    ) -> Iterator[Tuple[str, DataFrame]]:
+        directory = self.account_output(provider, account)
+        if date_column is None or date_column not in df.columns:
+            yield directory, df
+            return
+        days = df[date_column].astype(str).str[:10]
+        for day, day_df in df.groupby(days, sort=True):
+            yield os.path.join(directory, f"report_date={day}"), day_df
+
+    def write(
+        self,
+        df: DataFrame,
+        provider: str,
+        account: str,
+        date_column: Optional[str] = None,
+    ) -> None:
+        """Append the rows of an account to its partitions, the partitions
+        of earlier runs are replaced
+
+        Args:
+            df (DataFrame): report rows
+            provider (str): provider name, e.g. "facebook"
+            account (str): account ID
+            date_column (str): column holding the day of every row, used to
+                partition by date
+        """
+        if df is None or df.empty:
+            return
+        for directory, part_df in self._partitions(df, provider, account, date_column):
+            if directory not in self._written:
+                self._written.add(directory)
+                self._remove_earlier_parts(directory)
+            os.makedirs(directory, exist_ok=True)
+            self._write_partition(directory, part_df)
+
+    def _remove_earlier_parts(self, directory: str) -> None:
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.startswith("part-") and not (
+                name.startswith(f"part-{self.run_id}-")
+                or name.startswith(f"part-{self.run_id}.")
+            ):
+                logger.debug(f"Replace {os.path.join(directory, name)}")
+                os.remove(os.path.join(directory, name))
+
+    def account_output(self, provider: str, account: str) -> str:
+        """The directory of the partitions of an account"""
+        return os.path.join(self.root, f"provider={provider}", f"account={account}")
+
+    @abstractmethod
+    def _write_partition(self, directory: str, df: DataFrame) -> None:
+        pass
+
+
+class CSVSink(PartitionedSink):
+    """Uncompressed CSV output, kept for the existing downstream loaders"""
+
+    extension = ".csv"
+
+    def _write_partition(self, directory: str, df: DataFrame) -> None:
+        path = os.path.join(directory, f"part-{self.run_id}{self.extension}")
+        df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+class ArrowSink(PartitionedSink):
+    """Base class of the columnar sinks
+
+    Every partition is written to a single file per run and every `write`
+    appends to it, so the writers are kept open until `close`. At most
+    `max_open_files` writers are open at the same time; when a partition
+    whose writer was closed is written again, a new part file is started.
+
+    Args:
+        root (str): root directory of the output
+        compression (str): codec of the columns, e.g. "zstd"
+        max_open_files (int): number of writers kept open
+    """
+
+    def __init__(
+        self,
+        root: str,
+        compression: str = SINK_COMPRESSION,
+        max_open_files: int = SINK_MAX_OPEN_FILES,
+    ):
+        super().__init__(root)
+        self.compression = compression
+        self.max_open_files = max_open_files
+        self._writers = OrderedDict()
+        self._part_numbers = {}
+
+    @abstractmethod
+    def _open_writer(self, path: str, schema: pa.Schema):
+        pass
+
+    @staticmethod
+    def _to_table(df: DataFrame) -> pa.Table:
+        try:
+            return pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Object columns mixing types, e.g. numbers and empty strings
+            object_columns = df.select_dtypes(include="object").columns
+            df = df.astype({col: str for col in object_columns})
+            return pa.Table.from_pandas(df, preserve_index=False)
+
+    def _new_writer(self, directory: str, schema: pa.Schema):
+        number = self._part_numbers.get(directory, 0)
+        self._part_numbers[directory] = number + 1
+        path = os.path.join(directory, f"part-{self.run_id}-{number}{self.extension}")
+        if len(self._writers) >= self.max_open_files:
+            _, (oldest, _) = self._writers.popitem(last=False)
+            oldest.close()
+        writer = self._open_writer(path, schema)
+        self._writers[directory] = (writer, schema)
+        return writer
+
+    def _write_partition(self, directory: str, df: DataFrame) -> None:
+        table = self._to_table(df)
+        writer, schema = self._writers.get(directory, (None, None))
+        if writer is not None:
+            self._writers.move_to_end(directory)
+            if not table.schema.equals(schema):
+                try:
+                    table = table.cast(schema)
+                except (ValueError, pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    logger.debug(f"Schema changed in {directory}, start a new part")
+                    writer.close()
+                    del self._writers[directory]
+                    writer = None
+        if writer is None:
+            writer = self._new_writer(directory, table.schema)
+        writer.write_table(table)
+
+    def finish(self, provider: str, account: str) -> None:
+        """Close the files of an account, a file is only readable once its
+        writer is closed"""
+        prefix = self.account_output(provider, account)
+        for directory in list(self._writers):
+            if directory == prefix or directory.startswith(prefix + os.sep):
+                writer, _ = self._writers.pop(directory)
+                writer.close()
+
+    def close(self) -> None:
+        while self._writers:
+            _, (writer, _) = self._writers.popitem()
+            writer.close()
+
+
+class ParquetSink(ArrowSink):
+    """Parquet output, every `write` appends a row group"""
+
+    extension = ".parquet"
+
+    def _open_writer(self, path: str, schema: pa.Schema):
+        return pq.ParquetWriter(path, schema, compression=self.compression)
+
+
+class FeatherSink(ArrowSink):
+    """Feather v2 / Arrow IPC file output, every `write` appends record
+    batches"""
+
+    extension = ".arrow"
+
+    def _open_writer(self, path: str, schema: pa.Schema):
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        return pa.ipc.new_file(path, schema, options=options)
+
+
+class SQLiteSink(BaseSink):
+    """Upserts the reports, mapped to the canonical fact schema, into the
+    `{root}/facts.sqlite` FactStore, see `APIConnection.store`
+
+    Days fetched again replace their rows, so the store holds one row per
+    provider, account, campaign and day across runs.
+    """
+
+    file_name = "facts.sqlite"
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            from APIConnection.store import FactStore
+
+            self._store = FactStore(os.path.join(self.root, self.file_name))
+        return self._store
+
+    def write(
+        self,
+        df: DataFrame,
+        provider: str,
+        account: str,
+        date_column: Optional[str] = None,
+    ) -> None:
+        if df is None or df.empty:
+            return
+        self.store.write(df, provider, account)
+
+    def account_output(self, provider: str, account: str) -> str:
+        return os.path.join(self.root, self.file_name)
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+
+SINKS = {
+    "csv": CSVSink,
+    "parquet": ParquetSink,
+    "feather": FeatherSink,
+    "sqlite": SQLiteSink,
+}
+
+
+def get_sink(output_format: str, root: str, **kwargs) -> BaseSink:
+    """Return the sink of an output format: csv, parquet, feather or sqlite"""
+    if output_format not in SINKS:
+        raise ValueError(
+            f"Invalid output format {output_format}, valid options: "
+            f"{', '.join(SINKS)}"
+        )
+    return SINKS[output_format](root, **kwargs)
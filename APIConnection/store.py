@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional, Sequence
+
+import pandas as pd
+from pandas import DataFrame
+
+from APIConnection.fact_schema import FACT_COLUMNS, to_facts
+from APIConnection.logger import logger
+
+KEY_COLUMNS = ["provider", "account", "campaign", "date"]
+METRIC_COLUMNS = [column for column in FACT_COLUMNS if column not in KEY_COLUMNS]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    provider TEXT NOT NULL,
+    account TEXT NOT NULL,
+    campaign TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL,
+    impressions INTEGER,
+    clicks INTEGER,
+    spend REAL,
+    conversions REAL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (provider, account, campaign, date)
+);
+CREATE INDEX IF NOT EXISTS facts_account_date ON facts (provider, account, date);
+CREATE INDEX IF NOT EXISTS facts_date ON facts (date);
+"""
+
+_UPSERT = f"""
+INSERT INTO facts ({", ".join(FACT_COLUMNS)}, updated_at)
+VALUES ({", ".join("?" * (len(FACT_COLUMNS) + 1))})
+ON CONFLICT (provider, account, campaign, date) DO UPDATE SET
+    {", ".join(f"{c} = excluded.{c}" for c in METRIC_COLUMNS)},
+    updated_at = excluded.updated_at
+"""
+
+
+class FactStore:
+    """Local SQLite store of the reports of every connector, in the fact
+    schema of `APIConnection.fact_schema`
+
+    Rows are keyed by (provider, account, campaign, date) and written with
+    upserts: fetching days again replaces their rows instead of adding
+    duplicates. The file can be queried with any SQLite client, or with
+    `query` and `totals`.
+
+    Usage:
+    ```
+    with FactStore("./state/facts.sqlite") as store:
+        store.write(df, "facebook", account)
+        store.totals(start_date="2022-01-01")
+    ```
+
+    Args:
+        path (str): path of the SQLite file, created if missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Sinks write from the connection thread pool, under the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def upsert(self, facts: DataFrame) -> int:
+        """Insert or replace fact rows, return the number of keys written
+
+        Rows of the frame sharing a key, e.g. the ads of a campaign, are
+        summed first. Rows without an account or a date are dropped.
+        """
+        if facts.empty:
+            return 0
+        facts = facts[FACT_COLUMNS].copy()
+        missing = facts["account"].isna() | facts["date"].isna()
+        if missing.any():
+            logger.warning(f"Drop {missing.sum()} rows without account or date")
+            facts = facts[~missing]
+        facts["provider"] = facts["provider"].astype(str)
+        facts["account"] = facts["account"].astype(str)
+        facts["campaign"] = facts["campaign"].astype(object).fillna("").astype(str)
+        facts["date"] = pd.to_datetime(facts["date"]).dt.strftime("%Y-%m-%d")
+        facts = (
+            facts.groupby(KEY_COLUMNS, sort=False, observed=True)[METRIC_COLUMNS]
+            .sum(min_count=1)
+            .reset_index()
+        )
+        facts["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        rows = facts.astype(object).where(facts.notna(), None)
+        with self._lock, self._connection:
+            self._connection.executemany(
+                _UPSERT, rows.itertuples(index=False, name=None)
+            )
+        return len(facts)
+
+    def write(self, df: DataFrame, provider: str, account: Optional[str] = None) -> int:
+        """Map the report of a connector to facts and upsert them
+
+        Args:
+            df (DataFrame): report of a connector
+            provider (str): key of `fact_schema.FACT_MAPPINGS`
+            account (str): account of the report, used when the report has
+                no account column
+
+        Returns:
+            int: number of keys written
+        """
+        if df is None or df.empty:
+            return 0
+        return self.upsert(to_facts(df, provider, account))
+
+    def query(self, sql: str, params: Sequence = ()) -> DataFrame:
+        with self._lock:
+            return pd.read_sql_query(sql, self._connection, params=params)
+
+    def totals(
+        self,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        by: Sequence[str] = ("provider", "account"),
+        provider: Optional[str] = None,
+    ) -> DataFrame:
+        """Sum the metrics over a date range, e.g. the spend by account of the
+        last 30 days
+
+        Args:
+            start_date (str): first day, 'YYYY-MM-DD', None for no bound
+            end_date (str): last day, 'YYYY-MM-DD', None for no bound
+            by (list(str)): key columns to group by
+            provider (str): only sum the facts of this provider
+
+        Returns:
+            DataFrame
+        """
+        unknown = [column for column in by if column not in KEY_COLUMNS]
+        if unknown:
+            raise ValueError(
+                f"Invalid group columns {', '.join(unknown)}, valid options: "
+                f"{', '.join(KEY_COLUMNS)}"
+            )
+        conditions, params = [], []
+        for condition, value in (
+            ("date >= ?", start_date),
+            ("date <= ?", end_date),
+            ("provider = ?", provider),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        group = ", ".join(by)
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in METRIC_COLUMNS)
+        select = f"{group}, {sums}" if by else sums
+        group_by = f"GROUP BY {group} ORDER BY {group}" if by else ""
+        return self.query(f"SELECT {select} FROM facts {where} {group_by}", params)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from APIConnection.settings import TRACE_MAX_SPANS
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+_ids = itertools.count(1)
+
+
+def _lane() -> Tuple[str, int, str]:
+    """Timeline lane of the caller: its asyncio task, or its thread outside
+    of the event loop"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return "task", id(task), task.get_name()
+    thread = threading.current_thread()
+    return "thread", thread.ident, thread.name
+
+
+class Span:
+    """Timed section of a run
+
+    Attributes:
+        name (str): e.g. "account" or "poll"
+        category (str): kind of span, e.g. "run", "account", "phase", "http"
+        args (dict): attributes shown with the span, e.g. the account ID
+        parent (Span): enclosing span, None for a root span
+    """
+
+    def __init__(
+        self, name: str, category: str, args: Dict[str, Any], parent: Optional["Span"]
+    ):
+        self.id = next(_ids)
+        self.name = name
+        self.category = category
+        self.args = args
+        self.parent = parent
+        self.lane = _lane()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the start to the end of the span, or until now if it
+        is still open"""
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def __repr__(self):
+        return f"Span({self.name!r}, {self.category!r}, {self.duration:.3f}s)"
+
+
+_UNSET = object()
+
+
+class Tracer:
+    """Collect the spans of a run and export them as Chrome trace events
+
+    Spans nest through a context variable, so the current span follows the
+    code across `await` and into the tasks created inside it. Code run on a
+    thread pool only sees it when called through `in_context`.
+
+    Usage:
+    ```
+    with tracer.span("account", category="account", account=account_id):
+        with tracer.span("poll"):
+            ...
+    tracer.dump("trace.json")
+    ```
+    The file opens in chrome://tracing or https://ui.perfetto.dev, with one
+    row per asyncio task or thread.
+
+    Spans are still timed when `enabled` is False, but not kept.
+
+    Args:
+        max_spans (int): spans kept, later spans are counted but dropped
+    """
+
+    def __init__(self, max_spans: int = TRACE_MAX_SPANS):
+        self.max_spans = max_spans
+        self.enabled = True
+        self.dropped = 0
+        self._epoch = time.perf_counter()
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def start(
+        self, name: str, category: str = "phase", parent: Any = _UNSET, **args
+    ) -> Span:
+        """Open a span without making it the current span, for sections not
+        enclosed in a single block, e.g. the body of an async generator. End
+        it with `finish`"""
+        if parent is _UNSET:
+            parent = _current_span.get()
+        return Span(name, category, args, parent)
+
+    def finish(self, span: Span) -> None:
+        span.end = time.perf_counter()
+        if not self.enabled:
+            return
+        with self._lock:
+            if len(self._spans) < self.max_spans:
+                self._spans.append(span)
+            else:
+                self.dropped += 1
+
+    @contextmanager
+    def span(
+        self, name: str, category: str = "phase", parent: Any = _UNSET, **args
+    ) -> Iterator[Span]:
+        """Time the enclosed block as the current span
+
+        Args:
+            name (str): span name
+            category (str): kind of span
+            parent (Span): enclosing span, defaults to the current span
+            args: attributes of the span
+        """
+        span = self.start(name, category, parent, **args)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.args["error"] = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans = []
+            self.dropped = 0
+            self._epoch = time.perf_counter()
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Spans as Chrome trace-event JSON, one complete event per span"""
+        pid = os.getpid()
+        lanes: Dict[Tuple[str, int], int] = {}
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            kind, ident, lane_name = span.lane
+            if (kind, ident) not in lanes:
+                lanes[(kind, ident)] = tid = len(lanes) + 1
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": tid,
+                        "args": {"name": f"{kind} {lane_name}"},
+                    }
+                )
+            args = {key: str(value) for key, value in span.args.items()}
+            if span.parent is not None:
+                args["parent"] = f"{span.parent.name} #{span.parent.id}"
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": (span.start - self._epoch) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": lanes[(kind, ident)],
+                    "id": span.id,
+                    "args": args,
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_spans": self.dropped},
+        }
+
+    def dump(self, path: str) -> None:
+        """Write the Chrome trace of the run to `path`"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+tracer = Tracer()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def in_context(func: Callable, *args, **kwargs) -> Callable[[], Any]:
+    """Bind `func` to a copy of the current context, so that the spans it
+    opens on a thread pool nest under the current span"""
+    return functools.partial(
+        contextvars.copy_context().run, functools.partial(func, *args, **kwargs)
+    )
+
+
+def traced(name: Optional[str] = None, category: str = "function", **args):
+    """Decorator running every call of a function or coroutine function in
+    a span named after it"""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*a, **kw):
+                with tracer.span(span_name, category, **args):
+                    return await func(*a, **kw)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*a, **kw):
+            with tracer.span(span_name, category, **args):
+                return func(*a, **kw)
+
+        return wrapper
+
+    return decorator
@@ -6,55 +6,84 @@ import traceback
 from typing import List
 
 import pandas as pd
-import requests
 from pandas import DataFrame
 
 from APIConnection.base_connection import BaseConnection
+from APIConnection.credentials import credential_name, credentials
 from APIConnection.logger import logger
-
-logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+from APIConnection.retry import send_request
+from APIConnection.settings import API_BASE_URLS, TTD_TOKEN_MINUTES
 
 TIMEOUT = 1000
-TTD_API_URL = "https://api.thetradedesk.com"
 
 
 class TTDConnection(BaseConnection):
     """Wrapper class for fetching/parsing Trade Desk endpoints"""
 
-    def __init__(self, username=None, password=None, auth_token=None):
+    provider = "tradedesk"
+
+    def __init__(self, username=None, password=None, auth_token=None, **kwargs):
+        super().__init__(**kwargs)
         self.username = username
         self.password = password
-        if auth_token is None:
-            self.auth_token = self.login()
-        else:
-            self.auth_token = auth_token
+        self._auth_token = auth_token
+
+    @property
+    def auth_token(self) -> str:
+        """Token given to the constructor, or the cached login token of the
+        user, refreshed before it expires"""
+        if self._auth_token is not None:
+            return self._auth_token
+        return credentials.get(
+            self._credential_name(), lambda: (self.login(), TTD_TOKEN_MINUTES * 60)
+        )
+
+    def _credential_name(self) -> str:
+        # A token is only valid on the host that issued it
+        return credential_name(
+            self.provider, API_BASE_URLS[self.provider], self.username, self.password
+        )
+
+    def _request(self, method: str, url: str, endpoint: str, **kwargs):
+        """Send a request through the rate limiter of the endpoint, retrying
+        the transient errors"""
+        return send_request(self.provider, endpoint, method, url, **kwargs)
 
     def call_api(self, url: str, payload: dict):
         headers = {"Content-Type": "application/json", "TTD-Auth": self.auth_token}
-        res = requests.get(url, headers=headers, json=payload)
+        res = self._request("GET", url, "api", headers=headers, json=payload)
 
         if res.ok:
             res = json.loads(str(res.content, "utf-8"))
             return res
 
         else:
+            if res.status_code == 401 and self._auth_token is None:
+                # Revoked cached token, the next call logs in again
+                credentials.invalidate(self._credential_name())
             # If response code is not ok (200), print the resulting http error code with description
             res.raise_for_status()
 
     @staticmethod
     def get_report_reference_url():
-        return f"{TTD_API_URL}/v3/myreports/reportexecution/query/partners"
+        return (
+            f"{API_BASE_URLS['tradedesk']}/v3/myreports/reportexecution/query/partners"
+        )
 
-    def login(self, minutes_to_expire=1440):
-        auth_url = f"{TTD_API_URL}/v3/authentication"
+    def login(self, minutes_to_expire=TTD_TOKEN_MINUTES):
+        auth_url = f"{API_BASE_URLS['tradedesk']}/v3/authentication"
         payload = {
             "Login": self.username,
             "Password": self.password,
             "TokenExpirationInMinutes": minutes_to_expire,
         }
 
-        myResponse = requests.post(
-            auth_url, headers={"Content-Type": "application/json"}, json=payload
+        myResponse = self._request(
+            "POST",
+            auth_url,
+            "authentication",
+            headers={"Content-Type": "application/json"},
+            json=payload,
         )
 
         if myResponse.ok:
@@ -100,8 +129,10 @@ class TTDConnection(BaseConnection):
 
         start_time = time.time()
         url = TTDConnection.get_report_reference_url()
-        myResponse = requests.post(
+        myResponse = self._request(
+            "POST",
             url,
+            "myreports",
             headers={"Content-Type": type, "TTD-Auth": self.auth_token},
             json=payload,
         )
@@ -144,7 +175,7 @@ class TTDConnection(BaseConnection):
             None
         """
         headers = {"Content-Type": "application/json", "TTD-Auth": self.auth_token}
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", url, "download", headers=headers)
 
         try:
             if write_to_file:
@@ -181,8 +212,10 @@ class TTDConnection(BaseConnection):
 
         type = "application/json"
         url = TTDConnection.get_report_reference_url()
-        myResponse = requests.post(
+        myResponse = self._request(
+            "POST",
             url,
+            "myreports",
             headers={"Content-Type": type, "TTD-Auth": self.auth_token},
             json=payload,
         )
@@ -204,6 +237,8 @@ class TTDConnection(BaseConnection):
             except Exception as e:
                 logger.error(traceback.format_exc())
                 logging.error(f"ERROR: can not download the report. Details {e}")
+                # An empty report would pass for an account without data
+                raise
 
         else:
             myResponse.raise_for_status()
@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+import pandas as pd
+import pyarrow as pa
+from pandas import DataFrame
+
+from APIConnection.logger import logger
+from APIConnection.tracing import tracer
+
+
+class IPCFrame:
+    """DataFrame serialized as an Arrow IPC stream
+
+    Pickling the Arrow buffer is a single contiguous copy instead of one
+    Python object per cell, and reading it back maps the columns straight
+    from the buffer.
+    """
+
+    def __init__(self, buffer: pa.Buffer):
+        self.buffer = buffer
+
+    @classmethod
+    def from_frame(cls, df: DataFrame) -> "IPCFrame":
+        table = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return cls(sink.getvalue())
+
+    def to_frame(self) -> DataFrame:
+        return pa.ipc.open_stream(self.buffer).read_all().to_pandas()
+
+
+def _run_packed(func: Callable, args: tuple, kwargs: dict) -> Any:
+    """Entry point executed in the worker process"""
+    result = func(*args, **kwargs)
+    if isinstance(result, pd.DataFrame):
+        try:
+            return IPCFrame.from_frame(result)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Mixed-type object columns can not be expressed in Arrow, fall
+            # back to plain pickling
+            return result
+    return result
+
+
+def _unpack(result: Any) -> Any:
+    if isinstance(result, IPCFrame):
+        return result.to_frame()
+    return result
+
+
+class TransformStage:
+    """Post-processing stage turning raw report payloads into frames
+
+    With `processes` > 0 the transform functions run in a process pool so
+    that parsing a large account does not hold the GIL of the thread running
+    the event loop. With `processes` = 0 they run inline in the caller.
+
+    Transform functions must be picklable, i.e. defined at module or class
+    level, and take picklable payloads (dicts, lists, bytes, ...).
+
+    Args:
+        processes (int): number of worker processes, 0 to run inline
+    """
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.processes and self._pool is None:
+            logger.debug(f"Start transform pool with {self.processes} processes")
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        return self._pool
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Apply `func` to the payload and block until the result is ready"""
+        with tracer.span("parse", function=func.__name__):
+            if not self.processes:
+                return func(*args, **kwargs)
+            return _unpack(self.pool.submit(_run_packed, func, args, kwargs).result())
+
+    async def run_async(self, func: Callable, *args, **kwargs) -> Any:
+        """Apply `func` to the payload without blocking the event loop"""
+        with tracer.span("parse", function=func.__name__):
+            if not self.processes:
+                return func(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.pool, _run_packed, func, args, kwargs
+            )
+            return _unpack(result)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
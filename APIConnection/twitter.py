@@ -1,35 +1,40 @@
 # -*- coding: utf-8 -*-
 import datetime
 import errno
+import functools
 import logging
 import os
+import threading
 from collections import defaultdict
 from typing import Dict, List
 
 import pandas as pd
-import requests
 import tweepy
 from twitter_ads import API_VERSION
 from twitter_ads.campaign import Campaign
 from twitter_ads.client import Client
 from twitter_ads.enum import GRANULARITY, METRIC_GROUP, PLACEMENT
+from twitter_ads.http import Request
 from twitter_ads.utils import split_list
 
 from APIConnection.base_connection import BaseConnection
+from APIConnection.credentials import credential_name, credentials
 from APIConnection.exceptions import TwitterTimeout
 from APIConnection.logger import logger
+from APIConnection.metrics import REQUEST_SECONDS
+from APIConnection.rate_limiter import rate_limiter
+from APIConnection.retry import Retry, get_breaker, send_request, transient_policy
 from APIConnection.settings import (
+    API_BASE_URLS,
     TWITTER_ACCESS_TOKEN,
     TWITTER_ACCESS_TOKEN_SECRET,
     TWITTER_CONSUMER_KEY,
     TWITTER_CONSUMER_SECRET,
 )
-
-# logging.basicConfig(filename="twitter.log", level=logging.DEBUG)
-logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+from APIConnection.tracing import tracer
+from APIConnection.utils import run_sync
 
 TIMEOUT = 100
-API_URL = "https://ads-api.twitter.com"
 MAX_HANDLING_IDENTITIES = 20
 DEFAULT_METRIC_GROUPS = [
     METRIC_GROUP.ENGAGEMENT,
@@ -40,17 +45,43 @@ DEFAULT_METRIC_GROUPS = [
 granularity = GRANULARITY.DAY
 placement = [PLACEMENT.ALL_ON_TWITTER, PLACEMENT.PUBLISHER_NETWORK]
 
+# The SDK calls only return the data of the responses, the last response of
+# every thread is kept for the x-rate-limit headers read by the rate limiter
+_last_response = threading.local()
+
+
+def _keep_response(perform):
+    @functools.wraps(perform)
+    def wrapper(request):
+        response = perform(request)
+        _last_response.value = response
+        return response
+
+    return wrapper
+
+
+Request.perform = _keep_response(Request.perform)
+
+# The SDK has no per-client domain, an overridden API URL, e.g. of the
+# stand-ins, is set once for the process
+if API_BASE_URLS["twitter"] != Request._DEFAULT_DOMAIN:
+    Request._DEFAULT_DOMAIN = API_BASE_URLS["twitter"]
+
 
 class TwitterConnection(BaseConnection):
     """Wrapper class for fetching/parsing Twitter endpoints"""
 
+    provider = "twitter"
+
     def __init__(
         self,
         key: str = TWITTER_CONSUMER_KEY,
         secret: str = TWITTER_CONSUMER_SECRET,
         token: str = TWITTER_ACCESS_TOKEN,
         token_secret: str = TWITTER_ACCESS_TOKEN_SECRET,
+        **kwargs,
     ):
+        super().__init__(**kwargs)
         self.consumer_key = key
         self.secret = secret
         self.token = token
@@ -69,8 +100,20 @@ class TwitterConnection(BaseConnection):
         return api
 
     def _get_bearer_token(self) -> str:
-        response = requests.post(
-            "https://api.twitter.com/oauth2/token",
+        """App-only bearer token, cached: it does not expire until revoked"""
+        return credentials.get(
+            self._bearer_credential_name(), lambda: (self._fetch_bearer_token(), None)
+        )
+
+    def _bearer_credential_name(self) -> str:
+        return credential_name(self.provider, self.consumer_key, self.secret)
+
+    def _fetch_bearer_token(self) -> str:
+        response = send_request(
+            self.provider,
+            "oauth2",
+            "POST",
+            f"{API_BASE_URLS['twitter_auth']}/oauth2/token",
             auth=(self.consumer_key, self.secret),
             data={"grant_type": "client_credentials"},
         )
@@ -89,11 +132,19 @@ class TwitterConnection(BaseConnection):
         return [name for name in dir(METRIC_GROUP) if not name.startswith("_")]
 
     def get_accounts(self):
-        url = f"{API_URL}/{API_VERSION}/accounts/"
-        response = requests.get(
-            url, headers={"Authorization": f"Bearer {self._get_bearer_token()}"}
+        url = f"{API_BASE_URLS['twitter']}/{API_VERSION}/accounts/"
+        bearer_token = self._get_bearer_token()
+        response = send_request(
+            self.provider,
+            "accounts",
+            "GET",
+            url,
+            headers={"Authorization": f"Bearer {bearer_token}"},
         )
 
+        if response.status_code == 401:
+            # Revoked cached token, the next call fetches a new one
+            credentials.invalidate(self._bearer_credential_name())
         if response.status_code != 200:
             raise Exception(
                 "Cannot get a Bearer token (HTTP %d): %s"
@@ -116,32 +167,68 @@ class TwitterConnection(BaseConnection):
         ]
 
     def save_insight_ads_accounts_to_excel(
-        self, start_date, end_date, metrics_group, output_dir="./"
+        self,
+        start_date,
+        end_date,
+        metrics_group,
+        output_dir="./",
+        incremental=False,
+        sink=None,
     ):
         """Save insight ads data to excel files
 
+        An account that can not be fetched is logged and skipped, the other
+        accounts are still saved.
+
         Args:
             start_date (str): string format of 'YYYY-MM-DD'
             end_date (str): string format of 'YYYY-MM-DD'
             output_dir (str): output dir
             metrics_group
+            incremental (bool): only fetch the days after the last sync
+            sink (BaseSink): columnar output replacing the excel files
         Returns:
             None
         """
+        run_sync(
+            self.save_insight_ads_accounts_to_excel_async(
+                start_date, end_date, metrics_group, output_dir, incremental, sink
+            )
+        )
 
+    async def save_insight_ads_accounts_to_excel_async(
+        self,
+        start_date,
+        end_date,
+        metrics_group,
+        output_dir="./",
+        incremental=False,
+        sink=None,
+    ):
+        """`save_insight_ads_accounts_to_excel` for async code, awaited on
+        the running event loop"""
         if not os.path.exists(output_dir):
             raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), output_dir)
 
-        for acc in self.accounts:
-            try:
-                self.save_insight_ads_data_for_account_to_excel(
-                    acc, start_date, end_date, metrics_group, f"{output_dir}/{acc}.xls"
+        if sink is not None:
+            with sink:
+                await self.save_sub_accounts_report(
+                    [acc["id"] for acc in self.accounts],
+                    start_date,
+                    end_date,
+                    metrics_group,
+                    sink,
+                    incremental=incremental,
                 )
-            except TwitterTimeout:
-                logging.error(f"TIMEOUT: Can not get data for account {acc}")
-            except Exception as e:
-                logging.error(f"ERROR: Can not get data for account {acc}. Detail {e}")
-                raise e
+            return
+        await self.save_sub_accounts_report_to_excel(
+            [acc["id"] for acc in self.accounts],
+            start_date,
+            end_date,
+            metrics_group,
+            output_dir,
+            incremental=incremental,
+        )
 
     @staticmethod
     def convert_analysis_data_to_df(
@@ -223,10 +310,23 @@ class TwitterConnection(BaseConnection):
     def get_report_df_for_account(
         self, account: str, start_date: str, end_date: str, dimensions: List[str]
     ) -> pd.DataFrame:
-        campaign_data, analytics_data = self.fetch_analytic_data_for_account(
-            account, start_date, end_date, dimensions
+        """Fetch the report of an account
+
+        Errors are raised to the fan-out, which marks the account failed and
+        carries on with the other accounts.
+        """
+        try:
+            campaign_data, analytics_data = self.fetch_analytic_data_for_account(
+                account, start_date, end_date, dimensions
+            )
+        except TwitterTimeout:
+            logger.error(f"TIMEOUT: Can not get data for account {account}")
+            raise
+        df = self.transform_stage.run(
+            TwitterConnection.convert_analysis_data_to_df,
+            campaign_data,
+            analytics_data,
         )
-        df = self.convert_analysis_data_to_df(campaign_data, analytics_data)
         df["account_id"] = account
         return df
 
@@ -331,16 +431,41 @@ class TwitterConnection(BaseConnection):
         sync_data = []
         # Sync/Async endpoint can handle max 20 entity IDs per request
         # so split the ids list into multiple requests
+        retry = Retry(transient_policy(), breaker=get_breaker(self.provider))
         for chunk_ids in split_list(ids, MAX_HANDLING_IDENTITIES):
             try:
-                sync_data += Campaign.all_stats(
-                    account, chunk_ids, metrics_group, **kwargs
+                sync_data += retry.call(
+                    self._fetch_stats, account, chunk_ids, metrics_group, kwargs
                 )
             except Exception as e:
                 logging.error(e)
                 raise e
         return sync_data
 
+    def _fetch_stats(self, account, ids, metrics_group, kwargs):
+        """Single stats request paced by the rate limiter"""
+        rate_limiter.acquire(self.provider, "stats")
+        _last_response.value = None
+        try:
+            with tracer.span("stats", "http", provider=self.provider, ids=len(ids)):
+                with REQUEST_SECONDS.time(provider=self.provider, endpoint="stats"):
+                    data = Campaign.all_stats(account, ids, metrics_group, **kwargs)
+        except Exception as e:
+            # twitter_ads errors carry the status and headers of the response
+            rate_limiter.update(
+                self.provider,
+                "stats",
+                getattr(e, "code", None),
+                getattr(e, "headers", None),
+            )
+            raise
+        response = _last_response.value
+        if response is None:
+            rate_limiter.update(self.provider, "stats", 200, None)
+        else:
+            rate_limiter.update(self.provider, "stats", response.code, response.headers)
+        return data
+
     def extract_connection_info(self):
         user = self.tw_user_api().verify_credentials()
         data = {
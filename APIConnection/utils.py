@@ -1,45 +1,240 @@
 import asyncio
+import functools
+import importlib
+import inspect
+import sys
+import sysconfig
+import threading
 import time
+import traceback
 from asyncio import AbstractEventLoop, sleep
 from calendar import monthrange
-from datetime import date
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from types import FrameType, ModuleType
+from typing import Any, Coroutine, Deque, Dict, List, Optional, Tuple
 
 from APIConnection.logger import logger
+from APIConnection.metrics import LOOP_LAG
+from APIConnection.settings import (
+    MONITOR_BLOCK_THRESHOLD,
+    MONITOR_INTERVAL,
+    MONITOR_TOP_SITES,
+)
+from APIConnection.tracing import in_context, tracer
+
+# Frames in these directories are not reported as blocking call sites
+_LIBRARY_PATHS = tuple(
+    {
+        sysconfig.get_paths()[name]
+        for name in ("stdlib", "platstdlib", "purelib", "platlib")
+    }
+)
 
 
 class Monitor:
+    """Event loop diagnostic: lag percentiles and blocking call sites
+
+    A probe coroutine sleeps `interval` seconds in a loop and records how
+    late it wakes up. A watchdog thread checks the probe: when it has not
+    run for more than `interval + threshold` seconds a callback is blocking
+    the loop, and the watchdog samples the stack of the loop thread every
+    `sample_interval` seconds until the loop is released. Each sample
+    charges `sample_interval` seconds to the blocking call site, i.e. the
+    innermost frame outside of the standard library and the installed
+    packages, so that a `time.sleep` or a synchronous API call is reported
+    at the line of the coroutine calling it.
+
+    Usage:
+    ```
+    monitor = Monitor()
+    probe = asyncio.create_task(monitor.monitor_loop())
+    ...
+    probe.cancel()
+    monitor.log_report()
+    ```
+
+    Args:
+        interval (float): seconds between two lag probes
+        threshold (float): seconds a callback may block the loop before its
+            stack is sampled
+        sample_interval (float): seconds between two stack samples, defaults
+            to half of the threshold
+        max_lags (int): number of most recent lags kept for the percentiles
+    """
+
     lag: float = 0
 
-    def __init__(self, interval: float = 0.25):
+    def __init__(
+        self,
+        interval: float = MONITOR_INTERVAL,
+        threshold: float = MONITOR_BLOCK_THRESHOLD,
+        sample_interval: Optional[float] = None,
+        max_lags: int = 10000,
+    ):
         self.active_tasks = None
         self._interval = interval
+        self.threshold = threshold
+        self.sample_interval = sample_interval or threshold / 2
+        self.lags: Deque[float] = deque(maxlen=max_lags)
+        self.blocked_seconds = 0.0
+        # (file, line, function, source) -> [sampled seconds, blocking episodes]
+        self.blocking_sites: Dict[Tuple, List[float]] = {}
+        self._beat = time.monotonic()
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
 
-    # def start(self):
-    #     loop = get_running_loop()
-    #     loop.create_task(self.monitor_loop(loop))
-
-    async def monitor_loop(self, loop: AbstractEventLoop):
+    async def monitor_loop(self, loop: Optional[AbstractEventLoop] = None):
+        """Probe the lag of the running loop until cancelled"""
+        loop = loop or asyncio.get_running_loop()
         logger.debug("Monitor loop started")
-        # while loop.is_running():
-        while True:
-            start = loop.time()
-            # ts = time.time()
-            await sleep(self._interval)
-            time_slept = loop.time() - start
-            # time_slept = time.time() - ts
-            self.lag = time_slept - self._interval
-            # tasks = [t for t in Task.all_tasks(loop) if not t.done()]
-            # self.active_tasks = len(tasks)
-            logger.info(f"Lag time is {self.lag} s")
-            # logger.debug(f"active_tasks = {self.active_tasks}")
-
-
-async def heartbeat():
-    while True:
-        start = time.time()
-        await asyncio.sleep(0.5)
-        delay = time.time() - start - 0.5
-        logger.info(f"heartbeat delay = {delay:.3f}s")
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        watchdog.start()
+        try:
+            while True:
+                start = loop.time()
+                self._beat = time.monotonic()
+                await sleep(self._interval)
+                self._beat = time.monotonic()
+                self.lag = max(loop.time() - start - self._interval, 0.0)
+                self.lags.append(self.lag)
+                LOOP_LAG.observe(self.lag)
+        finally:
+            self._stop.set()
+            watchdog.join()
+
+    def _watch(self) -> None:
+        blocked = False
+        while not self._stop.wait(self.sample_interval):
+            stalled = time.monotonic() - self._beat
+            if stalled <= self._interval + self.threshold:
+                blocked = False
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            site = _blocking_site(frame)
+            del frame
+            with self._lock:
+                entry = self.blocking_sites.setdefault(site, [0.0, 0])
+                entry[0] += self.sample_interval
+                self.blocked_seconds += self.sample_interval
+                if not blocked:
+                    entry[1] += 1
+            if not blocked:
+                logger.warning(
+                    f"Event loop blocked for {stalled:.2f}s at {site[0]}:{site[1]} "
+                    f"in {site[2]}"
+                )
+            blocked = True
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)) -> Dict[str, float]:
+        """Lag percentiles in seconds, and the maximum lag"""
+        lags = sorted(self.lags)
+        if not lags:
+            return {}
+        result = {
+            f"p{round(q * 100)}": lags[min(int(q * len(lags)), len(lags) - 1)]
+            for q in quantiles
+        }
+        result["max"] = lags[-1]
+        return result
+
+    def top_blocking_sites(self, n: int = MONITOR_TOP_SITES) -> List[Dict]:
+        """Call sites that blocked the loop the longest"""
+        with self._lock:
+            sites = sorted(
+                self.blocking_sites.items(), key=lambda item: item[1][0], reverse=True
+            )
+        return [
+            {
+                "file": file,
+                "line": line,
+                "function": function,
+                "source": source,
+                "seconds": seconds,
+                "count": count,
+            }
+            for (file, line, function, source), (seconds, count) in sites[:n]
+        ]
+
+    def report(self, n: int = MONITOR_TOP_SITES) -> str:
+        """Human readable summary of the lag and of the blocking call sites"""
+        lines = []
+        percentiles = self.percentiles()
+        if percentiles:
+            lines.append(
+                "Event loop lag "
+                + " ".join(f"{key}={value:.3f}s" for key, value in percentiles.items())
+                + f" over {len(self.lags)} probes"
+            )
+        sites = self.top_blocking_sites(n)
+        if sites:
+            lines.append(
+                f"Event loop blocked for ~{self.blocked_seconds:.1f}s, "
+                "top blocking call sites:"
+            )
+            for site in sites:
+                lines.append(
+                    f"  {site['seconds']:7.2f}s {site['count']:4d}x "
+                    f"{site['file']}:{site['line']} {site['function']}: "
+                    f"{site['source']}"
+                )
+        return "\n".join(lines)
+
+    def log_report(self) -> None:
+        """Log the report, as a warning when the loop was blocked"""
+        report = self.report()
+        if report:
+            (logger.warning if self.blocking_sites else logger.debug)(report)
+
+
+def _is_library_file(filename: str) -> bool:
+    return filename.startswith(_LIBRARY_PATHS) or filename.startswith("<")
+
+
+def _blocking_site(frame: FrameType) -> Tuple[str, int, str, str]:
+    """Innermost frame of the stack outside of the libraries, or the
+    innermost frame when the whole stack is library code"""
+    stack = traceback.extract_stack(frame)
+    site = next(
+        (entry for entry in reversed(stack) if not _is_library_file(entry.filename)),
+        stack[-1],
+    )
+    return site.filename, site.lineno, site.name, (site.line or "").strip()
+
+
+async def heartbeat(interval: float = 0.5):
+    """Probe the event loop lag until cancelled, see `Monitor`"""
+    monitor = Monitor(interval)
+    try:
+        await monitor.monitor_loop()
+    finally:
+        monitor.log_report()
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """`asyncio.run` for the synchronous entry points, callable from a
+    running event loop too
+
+    Within a running loop, e.g. in a notebook or an async application, the
+    coroutine runs on its own loop in a worker thread. The caller blocks until
+    it is done, as with any synchronous call; async callers should await the
+    coroutine instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1, thread_name_prefix="run-sync") as pool:
+        return pool.submit(in_context(asyncio.run, coroutine)).result()
 
 
 def get_last_date_of_month(year: int, month: int) -> date:
@@ -58,15 +253,121 @@ def convert_dates_to_timeframe(start: date, stop: date) -> str:
 
 
 def timeit(method):
-    def timed(*args, **kwargs):
-        ts = time.time()
-        result = method(*args, **kwargs)
-        te = time.time()
+    """Time every call of a function or a coroutine function as a span of
+    the run trace. The seconds are stored in the `log_time` dict argument
+    under `log_name` if given, and logged otherwise"""
+
+    def record(span, kwargs):
         if "log_time" in kwargs:
             name = kwargs.get("log_name", method.__name__.upper())
-            kwargs["log_time"][name] = int(te - ts)
+            kwargs["log_time"][name] = int(span.duration)
         else:
-            logger.info("%r  %2.22f s" % (method.__name__, te - ts))
+            logger.info("%r  %2.22f s" % (method.__name__, span.duration))
+
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def timed_async(*args, **kwargs):
+            with tracer.span(method.__qualname__, "function") as span:
+                result = await method(*args, **kwargs)
+            record(span, kwargs)
+            return result
+
+        return timed_async
+
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        with tracer.span(method.__qualname__, "function") as span:
+            result = method(*args, **kwargs)
+        record(span, kwargs)
         return result
 
     return timed
+
+
+def get_days_in_range(start_date: str, end_date: str) -> List[str]:
+    """Given two dates of format 'YYYY-MM-DD', returns every day between
+    them, both included, in the same format.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    return [
+        (start + timedelta(days=i)).strftime("%Y-%m-%d")
+        for i in range((end - start).days + 1)
+    ]
+
+
+def group_consecutive_days(days: List[str]) -> List[Tuple[str, str]]:
+    """Given a sorted list of days of format 'YYYY-MM-DD', returns the
+    (start, end) ranges of consecutive days.
+    """
+    ranges = []
+    for day in days:
+        current = datetime.strptime(day, "%Y-%m-%d").date()
+        if ranges and current - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = current
+        else:
+            ranges.append([current, current])
+    return [
+        (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")) for start, end in ranges
+    ]
+
+
+def split_date_range(start_date: str, end_date: str, freq) -> List[Tuple[str, str]]:
+    """Given two dates of format 'YYYY-MM-DD', splits the interval between
+    them, both included, into consecutive (start, end) chunks.
+
+    Args:
+        start_date (str): string format of 'YYYY-MM-DD'
+        end_date (str): string format of 'YYYY-MM-DD'
+        freq (str or int): "week" for Monday to Sunday chunks, "month" for
+            calendar months, or a number of days
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    chunks = []
+    while start <= end:
+        if freq == "month":
+            chunk_end = get_last_date_of_month(start.year, start.month)
+        elif freq == "week":
+            chunk_end = start + timedelta(days=6 - start.weekday())
+        elif isinstance(freq, int) and freq > 0:
+            chunk_end = start + timedelta(days=freq - 1)
+        else:
+            raise ValueError(f"Invalid chunk frequency {freq}")
+        chunk_end = min(chunk_end, end)
+        chunks.append((start.strftime("%Y-%m-%d"), chunk_end.strftime("%Y-%m-%d")))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+class LazyModule(ModuleType):
+    """Stand-in of a module imported on the first access to one of its
+    attributes, see `lazy_import`"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def __getattr__(self, attr: str):
+        # Only called for the attributes missing from the stand-in, i.e.
+        # until the module is loaded
+        with self._lazy_lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Return module `name`, or a stand-in importing it on first use
+
+    Heavy dependencies, e.g. pyarrow, are then only loaded by the code
+    paths using them and not by `import APIConnection...` or the CLI help.
+    Annotations using the module must not be evaluated at import time.
+
+    Args:
+        name (str): full name of the module, e.g. "pyarrow.parquet"
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
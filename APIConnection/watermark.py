@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from APIConnection.logger import logger
+
+
+class WatermarkStore:
+    """High-water marks of the incremental syncs, persisted as a JSON file
+
+    A watermark is the last day ('YYYY-MM-DD') fetched for a
+    (provider, account) pair.
+
+    Args:
+        path (str): path of the JSON file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._marks: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._marks = json.load(f)
+
+    def get(self, provider: str, account: str) -> Optional[str]:
+        with self._lock:
+            return self._marks.get(provider, {}).get(str(account))
+
+    def set(self, provider: str, account: str, day: str) -> None:
+        """Move the watermark of an account forward to `day` and persist it
+
+        Watermarks never move backward, so re-fetching an older range does
+        not cause the days after it to be fetched again.
+        """
+        with self._lock:
+            marks = self._marks.setdefault(provider, {})
+            current = marks.get(str(account))
+            if current is not None and current >= day:
+                return
+            marks[str(account)] = day
+            logger.debug(f"Watermark of {provider}/{account} moved to {day}")
+            self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._marks, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
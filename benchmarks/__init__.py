@@ -0,0 +1,6 @@
+"""Offline benchmarks of the connectors
+
+Local HTTP stand-ins imitate the provider endpoints the connectors use, and
+every connector runs end to end against them at a configurable scale. See
+`python -m benchmarks -h`.
+"""
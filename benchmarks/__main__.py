@@ -0,0 +1,246 @@
+"""Run the connectors end to end against local stand-ins of the APIs
+
+Every leg runs in a fresh interpreter, so that its peak memory is its own,
+against a stand-in server started by this process. The median run of
+`--repeat` runs is reported. Legs whose SDK is not installed are skipped.
+
+Example: python -m benchmarks --accounts 50 --days 30 --rows 200 --out bench.json
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from APIConnection.rate_limiter import rate_limiter  # noqa: E402
+from APIConnection.settings import API_BASE_URLS  # noqa: E402
+from APIConnection.tracing import tracer  # noqa: E402
+from benchmarks.legs import LEGS, Options  # noqa: E402
+from benchmarks.standins import Scale, StandInServer  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCALE_DEFAULTS = Scale._field_defaults
+OPTION_DEFAULTS = Options._field_defaults
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    """Nearest-rank p50, p95 and p99 of `values`, in milliseconds"""
+    if not values:
+        return None
+    values = sorted(values)
+    result = {
+        f"p{p}": 1000 * values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+        for p in (50, 95, 99)
+    }
+    result["max"] = 1000 * values[-1]
+    result["count"] = len(values)
+    return result
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_leg(provider: str, scale: Scale, options: Options, trace_memory: bool):
+    """Run a leg in this process and return its measures"""
+    if trace_memory:
+        import tracemalloc
+
+        tracemalloc.start()
+    tracer.reset()
+    error = None
+    start = time.perf_counter()
+    try:
+        # The stand-ins do not throttle
+        with rate_limiter.unthrottled():
+            rows = LEGS[provider].run(scale, options)
+    except Exception as e:
+        rows = 0
+        error = repr(e)
+    seconds = time.perf_counter() - start
+    spans = tracer.spans
+    result = {
+        "provider": provider,
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_second": rows / seconds,
+        "request_ms": percentiles([s.duration for s in spans if s.category == "http"]),
+        "account_ms": percentiles(
+            [s.duration for s in spans if s.category == "account"]
+        ),
+        "peak_rss_mb": peak_rss_mb(),
+        "error": error or (None if rows else "no rows fetched"),
+    }
+    if trace_memory:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    return result
+
+
+def spawn_leg(provider: str, args, server: StandInServer) -> Dict:
+    """Run a leg in a fresh interpreter pointed at `server`"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    for name in API_BASE_URLS:
+        env[f"APICONNECTION_{name.upper()}_URL"] = server.url
+    with tempfile.TemporaryDirectory() as directory:
+        result_file = os.path.join(directory, "result.json")
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks",
+            "--leg",
+            provider,
+            "--result_file",
+            result_file,
+        ] + [f"--{name}={value}" for name, value in leg_arguments(args).items()]
+        if args.tracemalloc:
+            command.append("--tracemalloc")
+        # Logs and report files of the connectors stay in the temporary
+        # directory
+        process = subprocess.run(
+            command, cwd=directory, env=env, capture_output=True, text=True
+        )
+        if not os.path.exists(result_file):
+            lines = process.stderr.strip().splitlines()
+            return {"provider": provider, "error": lines[-1] if lines else "failed"}
+        with open(result_file) as f:
+            return json.load(f)
+
+
+def leg_arguments(args) -> Dict:
+    return {
+        name: getattr(args, name)
+        for name in Scale._fields + Options._fields
+        if getattr(args, name) is not None
+    }
+
+
+def format_ms(stats: Optional[Dict], key: str) -> str:
+    return f"{stats[key]:.1f}" if stats else "-"
+
+
+def print_table(results: List[Dict]) -> None:
+    header = (
+        f"{'provider':<11}{'rows':>9}{'seconds':>9}{'rows/s':>10}{'req/s':>8}"
+        f"{'req p50':>9}{'p95':>8}{'p99':>8}{'acct p50':>10}{'p95':>8}"
+        f"{'peak MB':>9}  note"
+    )
+    print(header)
+    for result in results:
+        if "seconds" not in result:
+            note = result.get("skipped") or result.get("error")
+            print(f"{result['provider']:<11}{'':>9}{'':>9}{'':>10}{'':>8}  {note}")
+            continue
+        requests, accounts = result["request_ms"], result["account_ms"]
+        print(
+            f"{result['provider']:<11}{result['rows']:>9}{result['seconds']:>9.2f}"
+            f"{result['rows_per_second']:>10.0f}"
+            f"{result['requests'] / result['seconds']:>8.1f}"
+            f"{format_ms(requests, 'p50'):>9}{format_ms(requests, 'p95'):>8}"
+            f"{format_ms(requests, 'p99'):>8}{format_ms(accounts, 'p50'):>10}"
+            f"{format_ms(accounts, 'p95'):>8}"
+            f"{result['peak_rss_mb'] or 0:>9.1f}  {result['error'] or ''}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--providers",
+        nargs="+",
+        default=list(LEGS),
+        choices=list(LEGS),
+        help="Connectors to run",
+    )
+    parser.add_argument("--accounts", type=int, default=SCALE_DEFAULTS["accounts"])
+    parser.add_argument("--days", type=int, default=SCALE_DEFAULTS["days"])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=SCALE_DEFAULTS["rows"],
+        help="Rows per account and day, campaigns per account for LinkedIn "
+        "and Twitter",
+    )
+    parser.add_argument(
+        "--job_polls",
+        type=int,
+        default=SCALE_DEFAULTS["job_polls"],
+        help="Polls of a report job before it completes; DV360 waits the "
+        "configured POLL_MIN_INTERVAL between two polls",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=SCALE_DEFAULTS["latency"],
+        help="Seconds added to every response",
+    )
+    parser.add_argument("--page_size", type=int, default=SCALE_DEFAULTS["page_size"])
+    parser.add_argument("--max_concurrency", type=int, default=None)
+    parser.add_argument("--transform_processes", type=int, default=0)
+    parser.add_argument(
+        "--poll_interval", type=float, default=OPTION_DEFAULTS["poll_interval"]
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per leg")
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="Also report the peak of the Python allocations, slows the legs",
+    )
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    # Internal: run a single leg in this process
+    parser.add_argument("--leg", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result_file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    scale = Scale(**{name: getattr(args, name) for name in Scale._fields})
+    options = Options(**{name: getattr(args, name) for name in Options._fields})
+
+    if args.leg:
+        result = run_leg(args.leg, scale, options, args.tracemalloc)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    with StandInServer(scale) as server:
+        for provider in args.providers:
+            missing = LEGS[provider].missing()
+            if missing:
+                results.append(
+                    {"provider": provider, "skipped": f"{', '.join(missing)} missing"}
+                )
+                continue
+            runs = []
+            for _ in range(args.repeat):
+                server.reset_counts()
+                result = spawn_leg(provider, args, server)
+                result["requests"] = server.request_count(provider)
+                result["endpoints"] = server.counts()
+                runs.append(result)
+            runs.sort(key=lambda run: run.get("seconds", math.inf))
+            results.append(runs[(len(runs) - 1) // 2])
+
+    print_table(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"scale": scale._asdict(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""End to end runs of the connectors against the stand-ins
+
+Every leg builds its connector, lists the accounts and fetches their
+reports, and returns the number of rows fetched. The API_BASE_URLS of the
+connectors must point at a `StandInServer`.
+"""
+
+import asyncio
+import datetime
+import importlib.util
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from APIConnection.tracing import tracer
+from benchmarks.standins import START_DATE, Scale
+
+
+class Options(NamedTuple):
+    """Settings of the connectors during a leg
+
+    Attributes:
+        max_concurrency (int): accounts fetched at the same time
+        transform_processes (int): processes parsing the reports
+        poll_interval (float): shortest delay between two polls of a job
+    """
+
+    max_concurrency: Optional[int] = None
+    transform_processes: int = 0
+    poll_interval: float = 0.05
+
+
+def date_range(scale: Scale) -> Tuple[str, str]:
+    """Start and end dates covering the `days` of the scale; the end date
+    is exclusive, as in the Twitter connector"""
+    end = START_DATE + datetime.timedelta(days=scale.days)
+    return START_DATE.isoformat(), end.isoformat()
+
+
+def consume(connection, accounts: List[str], scale: Scale, dimensions) -> int:
+    """Stream the reports of `accounts` and count their rows, the frames are
+    dropped as soon as they are counted"""
+
+    async def run():
+        rows = 0
+        async for _, df in connection.iter_sub_accounts_report(
+            accounts, *date_range(scale), dimensions
+        ):
+            rows += len(df)
+        return rows
+
+    return asyncio.run(run())
+
+
+def run_tradedesk(scale: Scale, options: Options) -> int:
+    from APIConnection.tradedesk import TTDConnection
+
+    connection = TTDConnection(
+        username="bench",
+        password="bench",
+        max_concurrency=options.max_concurrency,
+        transform_processes=options.transform_processes,
+    )
+    accounts = [f"partner{i}" for i in range(1, scale.accounts + 1)]
+    return consume(connection, accounts, scale, None)
+
+
+def run_linkedin(scale: Scale, options: Options) -> int:
+    from APIConnection.linkedin.ln_main import Linkedin
+
+    start_date, end_date = date_range(scale)
+    last_date = datetime.date.fromisoformat(end_date) - datetime.timedelta(days=1)
+    with tempfile.TemporaryDirectory() as directory:
+        cred = os.path.join(directory, "cred.json")
+        with open(cred, "w") as f:
+            credentials = {
+                "id": "1",
+                "access_token": "bench",
+                "client_id": "bench",
+                "client_secret": "bench",
+            }
+            # get_account_ids always reads the "client_name" entry
+            json.dump({"client_name": credentials}, f)
+        output = os.path.join(directory, "output")
+        Linkedin(
+            "client_name", cred, output, start_date, last_date.isoformat(), "month"
+        ).ln_main()
+        rows = 0
+        for name in os.listdir(output) if os.path.isdir(output) else []:
+            with open(os.path.join(output, name)) as f:
+                rows += max(sum(1 for _ in f) - 1, 0)
+        return rows
+
+
+def run_facebook(scale: Scale, options: Options) -> int:
+    from APIConnection.facebook_connection import FBConnection
+
+    connection = FBConnection(
+        access_token="bench",
+        max_concurrency=options.max_concurrency,
+        transform_processes=options.transform_processes,
+    )
+    connection.job_poller.min_interval = options.poll_interval
+    accounts = [account["id"] for account in connection.get_sub_accounts()]
+    dimensions = ["impressions", "clicks", "spend", "date_start", "date_stop"]
+    return consume(connection, accounts, scale, dimensions)
+
+
+def run_twitter(scale: Scale, options: Options) -> int:
+    from APIConnection.twitter import TwitterConnection
+
+    connection = TwitterConnection(
+        "bench",
+        "bench",
+        "bench",
+        "bench",
+        max_concurrency=options.max_concurrency,
+        transform_processes=options.transform_processes,
+    )
+    accounts = [account["id"] for account in connection.accounts]
+    return consume(connection, accounts, scale, None)
+
+
+def run_dv360(scale: Scale, options: Options) -> int:
+    import httplib2
+
+    from APIConnection.config import dv360_config
+    from APIConnection.dv360 import DV360, build_dbm_service
+    from APIConnection.transform import TransformStage
+
+    class TracedHttp(httplib2.Http):
+        def request(self, uri, method="GET", *args, **kwargs):
+            with tracer.span("dbm", "http", provider="dv360", method=method):
+                return super().request(uri, method, *args, **kwargs)
+
+    # The OAuth consent flow of DV360.__init__ can not run unattended, and
+    # the stand-in needs no credentials
+    connection = DV360.__new__(DV360)
+    connection.REPORT_FREQUENCY = "ONE_TIME"
+    connection.REPORT_WINDOW = 24
+    connection.transform_stage = TransformStage(options.transform_processes)
+    connection.dbm_service = build_dbm_service(TracedHttp())
+    report_df = connection.get_sub_accounts_report_df(
+        [], "CUSTOM_DATES", list(dv360_config.REPORT_METRICS)
+    )
+    return 0 if report_df is None else len(report_df)
+
+
+class Leg(NamedTuple):
+    run: Callable[[Scale, Options], int]
+    # SDKs the connector imports
+    requires: Tuple[str, ...] = ()
+
+    def missing(self) -> List[str]:
+        return [
+            name for name in self.requires if importlib.util.find_spec(name) is None
+        ]
+
+
+LEGS: Dict[str, Leg] = {
+    "tradedesk": Leg(run_tradedesk),
+    "linkedin": Leg(run_linkedin),
+    "facebook": Leg(run_facebook, ("facebook_business",)),
+    "twitter": Leg(run_twitter, ("twitter_ads", "tweepy")),
+    "dv360": Leg(run_dv360, ("googleapiclient", "httplib2", "oauth2client")),
+}
@@ -0,0 +1,687 @@
+"""Local HTTP stand-ins of the provider APIs
+
+A single threaded server answers for every provider, each one on the paths
+of its real API, so that pointing the API_BASE_URLS of the connectors at the
+server is enough. The data is deterministic for a given `Scale`.
+"""
+
+import csv
+import datetime
+import functools
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+START_DATE = datetime.date(2022, 1, 1)
+TTD_SCHEDULE = "Coegi, Coegi (CAD)  | Yesterday | daily_ttd_feesreport"
+JSON = "application/json"
+
+
+class Scale(NamedTuple):
+    """Size of the data served by the stand-ins
+
+    Attributes:
+        accounts (int): ad accounts of every provider
+        days (int): days of every report, starting from START_DATE
+        rows (int): report rows per account and day. LinkedIn and Twitter
+            report per campaign, there it is the number of campaigns of
+            every account
+        job_polls (int): polls of a report job before it completes
+        latency (float): seconds added to every response
+        page_size (int): rows per page of the paginated results
+    """
+
+    accounts: int = 10
+    days: int = 7
+    rows: int = 100
+    job_polls: int = 1
+    latency: float = 0.0
+    page_size: int = 500
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, List[str]]
+    body: bytes
+    match: "re.Match"
+
+    def param(self, name: str, default: Any = None) -> Any:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def form(self) -> Dict[str, str]:
+        """Form encoded body, as sent by the Facebook SDK"""
+        return {
+            key: values[0]
+            for key, values in parse_qs(self.body.decode("utf-8")).items()
+        }
+
+
+# status, content type, body
+Response = Tuple[int, str, bytes]
+Handler = Callable[[Request], Response]
+
+
+def json_response(data: Any, status: int = 200) -> Response:
+    return status, JSON, json.dumps(data).encode("utf-8")
+
+
+def csv_response(header: List[str], rows: List[List[Any]]) -> Response:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return 200, "text/csv", buffer.getvalue().encode("utf-8")
+
+
+@functools.lru_cache(maxsize=4096)
+def daily_rows(
+    scale: Scale, provider: str, account: str
+) -> Tuple[Tuple[datetime.date, int, int, int, float], ...]:
+    """(day, row index, impressions, clicks, spend) of every report row of an
+    account"""
+    rng = random.Random(f"{provider}:{account}")
+    rows = []
+    for day in range(scale.days):
+        date = START_DATE + datetime.timedelta(days=day)
+        for index in range(scale.rows):
+            impressions = rng.randint(0, 100000)
+            clicks = rng.randint(0, impressions // 50)
+            rows.append((date, index, impressions, clicks, round(clicks * 0.37, 2)))
+    return tuple(rows)
+
+
+class StandIn:
+    """Endpoints of one provider
+
+    Args:
+        scale (Scale): size of the data
+        base_url (str): URL of the server, for the URLs in the responses
+    """
+
+    name = ""
+
+    def __init__(self, scale: Scale, base_url: str):
+        self.scale = scale
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def routes(self) -> List[Tuple[str, str, Handler]]:
+        """(method, path pattern, handler) of every endpoint"""
+        raise NotImplementedError
+
+    def accounts(self) -> List[int]:
+        return list(range(1, self.scale.accounts + 1))
+
+
+class TradeDesk(StandIn):
+    """Authentication, `myreports` executions and report downloads"""
+
+    name = "tradedesk"
+
+    def routes(self):
+        return [
+            ("POST", r"/v3/authentication", self.authentication),
+            (
+                "POST",
+                r"/v3/myreports/reportexecution/query/partners",
+                self.report_executions,
+            ),
+            ("GET", r"/ttd/reports/(?P<partner>[^/]+)\.csv", self.download),
+        ]
+
+    def authentication(self, request):
+        return json_response({"Token": "stand-in-token"})
+
+    def report_executions(self, request):
+        partner = json.loads(request.body)["partnerIds"][0]
+
+        def execution(schedule, name):
+            return {
+                "ReportScheduleName": schedule,
+                "ReportDeliveries": [
+                    {
+                        "DownloadURL": f"{self.base_url}/ttd/reports/{name}.csv",
+                        "DeliveredPath": f"reports/{name}.csv",
+                    }
+                ],
+            }
+
+        return json_response(
+            {
+                "Result": [
+                    execution("Coegi | Yesterday | daily_ttd_other", "other"),
+                    execution(TTD_SCHEDULE, partner),
+                ],
+                "ResultCount": 2,
+            }
+        )
+
+    def download(self, request):
+        partner = request.match["partner"]
+        return csv_response(
+            [
+                "Date",
+                "Partner ID",
+                "Campaign",
+                "Impressions",
+                "Clicks",
+                "Partner Cost (USD)",
+            ],
+            [
+                [date.isoformat(), partner, f"Campaign {index}", imps, clicks, spend]
+                for date, index, imps, clicks, spend in daily_rows(
+                    self.scale, self.name, partner
+                )
+            ],
+        )
+
+
+class LinkedIn(StandIn):
+    """`adAccountsV2`, `adCampaignsV2` and `adAnalyticsV2`"""
+
+    name = "linkedin"
+
+    def routes(self):
+        return [
+            ("GET", r"/v2/adAccountsV2", self.ad_accounts),
+            ("GET", r"/v2/adCampaignsV2", self.ad_campaigns),
+            ("GET", r"/v2/adAnalyticsV2", self.ad_analytics),
+        ]
+
+    def ad_accounts(self, request):
+        return json_response(
+            {
+                "elements": [
+                    {"id": account, "name": f"Account {account}", "currency": "USD"}
+                    for account in self.accounts()
+                ]
+            }
+        )
+
+    def ad_campaigns(self, request):
+        account = int(request.param("search.account.values[0]").rsplit(":", 1)[1])
+        return json_response(
+            {
+                "elements": [
+                    {
+                        "id": account * 100000 + index,
+                        "name": f"Campaign {index}",
+                        "account": f"urn:li:sponsoredAccount:{account}",
+                        "dailyBudget": {"amount": "100", "currencyCode": "USD"},
+                        "unitCost": {"amount": "5", "currencyCode": "USD"},
+                        "objectiveType": "WEBSITE_VISIT",
+                        "status": "ACTIVE",
+                    }
+                    for index in range(self.scale.rows)
+                ]
+            }
+        )
+
+    def ad_analytics(self, request):
+        campaign = request.param("campaigns[0]").rsplit(":", 1)[1]
+        rng = random.Random(f"{self.name}:{campaign}")
+        element = {
+            field: rng.randint(0, 100000)
+            for field in request.param("fields").split(",")
+        }
+        if "dateRange" in element:
+            end = START_DATE + datetime.timedelta(days=self.scale.days - 1)
+            element["dateRange"] = {
+                "start": {"day": 1, "month": 1, "year": START_DATE.year},
+                "end": {"day": end.day, "month": end.month, "year": end.year},
+            }
+        return json_response({"elements": [element]})
+
+
+class Facebook(StandIn):
+    """Ad accounts, asynchronous insights jobs and their paginated results"""
+
+    name = "facebook"
+
+    def __init__(self, scale, base_url):
+        super().__init__(scale, base_url)
+        self._runs: Dict[str, Dict[str, Any]] = {}
+
+    def routes(self):
+        version = r"/v\d+\.\d+"
+        return [
+            ("GET", version + r"/me/adaccounts", self.ad_accounts),
+            ("POST", version + r"/act_(?P<account>\d+)/insights", self.insights_job),
+            ("GET", version + r"/(?P<run>\d+)/insights", self.insights_result),
+            ("GET", version + r"/(?P<run>\d+)", self.job_status),
+        ]
+
+    def ad_accounts(self, request):
+        return json_response(
+            {
+                "data": [
+                    {"id": f"act_{account}", "name": f"Account {account}"}
+                    for account in self.accounts()
+                ],
+                "paging": {"cursors": {"before": "0", "after": "0"}},
+            }
+        )
+
+    def insights_job(self, request):
+        fields = request.form().get("fields", "[]")
+        try:
+            fields = json.loads(fields)
+        except ValueError:
+            fields = fields.split(",")
+        with self._lock:
+            run = str(next(self._ids))
+            self._runs[run] = {
+                "account": request.match["account"],
+                "fields": fields,
+                "polls": 0,
+            }
+        return json_response({"report_run_id": run})
+
+    def job_status(self, request):
+        with self._lock:
+            job = self._runs[request.match["run"]]
+            job["polls"] += 1
+            done = job["polls"] >= self.scale.job_polls
+        return json_response(
+            {
+                "id": request.match["run"],
+                "account_id": job["account"],
+                "async_status": "Job Completed" if done else "Job Running",
+                "async_percent_completion": (
+                    100 if done else 100 * job["polls"] // self.scale.job_polls
+                ),
+            }
+        )
+
+    def insights_result(self, request):
+        job = self._runs[request.match["run"]]
+        rows = daily_rows(self.scale, self.name, job["account"])
+        offset = int(request.param("after", 0))
+        end = offset + int(request.param("limit", self.scale.page_size))
+        data = []
+        for date, _, impressions, clicks, spend in rows[offset:end]:
+            row = dict.fromkeys(job["fields"], "0")
+            row.update(
+                account_id=job["account"],
+                date_start=date.isoformat(),
+                date_stop=date.isoformat(),
+                impressions=str(impressions),
+                clicks=str(clicks),
+                spend=str(spend),
+            )
+            data.append(row)
+        paging = {"cursors": {"before": str(offset), "after": str(end)}}
+        if end < len(rows):
+            paging["next"] = f"{self.base_url}{request.path}?after={end}"
+        return json_response({"data": data, "paging": paging})
+
+
+class Twitter(StandIn):
+    """Accounts, campaigns, line items and the synchronous stats endpoint"""
+
+    name = "twitter"
+
+    def routes(self):
+        version = r"/\d+"
+        account = version + r"/accounts/(?P<account>[^/]+)"
+        return [
+            ("POST", r"/oauth2/token", self.token),
+            ("GET", version + r"/accounts/?", self.list_accounts),
+            ("GET", account, self.get_account),
+            ("GET", account + r"/campaigns", self.campaigns),
+            ("GET", account + r"/line_items", self.line_items),
+            ("GET", version + r"/stats/accounts/(?P<account>[^/]+)", self.stats),
+        ]
+
+    def token(self, request):
+        return json_response({"token_type": "bearer", "access_token": "stand-in"})
+
+    def _account(self, account: int) -> Dict[str, Any]:
+        return {
+            "id": f"acc{account}",
+            "name": f"Account {account}",
+            "timezone": "America/New_York",
+            "approval_status": "ACCEPTED",
+            "created_at": "2021-01-01T00:00:00Z",
+            "updated_at": "2021-01-01T00:00:00Z",
+            "deleted": False,
+        }
+
+    def list_accounts(self, request):
+        return json_response(
+            {
+                "data": [self._account(account) for account in self.accounts()],
+                "next_cursor": None,
+            }
+        )
+
+    def get_account(self, request):
+        return json_response(
+            {"data": self._account(int(request.match["account"][len("acc") :]))}
+        )
+
+    def campaigns(self, request):
+        account = request.match["account"]
+        return json_response(
+            {
+                "data": [
+                    {
+                        "id": f"{account}c{index}",
+                        "name": f"Campaign {index}",
+                        "account_id": account,
+                        "start_time": "2021-01-01T00:00:00Z",
+                        "end_time": None,
+                        "daily_budget_amount_local_micro": 10000000,
+                        "total_budget_amount_local_micro": None,
+                        "reasons_not_servable": [],
+                        "entity_status": "ACTIVE",
+                        "created_at": "2021-01-01T00:00:00Z",
+                        "updated_at": "2021-01-01T00:00:00Z",
+                        "deleted": False,
+                    }
+                    for index in range(self.scale.rows)
+                ],
+                "next_cursor": None,
+            }
+        )
+
+    def line_items(self, request):
+        campaign = request.param("campaign_ids")
+        return json_response(
+            {
+                "data": [
+                    {
+                        "id": f"{campaign}l",
+                        "campaign_id": campaign,
+                        "objective": "WEBSITE_CLICKS",
+                        "entity_status": "ACTIVE",
+                        "created_at": "2021-01-01T00:00:00Z",
+                        "updated_at": "2021-01-01T00:00:00Z",
+                        "deleted": False,
+                    }
+                ],
+                "next_cursor": None,
+            }
+        )
+
+    def stats(self, request):
+        start_time = request.param("start_time", "")
+        data = []
+        for entity in request.param("entity_ids", "").split(","):
+            rng = random.Random(f"{self.name}:{entity}:{start_time}")
+            impressions = rng.randint(0, 100000)
+            clicks = rng.randint(0, impressions // 50)
+            metrics = {
+                "impressions": [impressions],
+                "clicks": [clicks],
+                "url_clicks": [clicks // 2],
+                "billed_charge_local_micro": [clicks * 370000],
+            }
+            data.append(
+                {"id": entity, "id_data": [{"segment": None, "metrics": metrics}]}
+            )
+        return json_response(
+            {"data_type": "stats", "time_series_length": 1, "data": data}
+        )
+
+
+class DV360(StandIn):
+    """Bid Manager discovery document, queries and the report download"""
+
+    name = "dv360"
+
+    def __init__(self, scale, base_url):
+        super().__init__(scale, base_url)
+        self._polls: Dict[str, int] = {}
+
+    def routes(self):
+        service = r"/doubleclickbidmanager/v1\.1"
+        return [
+            (
+                "GET",
+                r"/discovery/v1/apis/doubleclickbidmanager/v1\.1/rest",
+                self.discovery_document,
+            ),
+            ("POST", service + r"/query", self.create_query),
+            ("GET", service + r"/query/(?P<query>\d+)", self.get_query),
+            ("GET", r"/dv360/reports/(?P<query>\d+)\.csv", self.download),
+        ]
+
+    def discovery_document(self, request):
+        query_ref = {"$ref": "Query"}
+        return json_response(
+            {
+                "kind": "discovery#restDescription",
+                "discoveryVersion": "v1",
+                "id": "doubleclickbidmanager:v1.1",
+                "name": "doubleclickbidmanager",
+                "version": "v1.1",
+                "protocol": "rest",
+                "rootUrl": f"{self.base_url}/",
+                "servicePath": "doubleclickbidmanager/v1.1/",
+                "batchPath": "batch",
+                "parameters": {},
+                "schemas": {"Query": {"id": "Query", "type": "object"}},
+                "resources": {
+                    "queries": {
+                        "methods": {
+                            "createquery": {
+                                "id": "doubleclickbidmanager.queries.createquery",
+                                "path": "query",
+                                "httpMethod": "POST",
+                                "request": query_ref,
+                                "response": query_ref,
+                            },
+                            "getquery": {
+                                "id": "doubleclickbidmanager.queries.getquery",
+                                "path": "query/{queryId}",
+                                "httpMethod": "GET",
+                                "parameters": {
+                                    "queryId": {
+                                        "type": "string",
+                                        "format": "int64",
+                                        "required": True,
+                                        "location": "path",
+                                    }
+                                },
+                                "parameterOrder": ["queryId"],
+                                "response": query_ref,
+                            },
+                        }
+                    }
+                },
+            }
+        )
+
+    def create_query(self, request):
+        with self._lock:
+            query = str(next(self._ids))
+            self._polls[query] = 0
+        return json_response({"queryId": query, "metadata": {"running": True}})
+
+    def get_query(self, request):
+        query = request.match["query"]
+        with self._lock:
+            self._polls[query] += 1
+            done = self._polls[query] >= self.scale.job_polls
+        return json_response(
+            {
+                "queryId": query,
+                "metadata": {
+                    "running": not done,
+                    "latestReportRunTimeMs": str(int(time.time() * 1000)),
+                    "googleCloudStoragePathForLatestReport": (
+                        f"{self.base_url}/dv360/reports/{query}.csv"
+                    ),
+                },
+            }
+        )
+
+    def download(self, request):
+        rows = [
+            [
+                date.strftime("%Y/%m/%d"),
+                account,
+                f"Insertion order {index}",
+                spend * 2,
+                f"Budget segment {index}",
+                impressions,
+                clicks,
+                spend,
+            ]
+            for account in self.accounts()
+            for date, index, impressions, clicks, spend in daily_rows(
+                self.scale, self.name, str(account)
+            )
+        ]
+        # Summary section of the real reports, without a valid date
+        rows += [[]] * 2 + [["Report Time:", "2022/01/01 00:00"], ["Date Range:", ""]]
+        return csv_response(
+            [
+                "Date",
+                "Advertiser ID",
+                "Insertion Order",
+                "Budget Segment Budget",
+                "Budget Segment Description",
+                "Impressions",
+                "Clicks",
+                "Revenue (Adv Currency)",
+            ],
+            rows,
+        )
+
+
+STAND_INS = [TradeDesk, LinkedIn, Facebook, Twitter, DV360]
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, content_type, payload = self.server.stand_ins.dispatch(
+            self.command, self.path, body
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+    # Accepted TCP connections, only counted by the thread serving
+    connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+
+class StandInServer:
+    """Threaded HTTP server answering for all the stand-ins
+
+    Usage:
+    ```
+    with StandInServer(Scale(accounts=50, days=30)) as server:
+        API_BASE_URLS["tradedesk"] = server.url
+        ...
+        server.request_count("tradedesk")
+    ```
+
+    Args:
+        scale (Scale): size of the data
+        host (str): interface to listen on
+        port (int): port to listen on, 0 for any free port
+    """
+
+    def __init__(self, scale: Scale = Scale(), host: str = "127.0.0.1", port: int = 0):
+        self.scale = scale
+        self._server = _Server((host, port), _RequestHandler)
+        self._server.stand_ins = self
+        self.url = f"http://{host}:{self._server.server_port}"
+        self._routes = []
+        for cls in STAND_INS:
+            stand_in = cls(scale, self.url)
+            for method, pattern, handler in stand_in.routes():
+                self._routes.append(
+                    (stand_in.name, method, re.compile(pattern), handler)
+                )
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def dispatch(self, method: str, raw_path: str, body: bytes) -> Response:
+        url = urlsplit(raw_path)
+        for provider, route_method, pattern, handler in self._routes:
+            match = pattern.fullmatch(url.path)
+            if route_method == method and match:
+                with self._lock:
+                    self._counts[provider, handler.__name__] += 1
+                if self.scale.latency:
+                    time.sleep(self.scale.latency)
+                request = Request(method, url.path, parse_qs(url.query), body, match)
+                return handler(request)
+        return json_response({"error": f"No stand-in for {method} {url.path}"}, 404)
+
+    def request_count(self, provider: str = None) -> int:
+        with self._lock:
+            return sum(
+                count
+                for (name, _), count in self._counts.items()
+                if provider is None or name == provider
+            )
+
+    def counts(self) -> Dict[str, int]:
+        """Requests served by endpoint, e.g. {"facebook/job_status": 12}"""
+        with self._lock:
+            return {f"{p}/{e}": count for (p, e), count in sorted(self._counts.items())}
+
+    def connection_count(self) -> int:
+        """TCP connections accepted, requests on kept-alive connections
+        are not counted"""
+        return self._server.connections
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._server.connections = 0
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="stand-ins", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
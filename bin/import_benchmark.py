@@ -0,0 +1,92 @@
+"""Import time of the package modules and startup time of the CLI
+
+Every measure runs in a fresh interpreter, the best of `--repeat` runs is
+reported. Modules whose SDK is not installed are reported as such.
+
+Example: python bin/import_benchmark.py --budget 1
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "APIConnection",
+    "APIConnection.settings",
+    "APIConnection.utils",
+    "APIConnection.sinks",
+    "APIConnection.retry",
+    "APIConnection.base_connection",
+    "APIConnection.tradedesk",
+    "APIConnection.linkedin.ln_main",
+    "APIConnection.facebook_connection",
+    "APIConnection.twitter",
+    "APIConnection.dv360",
+    "APIConnection.google_ads_api",
+    "APIConnection.google_analytics",
+    "APIConnection.google_campaign_manager",
+    "APIConnection.google_trends",
+]
+# Modules a connector should only load when it uses them
+HEAVY = ["pandas", "pyarrow", "facebook_business", "twitter_ads", "googleapiclient"]
+
+IMPORT_TIME = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)")
+
+
+def import_time(module):
+    """Cumulative import seconds of `module` and the heavy modules it loads,
+    None when it can not be imported"""
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+    cumulative = {
+        name: int(us) for us, name in IMPORT_TIME.findall(result.stderr) if name
+    }
+    return cumulative.get(module, 0) / 1e6, result.stdout.strip()
+
+
+def cli_startup(args):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join("bin", "main.py")] + args,
+        cwd=ROOT,
+        capture_output=True,
+    )
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measure")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="Exit with an error when `main.py -h` takes longer, in seconds",
+    )
+    args = parser.parse_args()
+
+    print(f"{'module':<42}{'import (s)':>12}  heavy modules loaded")
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(args.repeat)]
+        seconds = [s for s, _ in runs if s is not None]
+        if not seconds:
+            print(f"{module:<42}{'n/a':>12}  {runs[0][1]}")
+            continue
+        print(f"{module:<42}{min(seconds):>12.3f}  {runs[0][1] or '-'}")
+
+    startup = min(cli_startup(["-h"]) for _ in range(args.repeat))
+    print(f"\n{'python bin/main.py -h':<42}{startup:>12.3f}")
+    if args.budget is not None and startup > args.budget:
+        sys.exit(f"CLI startup {startup:.3f}s over the budget of {args.budget}s")
@@ -1,16 +1,142 @@
 import argparse
+import contextlib
+import logging
+import signal
 import sys
 
 sys.path.append(".")
 
 
+def dump_metrics_on_signal(path):
+    """Dump the metrics of the run to `path` on SIGUSR1, e.g. `kill -USR1 <pid>`
+    to inspect a long run"""
+    from APIConnection.metrics import metrics
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: metrics.dump(path))
+
+
+def http_transport(args):
+    """Transport recording or replaying the HTTP exchanges of the run, a
+    no-op without --record and --replay"""
+    if args.record:
+        from APIConnection.recorder import Recorder
+
+        return Recorder(args.record)
+    if args.replay:
+        from APIConnection.recorder import Replayer
+
+        return Replayer(args.replay, latency_scale=args.replay_latency)
+    return contextlib.nullcontext()
+
+
+def incremental_options(args):
+    """Connection arguments of the incremental mode"""
+    if not args.incremental:
+        return {}
+    from APIConnection.watermark import WatermarkStore
+
+    return {
+        "watermarks": WatermarkStore(args.state_file),
+        "lookback_days": args.lookback,
+    }
+
+
+def add_incremental_arguments(parser):
+    from APIConnection.settings import (
+        INCREMENTAL_LOOKBACK_DAYS,
+        INCREMENTAL_STATE_FILE,
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch the days after the last sync of every account",
+    )
+    parser.add_argument(
+        "--lookback",
+        type=int,
+        default=INCREMENTAL_LOOKBACK_DAYS,
+        help="Number of days before the last sync fetched again in incremental mode",
+    )
+    parser.add_argument(
+        "--state_file",
+        type=str,
+        default=INCREMENTAL_STATE_FILE,
+        help="File storing the last synced day of every account",
+    )
+
+
+def run_journal(args):
+    """Journal of the `--journal` argument, None to run from scratch"""
+    if not args.journal:
+        return None
+    from APIConnection.journal import RunJournal
+
+    return RunJournal(args.journal)
+
+
+def add_journal_argument(parser):
+    parser.add_argument(
+        "--journal",
+        type=str,
+        default=None,
+        help="JSONL file logging the accounts saved by the run; running again "
+        "with the same file resumes an interrupted run",
+    )
+
+
+def output_sink(args, root):
+    """Sink of the `--output_format` argument, None for the default output
+    of the connector"""
+    if args.output_format == args.default_output_format:
+        return None
+    from APIConnection.sinks import get_sink
+
+    return get_sink(args.output_format, root)
+
+
+def add_output_format_argument(parser, default="xls", exclude=()):
+    from APIConnection.sinks import SINKS
+
+    choices = [default] + [
+        name for name in SINKS if name != default and name not in exclude
+    ]
+    description = (
+        f"Format of the output, {default} by default, the others are "
+        "partitioned by provider, account and date"
+    )
+    if "sqlite" in choices:
+        description += ", except sqlite which upserts into the local fact store facts.sqlite"
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=choices,
+        default=default,
+        help=description,
+    )
+    parser.set_defaults(default_output_format=default)
+
+
 def run_fb(args):
     from APIConnection.facebook_connection import FBConnection
+    from APIConnection.report_cache import ReportCache
     from APIConnection.settings import FB_ACCESS_TOKEN
 
-    conn = FBConnection(access_token=FB_ACCESS_TOKEN)
+    conn = FBConnection(
+        access_token=FB_ACCESS_TOKEN,
+        max_concurrency=args.max_concurrency,
+        report_cache=ReportCache(args.cache_dir) if args.cache_dir else None,
+        shard_by=args.shard_by,
+        journal=run_journal(args),
+        **incremental_options(args),
+    )
     conn.save_insight_ads_accounts_to_excel(
-        args.start_date, args.end_date, path="./results"
+        args.start_date,
+        args.end_date,
+        path="./results",
+        incremental=args.incremental,
+        sink=output_sink(args, "./results"),
     )
 
 
@@ -54,18 +180,25 @@ def dv360(args):
         logger.info(
             f"Created report with queryID {queryId}. you should store it somewhere for later use"
         )
-    elif args.get:
-        dv360_object.get_full_report(dbm_service_object, args.get)
     else:
-        queryId = dv360_object.create_report(dbm_service_object, dv360_service_object)
-        dv360_object.get_full_report(dbm_service_object, queryId)
+        queryId = args.get or dv360_object.create_report(
+            dbm_service_object, dv360_service_object
+        )
+        sink = output_sink(args, args.output)
+        with sink or contextlib.nullcontext():
+            dv360_object.get_full_report(queryId, sink=sink)
 
 
 def run_googleads(args):
     from APIConnection.google_ads_api import GoogleAds
 
     google_ads = GoogleAds()
-    google_ads.save_ads_data_to_excel(args.start_date, args.end_date)
+    google_ads.save_ads_data_to_excel(
+        args.start_date,
+        args.end_date,
+        sink=output_sink(args, "./"),
+        journal=run_journal(args),
+    )
 
 
 def linkedin(args):
@@ -78,6 +211,8 @@ def linkedin(args):
         s_date=args.start,
         e_date=args.end,
         query_type=args.query_type,
+        output_format=args.output_format,
+        journal=run_journal(args),
     )
     linkedin_object.ln_main()
 
@@ -85,9 +220,19 @@ def linkedin(args):
 def twitter(args):
     from APIConnection.twitter import TwitterConnection
 
-    twitter = TwitterConnection()
+    twitter = TwitterConnection(
+        max_concurrency=args.max_concurrency,
+        thread_pool_size=args.threads,
+        journal=run_journal(args),
+        **incremental_options(args),
+    )
     twitter.save_insight_ads_accounts_to_excel(
-        args.start_date, args.end_date, args.output
+        args.start_date,
+        args.end_date,
+        metrics_group=None,
+        output_dir=args.output,
+        incremental=args.incremental,
+        sink=output_sink(args, args.output),
     )
 
 
@@ -104,11 +249,53 @@ def run_google_analyst(args):
     from APIConnection.google_analytics import GoogleAnalyst
 
     google_analyst = GoogleAnalyst()
-    google_analyst.save_data_to_csv(args.viewid, args.start_date, args.end_date)
+    google_analyst.save_data_to_csv(
+        args.view_id,
+        args.start_date,
+        args.end_date,
+        dir=args.output,
+        sink=output_sink(args, args.output),
+    )
 
 
 if __name__ == "__main__":
     main_parser = argparse.ArgumentParser()
+    main_parser.add_argument(
+        "--metrics_out",
+        type=str,
+        default=None,
+        help="File receiving the metrics of the run, JSON if it ends with .json "
+        "and Prometheus text otherwise",
+    )
+    main_parser.add_argument(
+        "--trace_out",
+        type=str,
+        default=None,
+        help="File receiving the Chrome trace of the run, to open in "
+        "chrome://tracing or ui.perfetto.dev",
+    )
+    transport_group = main_parser.add_mutually_exclusive_group()
+    transport_group.add_argument(
+        "--record",
+        type=str,
+        default=None,
+        help="Record the HTTP exchanges of the run to this file, secrets "
+        "scrubbed, gzipped if it ends with .gz",
+    )
+    transport_group.add_argument(
+        "--replay",
+        type=str,
+        default=None,
+        help="Answer the HTTP requests of the run from a recording instead of "
+        "the network, without rate limits",
+    )
+    main_parser.add_argument(
+        "--replay_latency",
+        type=float,
+        default=0.0,
+        help="Fraction of the recorded latency waited on replay, 0 replays at "
+        "full speed and 1 at the recorded speed",
+    )
     service_subparsers = main_parser.add_subparsers(help="Sub-command help")
     # Create the parser for the sub-command
     parser_dv360 = service_subparsers.add_parser(
@@ -153,6 +340,7 @@ if __name__ == "__main__":
         type=int,
         help="The age a report must be in hours at a maximum to be considered fresh.",
     )
+    add_output_format_argument(parser_dv360, default="csv")
     parser_dv360.set_defaults(func=dv360)
 
     # FB
@@ -165,6 +353,28 @@ if __name__ == "__main__":
     parser_fb.add_argument(
         "--end_date", "-e", type=str, help="Date range of ttd report data"
     )
+    parser_fb.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=None,
+        help="Maximum number of ad accounts fetched at the same time",
+    )
+    parser_fb.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Directory of the per-day report cache, no cache if not set",
+    )
+    parser_fb.add_argument(
+        "--shard_by",
+        type=lambda v: int(v) if v.isdigit() else v,
+        default=None,
+        help="Split the date range of every account into week, month or "
+        "N-day chunks fetched concurrently",
+    )
+    add_incremental_arguments(parser_fb)
+    add_journal_argument(parser_fb)
+    add_output_format_argument(parser_fb)
     parser_fb.set_defaults(func=run_fb)
 
     # TTD
@@ -204,6 +414,8 @@ if __name__ == "__main__":
     parser_ga.add_argument(
         "--end_date", "-e", type=str, help="Date range of ttd report data"
     )
+    add_journal_argument(parser_ga)
+    add_output_format_argument(parser_ga, default="csv")
     parser_ga.set_defaults(func=run_googleads)
 
     parser_gt = service_subparsers.add_parser(
@@ -261,6 +473,8 @@ if __name__ == "__main__":
         required=True,
         help="The query type, it can be week/weekly/month/monthly",
     )
+    add_journal_argument(parser_linkedin)
+    add_output_format_argument(parser_linkedin, default="tsv")
     parser_linkedin.set_defaults(func=linkedin)
 
     # Twitter
@@ -289,6 +503,21 @@ if __name__ == "__main__":
         required=True,
         help="The end date (YYYY-MM-DD) to get the report",
     )
+    parser_twitter.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=None,
+        help="Maximum number of ad accounts fetched at the same time",
+    )
+    parser_twitter.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Number of threads running the blocking Twitter API calls",
+    )
+    add_incremental_arguments(parser_twitter)
+    add_journal_argument(parser_twitter)
+    add_output_format_argument(parser_twitter)
     parser_twitter.set_defaults(func=twitter)
 
     # Google Analyst
@@ -324,10 +553,31 @@ if __name__ == "__main__":
         required=True,
         help="The end date (YYYY-MM-DD) to get the report",
     )
+    # The reports have no day nor ad metrics, they do not map to facts
+    add_output_format_argument(
+        parser_google_analyst, default="csv", exclude=("sqlite",)
+    )
     parser_google_analyst.set_defaults(func=run_google_analyst)
 
     args = main_parser.parse_args()
-    args.func(args)
+    # Connector modules log through the root logger, configured here rather
+    # than when they are imported
+    logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
+    if args.metrics_out:
+        dump_metrics_on_signal(args.metrics_out)
+    from APIConnection.tracing import tracer
+
+    try:
+        with http_transport(args):
+            with tracer.span("main", "run", command=args.func.__name__):
+                args.func(args)
+    finally:
+        if args.metrics_out:
+            from APIConnection.metrics import metrics
+
+            metrics.dump(args.metrics_out)
+        if args.trace_out:
+            tracer.dump(args.trace_out)
 
 # Example: python main.py dv360 -d PREVIOUS_DAY -c cred.json
 # Example: python3 main.py [fb|ttd|gcm] -s 2021-10-01 -e 2021-10-05
@@ -16,12 +16,13 @@ setup(
     description="APIConnection",
     package_data={
         # If any package contains *.txt files, include them:
-        "": ["*.csv", "*.yaml"]
+        "": ["*.csv", "*.yaml", "discovery/*.json"]
     },
     install_requires=[
         "requests==2.28.1",
         "facebook_business==13.0.0",
         "pandas==1.3.2",
+        "pyarrow>=5.0.0",
         "lxml>=4.6.3",
         "xlwt>=1.3.0",
         "aiohttp==3.8.1",
@@ -76,5 +77,5 @@ setup(
     author="Giang Bui",
     author_email="giangb.datapal@gmail.com",
     license=license,
-    packages=find_packages(exclude=("tests", "docs")),
+    packages=find_packages(exclude=("tests", "docs", "benchmarks", "benchmarks.*")),
 )
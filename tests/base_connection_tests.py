@@ -0,0 +1,322 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from APIConnection.base_connection import BaseConnection
+from APIConnection.journal import RunJournal
+from APIConnection.report_cache import ReportCache
+from APIConnection.sinks import ParquetSink
+from APIConnection.utils import get_days_in_range
+from APIConnection.watermark import WatermarkStore
+
+
+class FakeConnection(BaseConnection):
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+
+    def get_sub_accounts(self):
+        return [{"id": acc, "name": acc} for acc in self.delays]
+
+    def extract_connection_info(self):
+        return {}
+
+    async def get_report_df_for_account(
+        self, account, start_date, end_date, dimensions
+    ):
+        await asyncio.sleep(self.delays.get(account, 0))
+        return pd.DataFrame(
+            {"Account Id": [account], "Date Start": [start_date], "Clicks": [1]}
+        )
+
+
+async def _collect(aiter):
+    return [item async for item in aiter]
+
+
+def test_iter_sub_accounts_report_completion_order():
+    conn = FakeConnection({"slow": 0.2, "fast": 0.0})
+    res = asyncio.run(
+        _collect(
+            conn.iter_sub_accounts_report(
+                ["slow", "fast"], "2022-01-01", "2022-01-01", ["clicks"]
+            )
+        )
+    )
+    assert [acc for acc, _ in res] == ["fast", "slow"]
+    assert list(res[0][1].columns) == ["account_id", "date_start", "clicks"]
+
+
+def test_get_sub_accounts_report_df_keeps_account_order():
+    conn = FakeConnection({"slow": 0.2, "fast": 0.0})
+    df = asyncio.run(
+        conn.get_sub_accounts_report_df(
+            ["slow", "fast"], "2022-01-01", "2022-01-01", ["clicks"]
+        )
+    )
+    assert list(df["account_id"]) == ["slow", "fast"]
+
+
+def test_iter_sub_accounts_report_bounded_priority():
+    in_flight, started = [], []
+
+    class CountingConnection(FakeConnection):
+        async def get_report_df_for_account(self, account, *args):
+            started.append(account)
+            in_flight.append(len(started) - len(done))
+            await asyncio.sleep(0.01)
+            done.append(account)
+            return pd.DataFrame({"spend": [self.delays[account]]})
+
+    done = []
+    spend = {"a": 1, "b": 30, "c": 20, "d": 10}
+    conn = CountingConnection(spend)
+    conn.max_concurrency = 2
+    conn.priority_key = lambda acc: -spend[acc]
+    asyncio.run(_collect(conn.iter_sub_accounts_report(list(spend), "", "", [])))
+    assert max(in_flight) == 2
+    assert started == ["b", "c", "d", "a"]
+
+
+def test_blocking_connector_runs_on_thread_pool():
+    class BlockingConnection(FakeConnection):
+        def get_report_df_for_account(self, account, start_date, end_date, dims):
+            time.sleep(0.2)
+            return pd.DataFrame({"Account Id": [account]})
+
+    conn = BlockingConnection()
+    ts = time.time()
+    df = asyncio.run(conn.get_sub_accounts_report_df(["a", "b", "c", "d"], "", "", []))
+    assert time.time() - ts < 0.6
+    assert list(df["account_id"]) == ["a", "b", "c", "d"]
+    conn.shutdown_executor()
+
+
+def test_report_cache_fetches_missing_days_only(tmp_path):
+    calls = []
+
+    class DailyConnection(FakeConnection):
+        provider = "fake"
+        date_column = "date_start"
+
+        async def get_report_df_for_account(self, account, start_date, end_date, dims):
+            calls.append((start_date, end_date))
+            days = get_days_in_range(start_date, end_date)
+            return pd.DataFrame({"date_start": days, "clicks": [1] * len(days)})
+
+    conn = DailyConnection()
+    conn.report_cache = ReportCache(str(tmp_path))
+    first = asyncio.run(
+        conn.get_sub_accounts_report_df(["a"], "2022-01-01", "2022-01-10", ["clicks"])
+    )
+    second = asyncio.run(
+        conn.get_sub_accounts_report_df(["a"], "2022-01-05", "2022-01-15", ["clicks"])
+    )
+    assert calls == [("2022-01-01", "2022-01-10"), ("2022-01-11", "2022-01-15")]
+    assert len(first) == 10
+    assert list(second["date_start"]) == get_days_in_range("2022-01-05", "2022-01-15")
+
+
+def test_incremental_sync_fetches_after_watermark(tmp_path):
+    calls = []
+
+    class DailyConnection(FakeConnection):
+        provider = "fake"
+
+        async def get_report_df_for_account(self, account, start_date, end_date, dims):
+            calls.append((account, start_date, end_date))
+            return pd.DataFrame({"date_start": [start_date]})
+
+    conn = DailyConnection()
+    conn.watermarks = WatermarkStore(str(tmp_path / "watermarks.json"))
+    conn.lookback_days = 3
+    conn.watermarks.set("fake", "a", "2022-01-20")
+    conn.watermarks.set("fake", "b", "2022-01-31")
+    asyncio.run(
+        conn.get_sub_accounts_report_df(
+            ["a", "b", "c"], "2022-01-01", "2022-01-31", [], incremental=True
+        )
+    )
+    assert sorted(calls) == [
+        ("a", "2022-01-18", "2022-01-31"),
+        ("b", "2022-01-29", "2022-01-31"),
+        ("c", "2022-01-01", "2022-01-31"),
+    ]
+    reloaded = WatermarkStore(str(tmp_path / "watermarks.json"))
+    assert reloaded.get("fake", "a") == "2022-01-31"
+    assert reloaded.get("fake", "c") == "2022-01-31"
+
+
+def test_failing_account_does_not_stop_the_others():
+    class FailingConnection(FakeConnection):
+        async def get_report_df_for_account(self, account, *args):
+            if account == "bad":
+                raise RuntimeError("boom")
+            return await super().get_report_df_for_account(account, *args)
+
+    conn = FailingConnection({"bad": 0, "slow": 0.1, "fast": 0})
+    conn.max_concurrency = 2
+    res = dict(
+        asyncio.run(
+            _collect(
+                conn.iter_sub_accounts_report(
+                    ["bad", "slow", "fast"], "2022-01-01", "2022-01-01", []
+                )
+            )
+        )
+    )
+    assert res["bad"].empty
+    assert list(res["slow"]["account_id"]) == ["slow"]
+    assert list(res["fast"]["account_id"]) == ["fast"]
+
+
+def test_journal_resumes_interrupted_run(tmp_path):
+    calls = []
+
+    class FlakyConnection(FakeConnection):
+        provider = "fake"
+
+        async def get_report_df_for_account(self, account, start_date, end_date, dims):
+            calls.append(account)
+            if account == "b" and calls.count("b") == 1:
+                raise RuntimeError("interrupted")
+            return pd.DataFrame({"date_start": [start_date], "clicks": [1]})
+
+    def run():
+        conn = FlakyConnection()
+        conn.max_concurrency = 1
+        conn.journal = RunJournal(str(tmp_path / "journal.jsonl"))
+        with ParquetSink(str(tmp_path / "out")) as sink:
+            asyncio.run(
+                conn.save_sub_accounts_report(
+                    ["a", "b", "c"], "2022-01-01", "2022-01-31", [], sink
+                )
+            )
+
+    run()
+    assert calls == ["a", "b", "c"]
+    # The failure of b does not stop c, and the files of the saved accounts
+    # are complete
+    assert len(pd.read_parquet(tmp_path / "out" / "provider=fake" / "account=a")) == 1
+    assert len(pd.read_parquet(tmp_path / "out" / "provider=fake" / "account=c")) == 1
+    run()
+    # Only the failed account is fetched again
+    assert calls[3:] == ["b"]
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    assert journal.is_done("fake", "c", "2022-01-01", "2022-01-31")
+    assert journal.get("fake", "b", "2022-01-01", "2022-01-31")["output"].endswith(
+        "account=b"
+    )
+    assert not journal.is_done("fake", "a", "2022-02-01", "2022-02-28")
+
+
+def test_sharded_fetch_stitches_chunks_in_order():
+    calls = []
+
+    class DailyConnection(FakeConnection):
+        date_column = "date_start"
+
+        async def get_report_df_for_account(self, account, start_date, end_date, dims):
+            calls.append((start_date, end_date))
+            days = get_days_in_range(start_date, end_date)
+            await asyncio.sleep(0.01 * (12 - int(start_date[5:7])))
+            # Two identical rows per day, e.g. two ads with the same metrics
+            return pd.DataFrame({"date_start": days * 2, "clicks": 1})
+
+    conn = DailyConnection()
+    conn.shard_by = "month"
+    df = asyncio.run(
+        conn.get_sub_accounts_report_df(["a"], "2022-01-15", "2022-03-10", [])
+    )
+    assert sorted(calls) == [
+        ("2022-01-15", "2022-01-31"),
+        ("2022-02-01", "2022-02-28"),
+        ("2022-03-01", "2022-03-10"),
+    ]
+    assert sorted(df["date_start"]) == sorted(
+        get_days_in_range("2022-01-15", "2022-03-10") * 2
+    )
+
+
+def test_sharded_account_missing_a_chunk_is_not_done(tmp_path):
+    class GappyConnection(FakeConnection):
+        provider = "fake"
+        date_column = "date_start"
+
+        async def get_report_df_for_account(self, account, start_date, end_date, dims):
+            if start_date.startswith("2022-02"):
+                # A range the provider did not report
+                return pd.DataFrame()
+            return pd.DataFrame({"date_start": [start_date], "clicks": [1]})
+
+    conn = GappyConnection()
+    conn.shard_by = "month"
+    conn.watermarks = WatermarkStore(str(tmp_path / "watermarks.json"))
+    conn.journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    with ParquetSink(str(tmp_path / "out")) as sink:
+        asyncio.run(
+            conn.save_sub_accounts_report(
+                ["a"], "2022-01-01", "2022-03-31", [], sink, incremental=True
+            )
+        )
+    assert not (tmp_path / "out" / "provider=fake" / "account=a").exists()
+    assert conn.watermarks.get("fake", "a") is None
+    assert not conn.journal.is_done("fake", "a", "2022-01-01", "2022-03-31")
+
+
+def test_tradedesk_end_to_end_against_stand_in(monkeypatch):
+    from APIConnection.rate_limiter import rate_limiter
+    from APIConnection.settings import API_BASE_URLS
+    from benchmarks.legs import Options, run_tradedesk
+    from benchmarks.standins import Scale, StandInServer
+
+    scale = Scale(accounts=3, days=2, rows=5)
+    with StandInServer(scale) as server:
+        monkeypatch.setitem(API_BASE_URLS, "tradedesk", server.url)
+        with rate_limiter.unthrottled():
+            rows = run_tradedesk(scale, Options(max_concurrency=2))
+        counts = server.counts()
+
+    assert rows == 3 * 2 * 5
+    assert counts == {
+        "tradedesk/authentication": 1,
+        "tradedesk/download": 3,
+        "tradedesk/report_executions": 3,
+    }
+
+
+def test_record_then_replay_without_network(monkeypatch, tmp_path):
+    import gzip
+
+    import requests
+
+    from APIConnection.credentials import credentials
+    from APIConnection.exceptions import ReplayMissError
+    from APIConnection.rate_limiter import rate_limiter
+    from APIConnection.recorder import Recorder, Replayer
+    from APIConnection.settings import API_BASE_URLS
+    from benchmarks.legs import Options, run_tradedesk
+    from benchmarks.standins import Scale, StandInServer
+
+    scale = Scale(accounts=2, days=2, rows=3)
+    cassette = str(tmp_path / "ttd.jsonl.gz")
+    with StandInServer(scale) as server:
+        monkeypatch.setitem(API_BASE_URLS, "tradedesk", server.url)
+        with rate_limiter.unthrottled(), Recorder(cassette) as recorder:
+            recorded_rows = run_tradedesk(scale, Options())
+    assert recorder.count == 5
+
+    with gzip.open(cassette, "rt") as f:
+        recording = f.read()
+    assert "stand-in-token" not in recording
+    assert '"Password": "bench"' not in recording
+
+    # The server is stopped, every response comes from the recording,
+    # including the login whose token is otherwise cached
+    credentials.clear()
+    with Replayer(cassette) as replayer:
+        assert run_tradedesk(scale, Options()) == recorded_rows == 12
+        with pytest.raises(ReplayMissError):
+            requests.get(f"{server.url}/v3/authentication")
+    assert replayer.replayed == 5
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from APIConnection.credentials import CredentialManager, credential_name
+
+
+def test_credential_manager_single_flight_and_refresh():
+    manager = CredentialManager(key="", refresh_margin=0.5)
+    name = credential_name("tradedesk", "user")
+    calls = []
+
+    def fetch():
+        calls.append(time.time())
+        time.sleep(0.05)
+        return f"token-{len(calls)}", 0.6
+
+    tokens = []
+    threads = [
+        threading.Thread(target=lambda: tokens.append(manager.get(name, fetch)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One fetch for every concurrent caller
+    assert tokens == ["token-1"] * 8
+    assert len(calls) == 1
+
+    # Within the refresh margin the token is still served while a new one
+    # is fetched in the background
+    time.sleep(0.15)
+    assert manager.get(name, fetch) == "token-1"
+    deadline = time.time() + 2
+    while manager.peek(name) == "token-1" and time.time() < deadline:
+        time.sleep(0.01)
+    assert manager.get(name, fetch) == "token-2"
+
+    manager.invalidate(name)
+    assert manager.peek(name) is None
+    assert manager.get(name, lambda: ("token-3", None)) == "token-3"
+    assert "user" not in name
+
+
+def test_credential_managers_merge_the_shared_file(tmp_path):
+    fernet = pytest.importorskip("cryptography.fernet")
+    key = fernet.Fernet.generate_key().decode()
+    path = str(tmp_path / "credentials.bin")
+    first = CredentialManager(path, key)
+    second = CredentialManager(path, key)
+    # Both runs read the empty file before either saves
+    assert first.peek("a") is None and second.peek("b") is None
+    first.get("a", lambda: ("token-a", 3600))
+    second.get("b", lambda: ("token-b", 3600))
+    third = CredentialManager(path, key)
+    assert third.peek("a") == "token-a"
+    assert third.peek("b") == "token-b"
+    second.invalidate("a")
+    assert CredentialManager(path, key).peek("a") is None
@@ -0,0 +1,29 @@
+import json
+
+from APIConnection.discovery_cache import DiscoveryCache
+
+
+def test_discovery_cache_builds_without_round_trips(tmp_path):
+    from APIConnection.rate_limiter import rate_limiter
+    from benchmarks.standins import Scale, StandInServer
+
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    (static_dir / "bundled.v1.json").write_text('{"name": "bundled"}')
+    cache_dir = str(tmp_path / "cache")
+
+    with StandInServer(Scale(accounts=1, days=1, rows=1)) as server:
+        url = server.url + "/discovery/v1/apis/{api}/{apiVersion}/rest"
+        with rate_limiter.unthrottled():
+            cache = DiscoveryCache(cache_dir, ttl=3600, static_dir=str(static_dir))
+            document = cache.document("doubleclickbidmanager", "v1.1", url)
+            assert json.loads(document)["id"] == "doubleclickbidmanager:v1.1"
+            assert cache.document("bundled", "v1") == '{"name": "bundled"}'
+
+            # Another run reads the disk cache, a stale document is served
+            # and revalidated in the background
+            again = DiscoveryCache(cache_dir, ttl=0, static_dir=str(static_dir))
+            assert again.document("doubleclickbidmanager", "v1.1", url) == document
+            assert again.wait(5)
+        counts = server.counts()
+    assert counts == {"dv360/discovery_document": 2}
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from APIConnection.dtypes import compact_dtypes, concat_frames
+
+
+def test_compact_dtypes_and_concat_keep_categories():
+    df = pd.DataFrame(
+        {
+            "Campaign ID": ["11", "12"] * 50,
+            "metrics.clicks": [str(i) for i in range(100)],
+            "spend": ["1.5", "2.25"] * 50,
+            "impressions": [str(i) for i in range(99)] + ["N/A"],
+            "segments.date": ["2022-01-01", "2022-01-02"] * 50,
+            "actions": [[{"value": 1}]] * 100,
+        }
+    )
+    compact = compact_dtypes(df, "segments.date")
+    assert isinstance(compact["Campaign ID"].dtype, pd.CategoricalDtype)
+    assert compact["metrics.clicks"].dtype == "int8"
+    assert compact["spend"].dtype == "float32"
+    assert pd.api.types.is_datetime64_dtype(compact["segments.date"])
+    # Left as is when a value does not convert
+    assert compact["impressions"].dtype == df["impressions"].dtype
+    assert compact["actions"].dtype == object
+    zip_codes = compact_dtypes(pd.DataFrame({"zip": ["02134", "10001"] * 50}))
+    assert list(zip_codes["zip"].unique()) == ["02134", "10001"]
+    assert df["metrics.clicks"].dtype != "int8"
+    assert compact.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum()
+
+    other = compact_dtypes(df.assign(**{"Campaign ID": ["13"] * 100}))
+    stacked = concat_frames([compact, other], ignore_index=True)
+    assert isinstance(stacked["Campaign ID"].dtype, pd.CategoricalDtype)
+    assert set(stacked["Campaign ID"]) == {"11", "12", "13"}
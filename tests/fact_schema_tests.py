@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from APIConnection.dtypes import compact_dtypes
+from APIConnection.fact_schema import FACT_COLUMNS, concat_facts, to_facts
+
+
+def test_facts_of_providers_stack_into_one_table():
+    google_ads = pd.DataFrame(
+        {
+            "customer.id": ["1", "1"],
+            "campaign.name": ["a", "b"],
+            "segments.date": ["2022-01-01", "2022-01-02"],
+            "metrics.impressions": ["10", "20"],
+            "metrics.clicks": ["1", "2"],
+            "metrics.cost_micros": ["1500000", "2000000"],
+        }
+    )
+    twitter = pd.DataFrame(
+        {
+            "Date start": ["2022-01-01 00:00:00-05:00"],
+            "Campaign name": ["x"],
+            "Impressions": [5],
+            "clicks": [1],
+            "Spend": [3000000],
+        }
+    )
+    facts = concat_facts(
+        [
+            to_facts(compact_dtypes(google_ads, "segments.date"), "google_ads"),
+            to_facts(twitter, "twitter", account="18ce53"),
+        ]
+    )
+    assert list(facts.columns) == FACT_COLUMNS
+    assert list(facts["provider"]) == ["google_ads", "google_ads", "twitter"]
+    assert list(facts["account"]) == ["1", "1", "18ce53"]
+    assert list(facts["spend"]) == [1.5, 2.0, 3.0]
+    assert list(facts["impressions"]) == [10, 20, 5]
+    assert list(facts["date"].dt.strftime("%Y-%m-%d")) == [
+        "2022-01-01",
+        "2022-01-02",
+        "2022-01-01",
+    ]
+    assert facts["conversions"].isna().all()
+    assert isinstance(facts["campaign"].dtype, pd.CategoricalDtype)
+    with pytest.raises(ValueError):
+        to_facts(twitter, "myspace")
@@ -0,0 +1,46 @@
+import asyncio
+
+from APIConnection.exceptions import JobPollTimeout
+from APIConnection.job_poller import JobPoller, JobState, wait_for_job
+
+
+def test_job_poller_resolves_jobs_as_they_complete():
+    polls = {"fast": 0, "slow": 0, "stuck": 0}
+
+    def check(name, ready_after):
+        polls[name] += 1
+        done = polls[name] >= ready_after
+        return JobState(done, name, progress=polls[name] / ready_after)
+
+    async def main():
+        poller = JobPoller(min_interval=0.01, max_interval=0.05)
+        jobs = [
+            poller.submit(lambda: check("slow", 4)),
+            poller.submit(lambda: check("fast", 2)),
+            poller.submit(lambda: check("stuck", 1000), timeout=0.2),
+        ]
+        finished = []
+        for job in asyncio.as_completed(jobs):
+            try:
+                finished.append(await job)
+            except JobPollTimeout:
+                finished.append("timeout")
+        return finished
+
+    assert asyncio.run(main()) == ["fast", "slow", "timeout"]
+    assert polls["fast"] == 2 and polls["slow"] == 4
+
+
+def test_wait_for_job_from_a_running_event_loop():
+    polls = []
+
+    def check():
+        polls.append(1)
+        return JobState(len(polls) >= 2, "done")
+
+    async def main():
+        # e.g. a synchronous connector method called from a notebook
+        return wait_for_job(check, "sync job", min_interval=0.01)
+
+    assert asyncio.run(main()) == "done"
+    assert wait_for_job(check, "sync job") == "done"
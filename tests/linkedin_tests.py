@@ -0,0 +1,75 @@
+import json
+
+import pandas as pd
+
+from APIConnection.journal import RunJournal
+from APIConnection.linkedin import ln_main
+
+
+def test_linkedin_journals_only_complete_accounts(tmp_path, monkeypatch):
+    accounts = [{"account_id": name, "account_name": name} for name in "abc"]
+
+    def get_campaign(account, *args):
+        account_id = account["account_id"]
+        if account_id == "c":
+            raise ConnectionError("reset by peer")
+        df = pd.DataFrame(
+            {"account_id": [account_id], "start_date": ["2022-01-01"], "clicks": [1]}
+        )
+        # The adAnalytics call of a campaign of b failed
+        return df, account_id == "a"
+
+    monkeypatch.setattr(ln_main, "get_account_ids", lambda cred: accounts)
+    monkeypatch.setattr(
+        ln_main,
+        "get_LinkedIn_campaigns_list",
+        lambda token, account_id, types: pd.DataFrame({"campaign_id": [1]}),
+    )
+    monkeypatch.setattr(ln_main, "get_LinkedIn_campaign", get_campaign)
+    cred = tmp_path / "cred.json"
+    credentials = {
+        "id": "1",
+        "access_token": "t",
+        "client_id": "i",
+        "client_secret": "s",
+    }
+    cred.write_text(json.dumps({"client_name": credentials}))
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    output = tmp_path / "output"
+    ln_main.Linkedin(
+        "client_name",
+        str(cred),
+        str(output),
+        "2022-01-01",
+        "2022-01-31",
+        "month",
+        output_format="parquet",
+        journal=journal,
+    ).ln_main()
+
+    assert journal.is_done("linkedin", "a", "2022-01-01", "2022-01-31")
+    assert not journal.is_done("linkedin", "b", "2022-01-01", "2022-01-31")
+    assert not journal.is_done("linkedin", "c", "2022-01-01", "2022-01-31")
+    # The sink was closed, the rows fetched for b are readable
+    df = pd.read_parquet(output / "provider=linkedin")
+    assert sorted(df["account"].astype(str)) == ["a", "b"]
+
+
+def test_linkedin_skips_campaigns_failing_after_retries(monkeypatch):
+    from requests import HTTPError
+
+    from APIConnection.exceptions import CircuitOpenError
+    from APIConnection.linkedin import get_ln_campaign_data
+
+    def send_request(provider, endpoint, method, url, **kwargs):
+        if "sponsoredCampaign:1&" in url:
+            raise HTTPError("503 Server Error")
+        raise CircuitOpenError("linkedin")
+
+    monkeypatch.setattr(get_ln_campaign_data, "send_request", send_request)
+    account = {"account_id": "a", "account_name": "a"}
+    df, complete = get_ln_campaign_data.get_LinkedIn_campaign(
+        account, "t", [1, 2], "2022-01-01", "2022-01-31", "month"
+    )
+    assert df is not None and df.empty
+    assert not complete
@@ -0,0 +1,52 @@
+import logging
+import os
+from logging.handlers import QueueHandler
+
+import pytest
+
+from APIConnection.logger import RateLimitFilter, get_logger, stop_queue_listeners
+
+
+def test_rate_limit_filter_drops_debug_floods():
+    limit = RateLimitFilter(rate=0.001, burst=3)
+
+    def record(level, line):
+        return logging.LogRecord("test", level, __file__, line, "poll", (), None)
+
+    assert [limit.filter(record(logging.DEBUG, 1)) for _ in range(5)] == [
+        True,
+        True,
+        True,
+        False,
+        False,
+    ]
+    assert limit.filter(record(logging.DEBUG, 2))
+    assert limit.filter(record(logging.ERROR, 1))
+
+
+def test_queued_logger_writes_from_background_thread(tmp_path):
+    log_file = tmp_path / "queued.log"
+    log = get_logger("queued_test", file_name=str(log_file), log_level="info")
+    assert isinstance(log.handlers[0], QueueHandler)
+    log.info("first record")
+    stop_queue_listeners("queued_test")
+    assert "first record" in log_file.read_text()
+
+
+def log_in_worker(logger_name, message):
+    logging.getLogger(logger_name).warning(message)
+    return os.getpid()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork start method only")
+def test_queued_logger_writes_from_forked_workers(tmp_path):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    log_file = tmp_path / "forked.log"
+    get_logger("forked_test", file_name=str(log_file), log_level="info")
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork")) as pool:
+        pid = pool.submit(log_in_worker, "forked_test", "from the worker").result()
+    assert pid != os.getpid()
+    stop_queue_listeners("forked_test")
+    assert "from the worker" in log_file.read_text()
@@ -0,0 +1,30 @@
+import json
+
+from APIConnection.metrics import MetricsRegistry
+
+
+def test_metrics_prometheus_and_json_export(tmp_path):
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests")
+    latency = registry.histogram("request_seconds", "Latency", buckets=(0.1, 1))
+    requests.inc(provider="tradedesk", status=200)
+    requests.inc(2, provider="tradedesk", status=200)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, provider="tradedesk")
+
+    text = registry.to_prometheus()
+    assert 'requests_total{provider="tradedesk",status="200"} 3' in text
+    assert 'request_seconds_bucket{provider="tradedesk",le="0.1"} 1' in text
+    assert 'request_seconds_bucket{provider="tradedesk",le="1.0"} 2' in text
+    assert 'request_seconds_bucket{provider="tradedesk",le="+Inf"} 3' in text
+    assert 'request_seconds_count{provider="tradedesk"} 3' in text
+
+    registry.dump(str(tmp_path / "metrics.json"))
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["request_seconds"]["values"][0]["count"] == 3
+
+    registry.reset()
+    assert registry.counter("requests_total") is requests
+    assert requests.value(provider="tradedesk", status=200) == 0
+    latency.observe(0.5, provider="tradedesk")
+    assert 'request_seconds_count{provider="tradedesk"} 1' in registry.to_prometheus()
@@ -0,0 +1,30 @@
+from APIConnection.rate_limiter import RateLimiter, TokenBucket
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=50.0)
+    waits = [bucket.acquire() for _ in range(3)]
+    assert waits[0] == 0
+    assert 0.015 < waits[2] < 0.05
+
+
+def test_rate_limiter_adapts_to_headers():
+    limiter = RateLimiter(
+        {
+            "fake": {"rate": 2.0, "max_rate": 10.0},
+            "facebook": {"rate": 5.0, "max_rate": 50.0},
+        }
+    )
+    bucket = limiter.bucket("fake", "stats")
+    limiter.update("fake", "stats", 200, None)
+    assert bucket.rate == 2.5
+    limiter.update("fake", "stats", 429, {"Retry-After": "30"})
+    assert bucket.rate == 1.25
+    assert bucket._reserve(1) > 29
+    limiter.update(
+        "facebook",
+        "insights",
+        200,
+        {"X-Business-Use-Case-Usage": '{"1": [{"call_count": 95, "type": "ads"}]}'},
+    )
+    assert limiter.bucket("facebook", "insights").rate == 2.5
@@ -0,0 +1,20 @@
+import pandas as pd
+
+from APIConnection.report_cache import ReportCache
+
+
+def make_frame(n):
+    return pd.DataFrame({"clicks": range(n), "campaign": ["c"] * n})
+
+
+def test_report_cache_lru_eviction(tmp_path):
+    cache = ReportCache(str(tmp_path), max_bytes=10**9)
+    frame = make_frame(100)
+    cache.put("fake", "a", "2020-01-01", "h", frame)
+    cache.put("fake", "a", "2020-01-02", "h", frame)
+    cache.get("fake", "a", "2020-01-01", "h")
+    cache.max_bytes = 2.5 * cache._index["fake/a/h/2020-01-01"]["size"]
+    cache.put("fake", "a", "2020-01-03", "h", frame)
+    assert cache.get("fake", "a", "2020-01-02", "h") is None
+    assert len(cache.get("fake", "a", "2020-01-01", "h")) == 100
+    assert len(cache.get("fake", "a", "2020-01-03", "h")) == 100
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from APIConnection.exceptions import CircuitOpenError
+from APIConnection.retry import CircuitBreaker, Retry, RetryPolicy, transient_policy
+
+
+def test_retry_policies_and_circuit_breaker():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("reset by peer")
+        return "ok"
+
+    breaker = CircuitBreaker("fake", failure_threshold=3, reset_timeout=60)
+    retry = Retry(transient_policy(initial=0.001), breaker=breaker)
+    assert retry.call(flaky) == "ok"
+    assert breaker.state == "closed"
+
+    with pytest.raises(ValueError):
+        retry.call(int, "not a number")
+    assert len(calls) == 3
+
+    def unreachable():
+        raise OSError("network is unreachable")
+
+    retry_down = Retry(transient_policy(initial=0.001, max_attempts=3), breaker=breaker)
+    with pytest.raises(OSError):
+        retry_down.call(unreachable)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        retry.call(flaky)
+
+
+def test_retry_async_decorator():
+    attempts = []
+
+    @Retry(RetryPolicy(exceptions=(KeyError,), initial=0.001, max_attempts=None))
+    async def not_ready():
+        attempts.append(1)
+        if len(attempts) < 4:
+            raise KeyError("running")
+        return len(attempts)
+
+    assert asyncio.run(not_ready()) == 4
@@ -0,0 +1,24 @@
+from APIConnection.sessions import SessionPool
+
+
+def test_session_pool_reuses_connections():
+    from benchmarks.standins import Scale, StandInServer
+
+    pool = SessionPool(pools={"dv360": {"pool_maxsize": 2}})
+    with StandInServer(Scale(accounts=1, days=1, rows=1)) as server:
+        url = server.url + "/discovery/v1/apis/doubleclickbidmanager/v1.1/rest"
+        for _ in range(5):
+            response = pool.request("dv360", "GET", url)
+            assert response.status_code == 200
+        # One handshake for the five requests
+        assert server.connection_count() == 1
+        assert server.request_count("dv360") == 5
+        session = pool.session("dv360")
+        adapter = session.get_adapter(url)
+        pool.close()
+        # Closed sessions are replaced, on a new connection
+        assert pool.request("dv360", "GET", url).status_code == 200
+        assert server.connection_count() == 2
+        pool.close()
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == 2
+    assert session.headers["Accept-Encoding"] == "gzip, deflate"
@@ -0,0 +1,27 @@
+import pandas as pd
+import pyarrow.dataset as ds
+
+from APIConnection.sinks import ParquetSink
+
+
+def test_parquet_sink_partitions_and_appends(tmp_path):
+    df = pd.DataFrame({"date_start": ["2022-01-01", "2022-01-02"], "clicks": [1, 2]})
+    with ParquetSink(str(tmp_path)) as sink:
+        sink.write(df, "fake", "a", "date_start")
+        sink.write(df, "fake", "a", "date_start")
+    dataset = ds.dataset(str(tmp_path), format="parquet", partitioning="hive")
+    table = dataset.to_table(filter=ds.field("report_date") == "2022-01-02")
+    assert table.column("clicks").to_pylist() == [2, 2]
+    assert len(dataset.files) == 2
+
+
+def test_parquet_sink_replaces_partitions_of_earlier_runs(tmp_path):
+    first = pd.DataFrame({"date_start": ["2022-01-01", "2022-01-02"], "clicks": [1, 2]})
+    again = pd.DataFrame({"date_start": ["2022-01-02", "2022-01-03"], "clicks": [3, 4]})
+    with ParquetSink(str(tmp_path)) as sink:
+        sink.write(first, "fake", "a", "date_start")
+    # e.g. a resumed run fetching the account again
+    with ParquetSink(str(tmp_path)) as sink:
+        sink.write(again, "fake", "a", "date_start")
+    df = pd.read_parquet(tmp_path / "provider=fake" / "account=a")
+    assert sorted(df["clicks"]) == [1, 3, 4]
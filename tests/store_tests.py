@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from APIConnection.sinks import get_sink
+from APIConnection.store import FactStore
+
+
+def test_sqlite_sink_upserts_facts(tmp_path):
+    report = pd.DataFrame(
+        {
+            "customer.id": ["1", "1", "2"],
+            "campaign.name": ["a", "a", "b"],
+            "segments.date": ["2022-01-01", "2022-01-01", "2022-01-02"],
+            "metrics.impressions": ["10", "5", "20"],
+            "metrics.clicks": ["1", "1", "2"],
+            "metrics.cost_micros": ["1000000", "500000", "2000000"],
+        }
+    )
+    with get_sink("sqlite", str(tmp_path)) as sink:
+        sink.write(report, "google_ads", "1")
+        # Fetching the days again replaces their rows
+        sink.write(report, "google_ads", "1")
+    with FactStore(str(tmp_path / "facts.sqlite")) as store:
+        assert store.query("SELECT COUNT(*) AS n FROM facts")["n"][0] == 2
+        totals = store.totals(start_date="2022-01-01", end_date="2022-01-31")
+        assert list(totals["account"]) == ["1", "2"]
+        assert list(totals["spend"]) == [1.5, 2.0]
+        assert list(totals["impressions"]) == [15, 20]
+        with pytest.raises(ValueError):
+            store.totals(by=["spend; DROP TABLE facts"])
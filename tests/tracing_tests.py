@@ -0,0 +1,31 @@
+import asyncio
+import json
+
+from APIConnection.tracing import Tracer
+
+
+def test_tracer_nests_async_spans_and_exports_chrome_trace(tmp_path):
+    tracer = Tracer()
+
+    async def account(name):
+        with tracer.span("account", "account", account=name):
+            await asyncio.sleep(0.01)
+            with tracer.span("poll"):
+                await asyncio.sleep(0.01)
+
+    async def main():
+        with tracer.span("run", "run"):
+            await asyncio.gather(account("a"), account("b"))
+
+    asyncio.run(main())
+    spans = {(s.name, s.args.get("account")): s for s in tracer.spans}
+    assert spans[("account", "a")].parent is spans[("run", None)]
+    polls = [s for s in tracer.spans if s.name == "poll"]
+    assert {p.parent.args["account"] for p in polls} == {"a", "b"}
+
+    tracer.dump(str(tmp_path / "trace.json"))
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    complete = [e for e in events if e["ph"] == "X"]
+    assert len(complete) == 5
+    # One lane per task
+    assert len({e["tid"] for e in complete if e["name"] == "account"}) == 2
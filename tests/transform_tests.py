@@ -0,0 +1,21 @@
+import pandas as pd
+
+from APIConnection.transform import IPCFrame, TransformStage
+
+
+def make_frame(n):
+    return pd.DataFrame({"clicks": range(n), "campaign": ["c"] * n})
+
+
+def test_transform_stage_process_pool_round_trip():
+    stage = TransformStage(processes=1)
+    try:
+        df = stage.run(make_frame, 3)
+    finally:
+        stage.shutdown()
+    pd.testing.assert_frame_equal(df, make_frame(3))
+
+
+def test_ipc_frame_round_trip():
+    df = make_frame(5)
+    pd.testing.assert_frame_equal(IPCFrame.from_frame(df).to_frame(), df)
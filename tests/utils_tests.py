@@ -0,0 +1,111 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from APIConnection.utils import (
+    LazyModule,
+    Monitor,
+    lazy_import,
+    run_sync,
+    split_date_range,
+    timeit,
+)
+
+
+def test_split_date_range():
+    assert split_date_range("2022-11-02", "2022-11-15", "week") == [
+        ("2022-11-02", "2022-11-06"),
+        ("2022-11-07", "2022-11-13"),
+        ("2022-11-14", "2022-11-15"),
+    ]
+    assert split_date_range("2022-01-01", "2022-01-05", 2) == [
+        ("2022-01-01", "2022-01-02"),
+        ("2022-01-03", "2022-01-04"),
+        ("2022-01-05", "2022-01-05"),
+    ]
+
+
+def test_monitor_reports_blocking_call_sites():
+    monitor = Monitor(interval=0.02, threshold=0.05)
+
+    async def blocking_coroutine():
+        await asyncio.sleep(0.1)
+        time.sleep(0.5)
+        await asyncio.sleep(0.1)
+
+    async def main():
+        probe = asyncio.create_task(monitor.monitor_loop())
+        await blocking_coroutine()
+        probe.cancel()
+
+    asyncio.run(main())
+    top = monitor.top_blocking_sites()[0]
+    assert top["function"] == "blocking_coroutine"
+    assert top["source"] == "time.sleep(0.5)"
+    assert top["count"] == 1 and top["seconds"] > 0.2
+    assert monitor.percentiles()["max"] > 0.4
+    assert "blocking_coroutine" in monitor.report()
+
+
+def test_timeit_times_coroutines():
+    log_time = {}
+
+    @timeit
+    async def fetch(log_time=None, log_name=None):
+        await asyncio.sleep(1.1)
+
+    asyncio.run(fetch(log_time=log_time, log_name="FETCH"))
+    assert log_time == {"FETCH": 1}
+
+
+def test_cli_help_and_light_modules_do_not_load_pandas():
+    code = (
+        "import sys, runpy; sys.argv = ['main.py', '-h']\n"
+        "import APIConnection, APIConnection.sinks, APIConnection.retry\n"
+        "try:\n"
+        "    runpy.run_path('bin/main.py', run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "assert 'pandas' not in sys.modules and 'pyarrow' not in sys.modules\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=root, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_cli_google_analyst_does_not_offer_sqlite():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    args = ["-vid", "1", "-s", "2022-01-01", "-e", "2022-01-31"]
+    result = subprocess.run(
+        [sys.executable, "bin/main.py", "google_analyst", "--output_format", "sqlite"]
+        + args,
+        cwd=root,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 2
+    assert "invalid choice: 'sqlite'" in result.stderr
+
+
+def test_lazy_import_loads_module_on_first_use():
+    module = lazy_import("json.tool")
+    if "json.tool" not in sys.modules:
+        assert isinstance(module, LazyModule)
+    assert callable(module.main)
+    assert "json.tool" in sys.modules
+
+
+def test_run_sync_inside_and_outside_an_event_loop():
+    async def double(value):
+        await asyncio.sleep(0)
+        return 2 * value
+
+    async def main():
+        return run_sync(double(2))
+
+    assert run_sync(double(1)) == 2
+    assert asyncio.run(main()) == 4